@@ -0,0 +1,183 @@
+# benchmarks/bench_forecast.py
+"""
+Banco de pruebas de src/ts/forecast.py sobre paneles trimestrales sintéticos.
+
+Para cada tamaño (series × trimestres) y cada motor/configuración mide:
+  - series/s de fit_and_forecast (tiempo de pared)
+  - pico de memoria con tracemalloc (en una segunda pasada, para no falsear el tiempo)
+  - MAE/MAPE de backtest (los de metrics_df) y fuera de muestra sobre los últimos
+    `horizon` trimestres reservados, y cobertura del intervalo del 80 %
+y añade una línea JSON por ejecución a --out con el commit de git, así se pueden
+comparar resultados entre commits (--compare <commit>).
+
+Panel sintético: nivel + tendencia + estacionalidad anual + paseo aleatorio + ruido,
+con historias que empiezan tarde y huecos (trimestres sin dato). Todo en local, sin red.
+
+Uso:
+  python benchmarks/bench_forecast.py [--sizes 100x40,2000x80] [--engines panel,auto]
+                                      [--sm-max 200] [--no-mem] [--compare HEAD~1]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from src.ts.forecast import ForecastConfig, fit_and_forecast
+
+OUT = ROOT / "benchmarks" / "results" / "forecast.jsonl"
+# motor -> campos de ForecastConfig
+ENGINES = {
+    "panel": {"engine": "panel"},
+    "auto": {"engine": "auto", "models": ("naive", "snaive", "drift", "theta", "damped", "hw")},
+    "global": {"engine": "global"},
+    "statsmodels": {"engine": "statsmodels"},
+}
+
+
+def panel_sintetico(n: int, T: int, seed: int = 0, gaps: float = 0.03) -> pd.DataFrame:
+    """n series × T trimestres (hasta 2024Q4) con inicios tardíos y una fracción `gaps` de huecos."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(T)
+    Y = (rng.uniform(800, 3000, (n, 1)) + rng.uniform(-5, 15, (n, 1)) * t
+         + rng.uniform(0, 80, (n, 1)) * np.sin(t * np.pi / 2 + rng.uniform(0, 2 * np.pi, (n, 1)))
+         + np.cumsum(rng.normal(0, 15, (n, T)), axis=1) + rng.normal(0, 20, (n, T)))
+    start = np.where(rng.random(n) < 0.2, rng.integers(0, T // 2, n), 0)
+    keep = (t[None, :] >= start[:, None]) & (rng.random((n, T)) >= gaps)
+    keep[:, -1] = True  # todas llegan al último trimestre
+    i, j = np.nonzero(keep)
+    fechas = pd.period_range(end="2024Q4", periods=T, freq="Q")
+    return pd.DataFrame({
+        "muni_key": (10000 + i).astype("int32"),
+        "municipio_id": np.char.zfill((10000 + i).astype(str), 5),
+        "municipio": np.char.add("Municipio ", i.astype(str)),
+        "date": fechas[j],
+        "price_eur_m2": np.maximum(Y[i, j], 50.0),
+    })
+
+
+def _holdout(df: pd.DataFrame, h: int):
+    corte = df["date"] > df["date"].max() - h
+    return df[~corte], df[corte][["muni_key", "date", "price_eur_m2"]]
+
+
+def _fuera_de_muestra(fc: pd.DataFrame, test: pd.DataFrame) -> dict:
+    m = fc.merge(test, on=["muni_key", "date"], suffixes=("_pred", ""))
+    err = (m["price_eur_m2_pred"] - m["price_eur_m2"]).abs()
+    out = {"mae_test": float(err.mean()), "mape_test": float((err / m["price_eur_m2"]).mean() * 100)}
+    if "lo80" in m:
+        out["cov80_test"] = float(m["price_eur_m2"].between(m["lo80"], m["hi80"]).mean())
+    return out
+
+
+def _git_commit() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        sucio = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def _resolve(ref: str) -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", ref], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ref
+
+
+def run_case(df: pd.DataFrame, cfg: ForecastConfig, horizon: int, mem: bool) -> dict:
+    train, test = _holdout(df, horizon)
+    n = train["muni_key"].nunique()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        t0 = time.perf_counter()
+        metrics, fc = fit_and_forecast(train, cfg)
+        seg = time.perf_counter() - t0
+        pico = None
+        if mem:
+            tracemalloc.start()
+            fit_and_forecast(train, cfg)
+            pico = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    return {
+        "series": n, "rows": len(train), "seconds": seg, "series_per_s": n / seg,
+        "peak_mb": pico,
+        "mae_bt": float(metrics["MAE"].mean()), "mape_bt": float(metrics["MAPE"].mean()),
+        "errors": int(metrics["error"].notna().sum()),
+        **_fuera_de_muestra(fc, test),
+    }
+
+
+def _ultimos(path: Path, commit: str) -> dict:
+    """Último resultado de cada escenario (motor, series ajustadas, trimestres) para un commit."""
+    out = {}
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            r = json.loads(line)
+            if r["commit"].split("-")[0] == commit:
+                out[(r["engine"], r.get("series", r["n_series"]), r["quarters"])] = r
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark de fit_and_forecast sobre paneles sintéticos")
+    ap.add_argument("--sizes", default="100x40,2000x80", help="Lista series×trimestres, p.ej. 100x40,20000x120")
+    ap.add_argument("--engines", default="panel,auto,global,statsmodels", help=f"Subconjunto de {','.join(ENGINES)}")
+    ap.add_argument("--sm-max", type=int, default=200, help="Máximo de series para statsmodels (es lento)")
+    ap.add_argument("--horizon", type=int, default=8)
+    ap.add_argument("--folds", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-mem", action="store_true", help="No medir el pico de memoria (evita la 2ª pasada)")
+    ap.add_argument("--out", default=str(OUT), help="Fichero JSONL de resultados (se añade)")
+    ap.add_argument("--compare", help="Commit con el que comparar (último resultado de cada escenario en --out)")
+    args = ap.parse_args(argv)
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    commit = _git_commit()
+    previos = _ultimos(out, _resolve(args.compare)) if args.compare else {}
+    entorno = {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+               "machine": platform.machine(), "system": platform.system()}
+    print(f"📊 commit {commit} | {platform.python_version()} | numpy {np.__version__} | pandas {pd.__version__}")
+    print(f"   {'motor':12} {'series':>7} {'trim':>4} {'s':>8} {'series/s':>10} {'pico MB':>8} "
+          f"{'MAE bt':>8} {'MAE test':>9} {'MAPE test':>9}")
+
+    for size in args.sizes.split(","):
+        n, T = (int(v) for v in size.lower().split("x"))
+        df = panel_sintetico(n, T, seed=args.seed)
+        for engine in args.engines.split(","):
+            if engine not in ENGINES:
+                raise SystemExit(f"❌ Motor desconocido: {engine} ({', '.join(ENGINES)})")
+            sub = df[df["muni_key"] < 10000 + args.sm_max] if engine == "statsmodels" else df
+            cfg = ForecastConfig(horizon_quarters=args.horizon, backtest_folds=args.folds, **ENGINES[engine])
+            r = run_case(sub, cfg, args.horizon, mem=not args.no_mem)
+            rec = {"commit": commit, "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                   "engine": engine, "n_series": r["series"], "panel_series": n, "quarters": T,
+                   "horizon": args.horizon, "folds": args.folds, "seed": args.seed,
+                   "sm_max": args.sm_max if engine == "statsmodels" else None, **r, **entorno}
+            with out.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+            pico = f"{r['peak_mb']:8.1f}" if r["peak_mb"] is not None else f"{'-':>8}"
+            print(f"   {engine:12} {r['series']:7,} {T:4} {r['seconds']:8.2f} {r['series_per_s']:10,.0f} {pico} "
+                  f"{r['mae_bt']:8.2f} {r['mae_test']:9.2f} {r['mape_test']:8.2f}%")
+            prev = previos.get((engine, r["series"], T))
+            if prev:
+                print(f"   {'':12} vs {prev['commit']}: x{r['series_per_s'] / prev['series_per_s']:.2f} series/s, "
+                      f"MAE test {r['mae_test'] - prev['mae_test']:+.2f}")
+    print(f"✅ Resultados añadidos a {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/bench_padron_normalize.py
+"""
+Benchmark de normalizar_padron_df: versión vectorizada frente a la original
+(iterrows + un dict por celda + apply por fila), sobre una tabla sintética del
+tamaño de Barcelona (311 municipios × 3 sexos × 25 periodos) en los dos formatos
+que publica el INE (long: una columna Periodo; wide: un año por columna).
+
+Comprueba además que ambas versiones devuelven exactamente lo mismo.
+
+Uso:
+  python benchmarks/bench_padron_normalize.py [--municipios 311] [--periodos 25] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.etl.sources.fetch_ine_padron_provincias import normalizar_padron_df
+
+SEXOS = ["Total", "Hombres", "Mujeres"]
+
+
+def normalizar_padron_df_legacy(df: pd.DataFrame, codigo_prov: str) -> pd.DataFrame:
+    """Copia literal de la implementación anterior (referencia para tiempos y resultados)."""
+    df.columns = [str(c).strip() for c in df.columns]
+    col_municipio = None
+    col_periodo = None
+    col_valor = None
+    for col in df.columns:
+        col_lower = col.lower()
+        if 'municipio' in col_lower:
+            col_municipio = col
+        elif 'periodo' in col_lower or 'año' in col_lower or any(str(year) in col for year in range(2000, 2030)):
+            col_periodo = col
+        elif 'total' in col_lower or 'valor' in col_lower or 'población' in col_lower:
+            col_valor = col
+    if not col_municipio:
+        col_municipio = df.columns[0]
+    resultado = []
+    if col_periodo is None:
+        cols_periodo = [c for c in df.columns if c.isdigit() or any(str(year) in str(c) for year in range(2000, 2030))]
+        if cols_periodo:
+            for _, row in df.iterrows():
+                municipio = str(row[col_municipio]).strip()
+                for periodo_col in cols_periodo:
+                    valor = row[periodo_col]
+                    periodo = ''.join(c for c in str(periodo_col) if c.isdigit())
+                    if pd.notna(valor) and valor != '':
+                        resultado.append({'municipio': municipio, 'periodo': periodo, 'valor': valor})
+    else:
+        for _, row in df.iterrows():
+            municipio = str(row[col_municipio]).strip()
+            periodo = str(row[col_periodo]).strip() if col_periodo else ''
+            valor = row[col_valor] if col_valor else ''
+            if pd.notna(valor) and valor != '':
+                resultado.append({'municipio': municipio, 'periodo': periodo, 'valor': valor})
+    df_norm = pd.DataFrame(resultado)
+    if 'municipio_codigo' not in df_norm.columns:
+        def extraer_codigo(nombre):
+            partes = str(nombre).split()
+            if partes and partes[0].isdigit() and len(partes[0]) == 5:
+                return partes[0]
+            return None
+        df_norm['municipio_codigo'] = df_norm['municipio'].apply(extraer_codigo)
+    df_norm['municipio'] = df_norm['municipio'].str.replace(r'^\d{5}\s+', '', regex=True)
+    df_norm['valor'] = pd.to_numeric(df_norm['valor'], errors='coerce')
+    df_norm = df_norm.dropna(subset=['valor'])
+    return df_norm
+
+
+def tabla_sintetica(n_munis: int, n_periodos: int, formato: str, seed: int = 0) -> pd.DataFrame:
+    """Tabla con la forma del CSV provincial del INE (todo texto, como lo lee read_csv_auto)."""
+    rng = np.random.default_rng(seed)
+    munis = np.array([f"08{i:03d} Municipio {i}" for i in range(1, n_munis + 1)], dtype=object)
+    munis[::50] = "Total"  # filas de agregado sin código
+    periodos = [str(2024 - k) for k in range(n_periodos)]
+    valores = rng.integers(50, 1_700_000, size=(n_munis * len(SEXOS), n_periodos)).astype(str).astype(object)
+    valores[rng.random(valores.shape) < 0.02] = ""  # celdas vacías
+    filas_muni = np.repeat(munis, len(SEXOS))
+    filas_sexo = np.tile(SEXOS, n_munis)
+    if formato == "wide":
+        df = pd.DataFrame(valores, columns=periodos)
+        df.insert(0, "Sexo", filas_sexo)
+        df.insert(0, "Municipios", filas_muni)
+        return df
+    return pd.DataFrame({
+        "Municipios": np.repeat(filas_muni, n_periodos),
+        "Sexo": np.repeat(filas_sexo, n_periodos),
+        "Periodo": np.tile(periodos, len(filas_muni)),
+        "Total": valores.ravel(),
+    })
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """Mismos tipos en ambas versiones (object/str y None/NaN) para comparar valores."""
+    out = df.reset_index(drop=True).astype({c: object for c in ("municipio", "periodo", "municipio_codigo")})
+    out["municipio_codigo"] = out["municipio_codigo"].where(out["municipio_codigo"].notna(), None)
+    return out
+
+
+def _tiempo(fn, df, repeat):
+    mejor = float("inf")
+    for _ in range(repeat):
+        d = df.copy()
+        t0 = time.perf_counter()
+        out = fn(d, "08")
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark normalizar_padron_df (legacy vs vectorizado)")
+    ap.add_argument("--municipios", type=int, default=311)
+    ap.add_argument("--periodos", type=int, default=25)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    cols = ["municipio", "periodo", "valor", "municipio_codigo"]
+    resultados = {}
+    for formato in ("long", "wide"):
+        df = tabla_sintetica(args.municipios, args.periodos, formato)
+        t_new, new = _tiempo(normalizar_padron_df, df, args.repeat)
+        resultados[formato] = new
+        try:
+            t_old, old = _tiempo(normalizar_padron_df_legacy, df, args.repeat)
+        except Exception as e:
+            # la versión anterior tomaba la última columna-año como "periodo" y
+            # acababa sin valores: el formato wide nunca llegaba a su rama
+            print(f"{formato:>4}: {df.shape[0]:>7,} filas x {df.shape[1]} cols -> {len(new):,} registros | "
+                  f"legacy ❌ {type(e).__name__}: {e} | vectorizado {t_new * 1e3:7.1f} ms")
+            continue
+        pd.testing.assert_frame_equal(_comparable(old[cols]), _comparable(new[cols]))
+        print(f"{formato:>4}: {df.shape[0]:>7,} filas x {df.shape[1]} cols -> {len(new):,} registros | "
+              f"legacy {t_old * 1e3:9.1f} ms | vectorizado {t_new * 1e3:7.1f} ms | x{t_old / t_new:,.0f} ✅ iguales")
+
+    # Los dos formatos llevan los mismos datos: deben normalizar a lo mismo
+    orden = ["municipio", "periodo", "valor"]
+    a, b = (_comparable(resultados[f][cols]).sort_values(orden, ignore_index=True) for f in ("long", "wide"))
+    pd.testing.assert_frame_equal(a, b)
+    print("✅ long y wide normalizan a las mismas filas")
+
+if __name__ == "__main__":
+    main()
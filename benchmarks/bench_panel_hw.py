@@ -0,0 +1,97 @@
+# benchmarks/bench_panel_hw.py
+"""
+Benchmark del motor Holt-Winters vectorizado (src/ts/panel_hw.py, engine="panel")
+frente al camino statsmodels (un ExponentialSmoothing por serie) de fit_and_forecast.
+
+Panel sintético de municipios × trimestres (nivel con paseo aleatorio, tendencia,
+estacionalidad anual y ruido), con historias de distinta longitud. Los últimos
+`horizon` trimestres se reservan: se mide el error fuera de muestra de la previsión
+final, además del MAE/MAPE de backtest que devuelve fit_and_forecast.
+
+statsmodels es lento, así que por defecto sólo se ajusta sobre las primeras
+--series-sm series; la comparación de precisión se hace sobre esas mismas series.
+
+Uso:
+  python benchmarks/bench_panel_hw.py [--series 2000] [--series-sm 200] [--quarters 52]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.ts.forecast import ForecastConfig, fit_and_forecast
+
+
+def panel_sintetico(n: int, T: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t = np.arange(T)
+    Y = (rng.uniform(800, 3000, (n, 1)) + rng.uniform(-5, 15, (n, 1)) * t
+         + rng.uniform(0, 80, (n, 1)) * np.sin(t * np.pi / 2)
+         + np.cumsum(rng.normal(0, 15, (n, T)), axis=1) + rng.normal(0, 20, (n, T)))
+    # historias desiguales: ~20% de las series empiezan más tarde
+    start = np.where(rng.random(n) < 0.2, rng.integers(0, T // 2, n), 0)
+    fechas = pd.period_range(end="2024Q4", periods=T, freq="Q")
+    keep = t[None, :] >= start[:, None]
+    i, j = np.nonzero(keep)
+    return pd.DataFrame({
+        "muni_key": (10000 + i).astype("int32"),
+        "municipio_id": np.char.zfill((10000 + i).astype(str), 5),
+        "municipio": np.char.add("Municipio ", i.astype(str)),
+        "date": fechas[j],
+        "price_eur_m2": Y[i, j],
+    })
+
+
+def _holdout(df: pd.DataFrame, h: int):
+    ultimo = df.groupby("muni_key")["date"].transform("max")
+    corte = df["date"] > ultimo - h
+    return df[~corte], df[corte][["muni_key", "date", "price_eur_m2"]]
+
+
+def _medir(df, cfg):
+    t0 = time.perf_counter()
+    metrics, fc = fit_and_forecast(df, cfg)
+    return time.perf_counter() - t0, metrics, fc
+
+
+def _error_fuera(fc, test):
+    m = fc.merge(test, on=["muni_key", "date"], suffixes=("_pred", ""))
+    err = (m["price_eur_m2_pred"] - m["price_eur_m2"]).abs()
+    return err.mean(), (err / m["price_eur_m2"]).mean() * 100
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark Holt-Winters: panel NumPy vs statsmodels")
+    ap.add_argument("--series", type=int, default=2000)
+    ap.add_argument("--series-sm", type=int, default=200, help="Series que se ajustan con statsmodels")
+    ap.add_argument("--quarters", type=int, default=52)
+    ap.add_argument("--horizon", type=int, default=8)
+    ap.add_argument("--folds", type=int, default=4)
+    args = ap.parse_args(argv)
+
+    df = panel_sintetico(args.series, args.quarters)
+    train, test = _holdout(df, args.horizon)
+    print(f"📊 {args.series:,} series × {args.quarters} trimestres ({len(df):,} filas), horizonte {args.horizon}")
+
+    cfg = dict(horizon_quarters=args.horizon, backtest_folds=args.folds)
+    t_p, m_p, f_p = _medir(train, ForecastConfig(**cfg, engine="panel"))
+    print(f"   panel      : {t_p:8.2f} s | {args.series / t_p:10,.0f} series/s")
+
+    sub = train[train["muni_key"] < 10000 + args.series_sm]
+    t_s, m_s, f_s = _medir(sub, ForecastConfig(**cfg))
+    print(f"   statsmodels: {t_s:8.2f} s | {args.series_sm / t_s:10,.0f} series/s ({args.series_sm} series)")
+
+    # precisión sobre las mismas series
+    f_p = f_p[f_p["muni_key"] < 10000 + args.series_sm]
+    m_p = m_p[m_p["muni_key"] < 10000 + args.series_sm]
+    print(f"   {'':12} {'MAE bt':>9} {'MAPE bt':>8} {'MAE test':>9} {'MAPE test':>9}")
+    for nombre, m, f in (("panel", m_p, f_p), ("statsmodels", m_s, f_s)):
+        mae, mape = _error_fuera(f, test)
+        print(f"   {nombre:12} {m['MAE'].mean():9.2f} {m['MAPE'].mean():7.2f}% {mae:9.2f} {mape:8.2f}%")
+    print(f"✅ x{(args.series / t_p) / (args.series_sm / t_s):,.0f} series/s con el motor panel")
+
+if __name__ == "__main__":
+    main()
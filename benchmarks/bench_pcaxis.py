@@ -0,0 +1,109 @@
+# benchmarks/bench_pcaxis.py
+"""
+Benchmark del lector PC-Axis nativo (src/etl/sources/_pcaxis.py) frente a
+pyaxis.parse, sobre un .px sintético con la forma del ADRH del INE
+(Municipios × Indicadores × Periodo, con símbolos ".." y "." en DATA).
+
+Comprueba que ambos devuelven las mismas filas y valores.
+
+Uso:
+  python benchmarks/bench_pcaxis.py [--municipios 8131] [--indicadores 6] [--periodos 9] [--repeat 3]
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.etl.sources._pcaxis import px_to_frame
+
+INDICADORES = ["Renta neta media por persona", "Renta neta media por hogar",
+               "Media de la renta por unidad de consumo", "Mediana de la renta por unidad de consumo",
+               "Renta bruta media por persona", "Renta bruta media por hogar"]
+
+
+def _values(name: str, items: list) -> str:
+    # como el INE: varias entradas por línea, separadas por comas
+    lines = [",".join(f'"{x}"' for x in items[i:i + 10]) for i in range(0, len(items), 10)]
+    return f'VALUES("{name}")=' + ",\n".join(lines) + ";\n"
+
+
+def px_sintetico(path: Path, n_munis: int, n_ind: int, n_per: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    munis = [f"{i // 160 + 1:02d}{i % 1000:03d} Municipio {i}" for i in range(n_munis)]
+    inds = (INDICADORES * (n_ind // len(INDICADORES) + 1))[:n_ind]
+    inds = [f"{x} {k}" if k >= len(INDICADORES) else x for k, x in enumerate(inds)]
+    periodos = [str(2023 - k) for k in range(n_per)]
+    vals = rng.integers(5000, 40000, size=(n_munis * n_ind, n_per)).astype(str).astype(object)
+    r = rng.random(vals.shape)
+    vals[r < 0.05] = '".."'
+    vals[r > 0.99] = '"."'
+    with open(path, "w", encoding="ISO-8859-15", newline="\n") as f:
+        f.write('CHARSET="ANSI";\nAXIS-VERSION="2006";\nLANGUAGE="es";\nDECIMALS=0;\n')
+        f.write('MATRIX="31277";\nTITLE="Indicadores de renta media y mediana por municipios, ')
+        f.write('indicadores y periodo";\nCONTENTS="Atlas de distribución de renta de los hogares";\n')
+        f.write('UNITS="euros";\nSTUB="Municipios","Indicadores de renta media y mediana";\n')
+        f.write('HEADING="Periodo";\n')
+        f.write(_values("Municipios", munis))
+        f.write(_values("Indicadores de renta media y mediana", inds))
+        f.write(_values("Periodo", periodos))
+        f.write('NOTE="Fuente: INE";\nDATA=\n')
+        for row in vals:
+            f.write(" ".join(row) + " \n")
+        f.write(";\n")
+
+
+def _pyaxis_frame(path):
+    from pyaxis import pyaxis
+    df = pyaxis.parse(str(path), encoding="ISO-8859-15")["DATA"]
+    df["DATA"] = pd.to_numeric(df["DATA"], errors="coerce")
+    return df.dropna(subset=["DATA"]).rename(columns={"DATA": "valor"})
+
+
+def _medir(fn, path, repeat):
+    mejor = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(path)
+        mejor = min(mejor, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(path)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return mejor, pico, out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark PC-Axis: lector nativo vs pyaxis")
+    ap.add_argument("--municipios", type=int, default=8131)
+    ap.add_argument("--indicadores", type=int, default=6)
+    ap.add_argument("--periodos", type=int, default=9)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "adrh_sintetico.px"
+        px_sintetico(path, args.municipios, args.indicadores, args.periodos)
+        n = args.municipios * args.indicadores * args.periodos
+        print(f"📄 {path.name}: {path.stat().st_size / 1e6:.1f} MB, {n:,} celdas")
+
+        t_new, m_new, new = _medir(px_to_frame, path, args.repeat)
+        print(f"   nativo : {t_new * 1e3:8.1f} ms | pico {m_new / 1e6:7.1f} MB | {len(new):,} filas")
+        try:
+            t_old, m_old, old = _medir(_pyaxis_frame, path, args.repeat)
+        except ImportError:
+            print("   pyaxis : no instalado (pip install pyaxis) -> sólo se mide el lector nativo")
+            return
+        print(f"   pyaxis : {t_old * 1e3:8.1f} ms | pico {m_old / 1e6:7.1f} MB | {len(old):,} filas")
+
+        a = old.reset_index(drop=True).astype({c: str for c in old.columns if c != "valor"})
+        b = new.reset_index(drop=True).astype({c: str for c in new.columns if c != "valor"})
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+        print(f"✅ mismas filas y valores | x{t_old / t_new:,.1f} más rápido, x{m_old / m_new:,.1f} menos memoria")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 @echo off
 
 set PY=python
+rem Las etapas, dependencias y caché viven en src\etl\pipeline.py (también en Linux:
+rem python -m src.etl.pipeline [fetch^|normalize^|build^|refresh^|all])
 set LOGFILE=logs\make_flow.log
 if not exist logs mkdir logs
 
@@ -23,42 +25,24 @@ goto END
 
 :FETCH
 echo [1/3] DESCARGANDO FUENTES...
-echo --- Fetch IGN municipios ---
-%PY% src\etl\sources\fetch_municipios_ign.py       >> %LOGFILE% 2>&1
-echo --- Fetch MIVAU valor tasado ---
-%PY% src\etl\sources\fetch_valor_tasado_seed.py    >> %LOGFILE% 2>&1
-echo --- Fetch INE ADRH ---
-%PY% src\etl\sources\fetch_ine_adrh_all.py         >> %LOGFILE% 2>&1
-echo --- Fetch INE Padron ---
-%PY% src\etl\sources\fetch_ine_padron_all.py       >> %LOGFILE% 2>&1
-echo --- Fetch SEPE Paro ---
-%PY% src\etl\sources\fetch_sepe_paro_all.py        >> %LOGFILE% 2>&1
-echo --- Fetch BdE Euribor ---
-%PY% src\etl\sources\fetch_euribor_bde.py          >> %LOGFILE% 2>&1
+%PY% -m src.etl.pipeline fetch                     >> %LOGFILE% 2>&1
 echo ✅ Fetch completado.
 goto END
 
 :NORMALIZE
 echo [2/3] NORMALIZANDO...
-%PY% -m src.etl.normalize.norm_geo_municipios      >> %LOGFILE% 2>&1
-%PY% -m src.etl.normalize.norm_mivau_valor_tasado  >> %LOGFILE% 2>&1
-%PY% -m src.etl.normalize.norm_ine_adrh            >> %LOGFILE% 2>&1
-%PY% -m src.etl.normalize.norm_ine_padron          >> %LOGFILE% 2>&1
-%PY% -m src.etl.normalize.norm_sepe_paro           >> %LOGFILE% 2>&1
-%PY% -m src.etl.normalize.norm_euribor             >> %LOGFILE% 2>&1
+%PY% -m src.etl.pipeline normalize                 >> %LOGFILE% 2>&1
 echo ✅ Normalización completada.
 goto END
 
 :BUILD
 echo [3/3] CONSTRUYENDO TABLA MAESTRA...
-%PY% -m src.etl.build.build_master_muni            >> %LOGFILE% 2>&1
+%PY% -m src.etl.pipeline build                     >> %LOGFILE% 2>&1
 echo ✅ Build completado.
 goto END
 
 :ALL
-call "%~f0" fetch
-call "%~f0" normalize
-call "%~f0" build
+%PY% -m src.etl.pipeline all                       >> %LOGFILE% 2>&1
 echo 🎉 Flujo completo terminado.
 goto END
 
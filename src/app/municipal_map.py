@@ -1,11 +1,16 @@
 import streamlit as st, geopandas as gpd, pandas as pd
 import json
 import pydeck as pdk, json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.etl.build.build_master_muni import load_master
 
 st.set_page_config(layout="wide", page_title="Vivienda España — Mapa municipal")
 
 geo = gpd.read_file("data/curated/municipios_geo.geojson")
-df  = pd.read_parquet("data/curated/municipios_master.parquet")
+df  = load_master()  # particiones trimestrales de data/curated/municipios_master/
 
 # Selector temporal (trimestres disponibles)
 quarters = sorted(df["date"].astype(str).unique())
@@ -17,7 +22,8 @@ use_df = df[df["date"].astype(str).eq(q_sel)].copy()
 metric = "price_eur_m2"  # o "pred_price_eur_m2" cuando tengas predicción
 
 # Merge para el mapa
-m = geo.merge(use_df[["municipio_id", metric]], on="municipio_id", how="left")
+# join por la clave entera de la dimensión de municipios (muni_key)
+m = geo.merge(use_df[["muni_key", metric]], on="muni_key", how="left")
 
 # Choropleth básico con tooltip
 st.markdown(f"### {layer} — {q_sel}")
@@ -0,0 +1,110 @@
+# src/etl/build/build_dim_municipio.py
+"""
+Dimensión de municipios: una fila por municipio del IGN con su clave entera.
+
+Columnas de data/curated/dim_municipio.parquet:
+  muni_key        int32   clave compacta para todos los joins (= código INE como entero)
+  municipio_id    str     código INE de 5 dígitos
+  provincia_id    str     2 primeros dígitos del código INE
+  municipio       str     nombre oficial
+  municipio_norm  str     nombre normalizado (muni_names.norm_name)
+  aliases         list    variantes normalizadas del nombre ("ALICANTE/ALACANT",
+                          "ALICANTE", "ALACANT", "CORUNA, A" -> "A CORUNA", ...)
+
+La clave se deriva del código INE en lugar de numerar filas para que sea estable
+entre rebuilds (la maestra incremental y las cachés dependen de ello).
+
+Uso: python -m src.etl.build.build_dim_municipio
+"""
+import re
+import pandas as pd
+from pathlib import Path
+from src.etl.normalize.muni_names import norm_name, norm_names
+
+GEO_RAW = Path("data_raw/geo/municipios_ign.geojson")  # municipio_id, municipio, geometry
+DIM_OUT = Path("data/curated/dim_municipio.parquet")
+GEO_OUT = Path("data/curated/municipios_geo.geojson")
+
+# Artículos que el INE pospone: "Coruña, A", "Palmas de Gran Canaria, Las", "Hospitalet de Llobregat, L'"
+_ARTICLE = re.compile(r"^(.*),\s*(EL|LA|LOS|LAS|L'|O|OS|A|AS|ELS|ES|SA|SES|LES)$")
+
+def name_aliases(name: str) -> list:
+    """Variantes normalizadas de un nombre de municipio (incluye el propio nombre)."""
+    base = norm_name(name)
+    out = [base]
+    parts = [p.strip() for p in base.split("/") if p.strip()] if "/" in base else []
+    for p in [base] + parts:
+        if p not in out:
+            out.append(p)
+        m = _ARTICLE.match(p)
+        if m:
+            art = m.group(2)
+            moved = f"{art}{m.group(1)}" if art.endswith("'") else f"{art} {m.group(1)}"
+            if moved not in out:
+                out.append(moved)
+    return out
+
+def build_dim(g: pd.DataFrame) -> pd.DataFrame:
+    ids = g["municipio_id"].astype(str).str.extract(r"(\d{1,5})$")[0].str.zfill(5)
+    dim = pd.DataFrame({
+        "muni_key": pd.to_numeric(ids, errors="coerce"),
+        "municipio_id": ids,
+        "municipio": g["municipio"].astype(str).values,
+    }).dropna(subset=["muni_key"]).drop_duplicates("muni_key")
+    dim["muni_key"] = dim["muni_key"].astype("int32")
+    dim["provincia_id"] = dim["municipio_id"].str[:2]
+    dim["municipio_norm"] = norm_names(dim["municipio"])
+    dim["aliases"] = dim["municipio"].map(name_aliases)
+    return dim[["muni_key","municipio_id","provincia_id","municipio","municipio_norm","aliases"]].sort_values("muni_key").reset_index(drop=True)
+
+def load_dim() -> pd.DataFrame:
+    """Lee la dimensión; la construye si todavía no existe."""
+    if not DIM_OUT.exists():
+        main()
+    return pd.read_parquet(DIM_OUT)
+
+def alias_index(dim: pd.DataFrame) -> pd.Series:
+    """alias normalizado -> muni_key. Los alias ambiguos (mismo nombre en varias provincias) se descartan."""
+    al = dim[["muni_key","aliases"]].explode("aliases").drop_duplicates()
+    al = al[~al["aliases"].duplicated(keep=False)]
+    return pd.Series(al["muni_key"].values, index=al["aliases"].values)
+
+def attach_muni_key(df: pd.DataFrame, dim: pd.DataFrame, id_col: str = None, name_col: str = "municipio") -> pd.Series:
+    """
+    muni_key (Int32, nulo si no resuelve) para cada fila de df.
+
+    1) Por código INE: id_col si se indica; si no, el prefijo "99999 " del nombre.
+       El código ya es la clave, así que no hace falta ningún merge.
+    2) Las filas sin código válido se resuelven por nombre contra los alias (un map).
+    """
+    if id_col is not None:
+        code = df[id_col].astype(str).str.extract(r"^\s*(\d{1,5})\s*$")[0]
+    else:
+        code = df[name_col].astype(str).str.extract(r"^\s*(\d{5})\b")[0]
+    key = pd.to_numeric(code, errors="coerce")
+    key = key.where(key.isin(dim["muni_key"]))
+
+    miss = key.isna() & df[name_col].notna()
+    if miss.any():
+        names = df.loc[miss, name_col].astype(str).str.replace(r"^\s*\d{5}\s+", "", regex=True)
+        key.loc[miss] = norm_names(names).map(alias_index(dim))
+    return key.astype("Int32")
+
+def main():
+    import geopandas as gpd
+    if not GEO_RAW.exists():
+        raise FileNotFoundError(f"Falta {GEO_RAW}. Ejecuta primero el fetcher/normalizador de IGN.")
+    g = gpd.read_file(GEO_RAW)
+    dim = build_dim(g)
+    DIM_OUT.parent.mkdir(parents=True, exist_ok=True)
+    dim.to_parquet(DIM_OUT, index=False)
+
+    # Geometría con la clave entera para que la app haga el join por muni_key
+    geo = g.assign(municipio_id=g["municipio_id"].astype(str).str.zfill(5))
+    geo["muni_key"] = pd.to_numeric(geo["municipio_id"], errors="coerce").astype("Int32")
+    geo[["muni_key","municipio_id","municipio","geometry"]].to_file(GEO_OUT, driver="GeoJSON")
+    print(f"✅ {DIM_OUT} ({len(dim):,} municipios, {dim['provincia_id'].nunique()} provincias)")
+    print(f"✅ {GEO_OUT}")
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,210 @@
-import pandas as pd, geopandas as gpd
+# src/etl/build/build_master_muni.py
+"""
+Construye la tabla maestra municipio × trimestre.
+
+La maestra se guarda particionada por trimestre en data/curated/municipios_master/
+(un parquet por trimestre, p.ej. 2024Q1.parquet) junto a un _manifest.json con la
+huella de las entradas de cada partición.
+
+Uso:
+  python -m src.etl.build.build_master_muni                # rebuild completo
+  python -m src.etl.build.build_master_muni --incremental  # sólo particiones cambiadas
+
+En modo incremental la huella de cada trimestre incluye ya price_lag1/price_yoy
+(se calculan sobre el panel de precios completo, que es barato), así que un cambio
+en un trimestre marca también los trimestres siguientes cuyos lags dependen de él.
+
+Todos los joins van por muni_key (int32) de la dimensión de municipios
+(build_dim_municipio); los nombres sólo se usan para resolver la clave cuando una
+fuente no trae código INE.
+
+Las series mensuales (MONTHLY_FACTORS: paro SEPE, Euríbor mensual) se agregan a
+trimestre una sola vez por serie (mixed_freq) antes de construir las particiones.
+"""
+import argparse
+import hashlib
+import json
+import pandas as pd
 from pathlib import Path
 import numpy as np
-Path("data/curated").mkdir(exist_ok=True, parents=True)
-
-# 1) Geometría municipal
-g = gpd.read_file("data_raw/geo/municipios_ign.geojson")  # municipio_id, municipio, geometry
-g["municipio_norm"] = g["municipio"].str.upper().str.normalize("NFKD").str.encode("ascii","ignore").str.decode("ascii")
-
-# 2) Precio (valor tasado)
-vt = pd.read_csv("data_raw/mivau/valor_tasado_seed.csv", dtype=str)
-vt["date"] = vt["date"].str.replace("T","Q")
-vt["municipio_id"] = vt["municipio_id"].astype(str)
-vt["municipio_norm"] = vt["municipio"].str.upper().str.normalize("NFKD").str.encode("ascii","ignore").str.decode("ascii")
-vt["price_eur_m2"] = pd.to_numeric(vt["price_eur_m2"], errors="coerce")
-# trimestral -> Period[Q]
-vt["date"] = pd.PeriodIndex(vt["date"], freq="Q")
-
-# 3) ADRH (renta) y Padrón (población)
-adrh = pd.read_parquet("data/curated/adrh.parquet") if Path("data/curated/adrh.parquet").exists() else pd.DataFrame()
-pad  = pd.read_parquet("data/curated/padron.parquet") if Path("data/curated/padron.parquet").exists() else pd.DataFrame()
-
-for df in (adrh, pad):
-    if not df.empty:
-        df["municipio_norm"] = df["municipio"].str.upper().str.normalize("NFKD").str.encode("ascii","ignore").str.decode("ascii")
-
-# 4) Euríbor trimestral
-eur = pd.read_parquet("data/curated/euribor_q.parquet")
-eur["date"] = eur["date"].astype(str).str.replace("Q","Q")
-eur["date"] = pd.PeriodIndex(eur["date"], freq="Q")
-
-# 5) Master (join por municipio_id cuando haya; si falta, por municipio_norm)
-# Mantén sólo los municipios que aparezcan en geometría (para el mapa)
-base = vt.merge(g[["municipio_id","municipio_norm"]], on="municipio_id", how="left")
-# fallback por nombre si municipio_id faltara
-mask = base["municipio_id"].isna() & base["municipio_norm"].notna()
-if mask.any():
-    base.loc[mask, "municipio_id"] = base[mask].merge(
-        g[["municipio_id","municipio_norm"]],
-        on="municipio_norm",
-        how="left"
-    )["municipio_id_y"].values
+from src.etl.build.build_dim_municipio import load_dim, attach_muni_key
+from src.etl.build.mixed_freq import MonthlyFactor, quarterly_features, join_quarterly, hash_by_quarter
+from src.etl.normalize.norm_sepe_paro import OUT_DIR as PARO_DIR, load_paro
+
+CURATED = Path("data/curated")
+MASTER_DIR = CURATED / "municipios_master"
+MANIFEST = MASTER_DIR / "_manifest.json"
+
+# Súbelo si cambia la lógica del build: invalida todas las particiones
+BUILD_VERSION = 3
+
+# Series mensuales -> columnas trimestrales <name>_<reductor> ("last" = fin de trimestre)
+MONTHLY_FACTORS = (
+    MonthlyFactor("paro", "paro_total", reducers=("mean", "last")),
+    MonthlyFactor("euribor_12m", "euribor_12m", reducers=("last",), key=None),
+)
+
+def load_inputs() -> dict:
+    """Lee todas las fuentes normalizadas (sin merges) y les asigna muni_key."""
+    # 1) Dimensión de municipios (IGN + códigos INE)
+    dim = load_dim()
+
+    # 2) Precio (valor tasado)
+    vt = pd.read_csv("data_raw/mivau/valor_tasado_seed.csv", dtype=str)
+    vt["date"] = vt["date"].str.replace("T","Q")
+    vt["muni_key"] = attach_muni_key(vt, dim, id_col="municipio_id")
+    vt["price_eur_m2"] = pd.to_numeric(vt["price_eur_m2"], errors="coerce")
+    # trimestral -> Period[Q]
+    vt["date"] = pd.PeriodIndex(vt["date"], freq="Q")
+
+    # 3) ADRH (renta) y Padrón (población)
+    adrh = pd.read_parquet(CURATED / "adrh.parquet") if (CURATED / "adrh.parquet").exists() else pd.DataFrame()
+    pad  = pd.read_parquet(CURATED / "padron.parquet") if (CURATED / "padron.parquet").exists() else pd.DataFrame()
+
+    for df in (adrh, pad):
+        if not df.empty:
+            df["muni_key"] = attach_muni_key(df, dim)
+
+    # 4) Euríbor trimestral
+    eur = pd.read_parquet(CURATED / "euribor_q.parquet")
+    eur["date"] = pd.PeriodIndex(eur["date"].astype(str), freq="Q")
+
+    # 5) Mensuales: paro registrado (por municipio) y Euríbor mensual
+    monthly = {}
+    if PARO_DIR.exists():
+        paro = load_paro(columns=["municipio_id", "municipio", "year", "month", "paro_total"])
+        # la clave se resuelve una vez por municipio, no por fila-mes
+        ids = paro[["municipio_id", "municipio"]].drop_duplicates(ignore_index=True)
+        ids["muni_key"] = attach_muni_key(ids, dim, id_col="municipio_id")
+        paro = paro.merge(ids, on=["municipio_id", "municipio"], how="left")
+        monthly["paro"] = paro.dropna(subset=["muni_key"])
+    if (CURATED / "euribor_m.parquet").exists():
+        monthly["euribor_12m"] = pd.read_parquet(CURATED / "euribor_m.parquet")
+
+    return {"dim": dim, "vt": vt, "adrh": adrh, "pad": pad, "eur": eur, "monthly": monthly}
 
 # Join con renta (anual) y población (anual) vía año=Q.year
 def add_annual(df, name, col_value):
     if df.empty: return None
     df2 = df.copy()
-    df2["year"] = df2["year"].astype(str).str.extract(r"(\d{4})")
-    df2 = df2.rename(columns={col_value: name})
-    return df2[["municipio_norm","year", name]]
-
-m_renta = add_annual(adrh, "renta_pc", "renta_pc")
-m_pob   = add_annual(pad,  "poblacion", "poblacion")
-
-master = base.copy()
-master["year"] = master["date"].dt.year.astype(str)
-for extra in [m_renta, m_pob]:
-    if extra is not None:
-        master = master.merge(extra, on=["municipio_norm","year"], how="left")
-
-# Join euríbor por trimestre
-master = master.merge(eur, on="date", how="left")
-
-# Lags para modelo
-master = master.sort_values(["municipio_id", "date"])
-master["price_lag1"] = master.groupby("municipio_id")["price_eur_m2"].shift(1)
-master["price_yoy"]  = master.groupby("municipio_id")["price_eur_m2"].pct_change(4)
-
-# Salidas
-master.to_parquet("data/curated/municipios_master.parquet", index=False)
-g.to_file("data/curated/municipios_geo.geojson", driver="GeoJSON")
-print("✅ data/curated/municipios_master.parquet")
-print("✅ data/curated/municipios_geo.geojson")
+    df2["year"] = pd.to_numeric(df2["year"].astype(str).str.extract(r"(\d{4})")[0], errors="coerce").astype("Int16")
+    df2 = df2.rename(columns={col_value: name}).dropna(subset=["muni_key","year"])
+    # una fila por municipio-año para que el join no duplique trimestres
+    return df2.groupby(["muni_key","year"], as_index=False)[name].first()
+
+def prepare_prices(vt: pd.DataFrame, dim: pd.DataFrame) -> pd.DataFrame:
+    """Pone municipio_id/municipio oficiales desde la dimensión y calcula los lags sobre el panel completo."""
+    base = vt.dropna(subset=["muni_key"])
+    names = dim.set_index("muni_key")
+    base = pd.DataFrame({
+        "muni_key": base["muni_key"].astype("int32").values,
+        "municipio_id": names["municipio_id"].reindex(base["muni_key"].values).values,
+        "municipio": names["municipio"].reindex(base["muni_key"].values).values,
+        "date": base["date"].values,
+        "price_eur_m2": base["price_eur_m2"].values,
+    })
+
+    # Lags para modelo
+    base = base.sort_values(["muni_key", "date"], ignore_index=True)
+    base["price_lag1"] = base.groupby("muni_key")["price_eur_m2"].shift(1)
+    base["price_yoy"]  = base.groupby("muni_key")["price_eur_m2"].pct_change(4, fill_method=None)
+    return base
+
+def _hash_by(df: pd.DataFrame, key: str) -> pd.Series:
+    """Huella por grupo, independiente del orden de filas (suma de hashes de fila)."""
+    if df.empty:
+        return pd.Series(dtype="uint64")
+    h = pd.util.hash_pandas_object(df.drop(columns=[key]), index=False)
+    return h.groupby(df[key].values).sum()
+
+def partition_fingerprints(prices, m_renta, m_pob, eur, global_fp: str, monthly=()) -> pd.Series:
+    """Huella (hex) de las entradas de cada trimestre."""
+    q = prices["date"].astype(str)
+    p = prices.assign(date=q)[["date","muni_key","price_eur_m2","price_lag1","price_yoy"]]
+    fp = pd.DataFrame({"price": _hash_by(p, "date")})
+    fp["year"] = fp.index.str[:4].astype(int)
+
+    for name, extra in (("renta", m_renta), ("pob", m_pob)):
+        hy = _hash_by(extra, "year") if extra is not None else pd.Series(dtype="uint64")
+        fp[name] = fp["year"].map(hy).fillna(0).astype("uint64")
+    fp["eur"] = fp.index.map(_hash_by(eur.assign(date=eur["date"].astype(str)), "date")).fillna(0).astype("uint64")
+    for factor, qdf in monthly:
+        fp[factor.name] = fp.index.map(hash_by_quarter(qdf)).fillna(0).astype("uint64")
+
+    raw = fp.drop(columns="year").astype(str).agg(":".join, axis=1) + f":{global_fp}:{BUILD_VERSION}"
+    return raw.map(lambda s: hashlib.sha1(s.encode()).hexdigest())
+
+def build_quarters(prices, m_renta, m_pob, eur, quarters=None, monthly=()) -> pd.DataFrame:
+    """Hace los merges sólo para los trimestres pedidos (todos si quarters es None)."""
+    master = prices
+    if quarters is not None:
+        master = master[master["date"].astype(str).isin(quarters)]
+    master = master.copy()
+    master["year"] = master["date"].dt.year.astype("Int16")
+    for extra in [m_renta, m_pob]:
+        if extra is not None:
+            master = master.merge(extra, on=["muni_key","year"], how="left")
+
+    # Join euríbor por trimestre
+    master = master.merge(eur, on="date", how="left")
+
+    # Factores mensuales ya agregados a trimestre
+    master = join_quarterly(master, monthly)
+    return master.sort_values(["muni_key", "date"])
+
+def _read_manifest() -> dict:
+    if MANIFEST.exists():
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    return {"partitions": {}}
+
+def load_master(quarters=None) -> pd.DataFrame:
+    """Lee la maestra particionada (todos los trimestres o sólo los indicados)."""
+    files = sorted(MASTER_DIR.glob("*.parquet"))
+    if quarters is not None:
+        wanted = {str(q) for q in quarters}
+        files = [f for f in files if f.stem in wanted]
+    if not files:
+        raise FileNotFoundError(f"No hay particiones en {MASTER_DIR}. Ejecuta build_master_muni.")
+    return pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Construye la tabla maestra municipio × trimestre")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Reescribe sólo las particiones trimestrales cuyas entradas han cambiado")
+    args = ap.parse_args(argv)
+
+    MASTER_DIR.mkdir(parents=True, exist_ok=True)
+    inp = load_inputs()
+    dim, eur = inp["dim"], inp["eur"]
+
+    prices = prepare_prices(inp["vt"], dim)
+    m_renta = add_annual(inp["adrh"], "renta_pc", "renta_pc")
+    m_pob   = add_annual(inp["pad"],  "poblacion", "poblacion")
+    monthly = quarterly_features(inp["monthly"], MONTHLY_FACTORS)
+
+    # Lo que afecta a todas las particiones: claves/nombres de la dimensión
+    global_fp = format(int(pd.util.hash_pandas_object(dim[["muni_key","municipio_id","municipio"]], index=False).sum()), "x")
+    fps = partition_fingerprints(prices, m_renta, m_pob, eur, global_fp, monthly)
+
+    manifest = _read_manifest() if args.incremental else {"partitions": {}}
+    old = manifest.get("partitions", {})
+    dirty = [q for q, fp in fps.items() if old.get(q) != fp or not (MASTER_DIR / f"{q}.parquet").exists()]
+    # lo que hay en disco, no el manifiesto: sin --incremental old está vacío y un
+    # trimestre que desaparece de las fuentes dejaría su partición vieja
+    stale = [f.stem for f in MASTER_DIR.glob("*.parquet") if f.stem not in fps.index]
+
+    if dirty:
+        master = build_quarters(prices, m_renta, m_pob, eur, quarters=dirty if args.incremental else None,
+                                monthly=monthly)
+        for q, part in master.groupby(master["date"].astype(str), sort=True):
+            part.to_parquet(MASTER_DIR / f"{q}.parquet", index=False)
+    for q in stale:
+        (MASTER_DIR / f"{q}.parquet").unlink(missing_ok=True)
+
+    MANIFEST.write_text(json.dumps({"version": BUILD_VERSION, "global": global_fp,
+                                    "partitions": fps.to_dict()}, indent=1), encoding="utf-8")
+
+    print(f"✅ {MASTER_DIR} ({len(dirty)}/{len(fps)} trimestres reconstruidos, {len(stale)} eliminados)")
+
+if __name__ == "__main__":
+    main()
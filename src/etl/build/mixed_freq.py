@@ -0,0 +1,123 @@
+# src/etl/build/mixed_freq.py
+"""
+Series mensuales -> variables trimestrales para la maestra municipio × trimestre.
+
+Cada factor mensual (MonthlyFactor) se agrega a trimestre UNA vez, con un único
+group-by sobre códigos enteros de periodo, y el resultado se une a la maestra por
+(muni_key, trimestre) o sólo por trimestre si la serie es nacional (Euríbor).
+
+Códigos de periodo (enteros, sin Period ni cadenas en el camino caliente):
+  mes       = año * 12 + (mes - 1)
+  trimestre = año * 4 + (trimestre - 1) = mes // 3
+
+Reductores: "mean", "sum", "last" (fin de periodo: último mes con dato), "first",
+"min", "max". Una columna por reductor: <name>_<reductor> (paro_mean, paro_last...).
+
+Uso:
+  factores = (MonthlyFactor("paro", "paro_total", reducers=("mean", "last")),)
+  tablas = quarterly_features({"paro": paro_df}, factores)
+  master = join_quarterly(master, tablas)
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+REDUCERS = ("mean", "sum", "last", "first", "min", "max")
+
+
+@dataclass(frozen=True)
+class MonthlyFactor:
+    name: str                      # prefijo de las columnas de salida
+    value: str                     # columna con el valor mensual
+    reducers: tuple = ("mean",)
+    key: str | None = "muni_key"   # None: serie nacional, se une sólo por trimestre
+    min_months: int = 3            # trimestres con menos meses con dato -> NaN
+
+    @property
+    def columns(self) -> list:
+        return [f"{self.name}_{r}" for r in self.reducers]
+
+
+def month_codes(df: pd.DataFrame) -> np.ndarray:
+    """Código de mes (int32) desde year/month o, si no están, desde date_m ("AAAA-MM" o Period)."""
+    if "year" in df.columns and "month" in df.columns:
+        y = df["year"].to_numpy(dtype="int32")
+        m = df["month"].to_numpy(dtype="int32")
+        return y * 12 + m - 1
+    # sólo se parsean los meses distintos y se reparten por índice
+    uniq, inv = np.unique(df["date_m"].astype(str).to_numpy(), return_inverse=True)
+    per = pd.PeriodIndex(uniq, freq="M")
+    codes = (per.year * 12 + per.month - 1).to_numpy(dtype="int32")
+    return codes[inv]
+
+
+def quarter_codes(dates) -> np.ndarray:
+    """Código de trimestre (int32) de una serie/índice Period[Q]."""
+    per = pd.PeriodIndex(dates, freq="Q")
+    return (per.year * 4 + per.quarter - 1).to_numpy(dtype="int32")
+
+
+def quarter_labels(codes) -> np.ndarray:
+    """Código de trimestre -> "AAAAQn" (como str(Period[Q]))."""
+    uniq, inv = np.unique(np.asarray(codes, dtype="int32"), return_inverse=True)
+    return np.array([f"{q // 4}Q{q % 4 + 1}" for q in uniq], dtype=object)[inv]
+
+
+def to_quarterly(df: pd.DataFrame, factor: MonthlyFactor) -> pd.DataFrame:
+    """
+    Panel mensual -> [key,] q, <name>_<reductor>... (una fila por clave y trimestre).
+    Si hay varias filas del mismo mes y clave se queda la última.
+    """
+    bad = [r for r in factor.reducers if r not in REDUCERS]
+    if bad:
+        raise ValueError(f"Reductores no soportados en {factor.name}: {bad} (válidos: {REDUCERS})")
+    keys = [factor.key] if factor.key else []
+    out_cols = keys + ["q"] + factor.columns
+    if df is None or df.empty:
+        return pd.DataFrame({c: pd.Series(dtype="int32" if c in keys or c == "q" else "float64")
+                             for c in out_cols})
+
+    mc = month_codes(df)
+    d = pd.DataFrame({k: df[k].to_numpy() for k in keys})
+    d["mc"] = mc
+    d["v"] = pd.to_numeric(df[factor.value], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    d = d.dropna()
+    for k in keys:
+        d[k] = d[k].astype("int32")
+    # orden por mes dentro de cada clave: "last"/"first" son fin/inicio de periodo
+    d = d.sort_values(keys + ["mc"], kind="stable").drop_duplicates(keys + ["mc"], keep="last")
+    d["q"] = (d["mc"] // 3).astype("int32")
+
+    g = d.groupby(keys + ["q"], sort=False)["v"]
+    out = g.agg(list(factor.reducers) + ["count"])
+    incompleto = out.pop("count").to_numpy() < factor.min_months
+    out.loc[incompleto] = np.nan
+    out.columns = factor.columns
+    return out.reset_index()[out_cols]
+
+
+def quarterly_features(series: dict, factors) -> list:
+    """[(factor, tabla trimestral)] para cada factor; las fuentes que faltan dan tablas vacías."""
+    return [(f, to_quarterly(series.get(f.name), f)) for f in factors]
+
+
+def join_quarterly(master: pd.DataFrame, tables, date_col: str = "date") -> pd.DataFrame:
+    """Une las tablas trimestrales a la maestra (left) por [key,] código de trimestre."""
+    if not tables:
+        return master
+    master = master.assign(q=quarter_codes(master[date_col]))
+    for factor, qdf in tables:
+        on = [factor.key, "q"] if factor.key else ["q"]
+        master = master.merge(qdf, on=on, how="left")
+    return master.drop(columns="q")
+
+
+def hash_by_quarter(qdf: pd.DataFrame) -> pd.Series:
+    """Huella por trimestre ("AAAAQn" -> uint64) de una tabla trimestral, independiente del orden."""
+    if qdf.empty:
+        return pd.Series(dtype="uint64")
+    h = pd.util.hash_pandas_object(qdf.drop(columns="q"), index=False)
+    s = h.groupby(qdf["q"].to_numpy()).sum()
+    s.index = quarter_labels(s.index)
+    return s
@@ -0,0 +1,30 @@
+# src/etl/normalize/muni_names.py
+"""
+Normalización de nombres de municipio compartida por todas las etapas del ETL.
+
+"Álava/Araba", "ALAVA/ARABA " y "Alava/Araba" -> "ALAVA/ARABA"
+(mayúsculas, NFKD sin diacríticos, sólo ASCII, sin espacios en los extremos).
+
+Las columnas tienen decenas de miles de filas pero sólo ~8k nombres distintos:
+norm_names() factoriza la columna, normaliza cada nombre distinto una vez (con
+caché entre llamadas) y reindexa el resultado sobre las filas.
+"""
+from functools import lru_cache
+import unicodedata
+import numpy as np
+import pandas as pd
+
+@lru_cache(maxsize=None)
+def norm_name(s: str) -> str:
+    """Normaliza un único nombre (memoizado)."""
+    s = unicodedata.normalize("NFKD", s.upper())
+    return s.encode("ascii", "ignore").decode("ascii").strip()
+
+def norm_names(col: pd.Series) -> pd.Series:
+    """Versión por columna: una llamada a norm_name por valor distinto, no por fila."""
+    codes, uniques = pd.factorize(col, sort=False)
+    # la última posición recoge los nulos (code == -1)
+    table = np.empty(len(uniques) + 1, dtype=object)
+    table[:-1] = [norm_name(u if isinstance(u, str) else str(u)) for u in uniques]
+    table[-1] = np.nan
+    return pd.Series(table[codes], index=col.index, name=col.name)
@@ -5,6 +5,7 @@ import re
 
 RAW = Path("data_raw/macro/ti_1_7.csv")
 OUT = Path("data/curated/euribor_q.parquet")
+OUT_M = Path("data/curated/euribor_m.parquet")  # mensual, para los factores de frecuencia mixta
 OUT.parent.mkdir(parents=True, exist_ok=True)
 
 def _read_with_fallback(csv_path: Path) -> pd.DataFrame:
@@ -37,12 +38,16 @@ def main():
 
     # Mensual -> Trimestral (promedio)
     ser["date_m"] = ser["fecha"].dt.to_period("M")
-    eur_q = ser.groupby(ser["date_m"].dt.to_period("Q"), as_index=False)["euribor_12m"].mean()
+    eur_m = ser.groupby("date_m", as_index=False)["euribor_12m"].mean()
+    eur_m["date_m"] = eur_m["date_m"].astype(str)  # 'YYYY-MM'
+    eur_m.to_parquet(OUT_M, index=False)
+
+    eur_q = ser.groupby(ser["date_m"].dt.asfreq("Q"), as_index=False)["euribor_12m"].mean()
     eur_q = eur_q.rename(columns={"date_m":"date"})
     eur_q["date"] = eur_q["date"].astype(str)  # 'YYYY-Qn'
 
     eur_q.to_parquet(OUT, index=False)
-    print(f"✅ {OUT}")
+    print(f"✅ {OUT} | {OUT_M}")
 
 if __name__ == "__main__":
     main()
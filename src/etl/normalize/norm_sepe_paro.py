@@ -1,68 +1,186 @@
 # src/etl/normalize/norm_sepe_paro.py
+"""
+Paro registrado SEPE por municipio y mes -> dataset Parquet particionado.
+
+Salida: data/curated/sepe_paro_muni/year=AAAA/month=M/*.parquet
+  columnas: municipio_id, municipio, date_m ("AAAA-MM"), paro_total (+ year, month de la partición)
+
+Cada CSV se procesa en un proceso aparte: cabecera/separador/encoding con
+sniff_csv, lectura con el motor C sólo de las columnas necesarias y con los
+miles ya convertidos al leer (thousands="."), y la fecha como enteros año/mes.
+
+Para leer sólo algunos meses: load_paro(months=["2024-01", "2024-02"]).
+
+Uso:
+  python -m src.etl.normalize.norm_sepe_paro [--workers N]
+"""
+import argparse
+import os
+import shutil
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from src.etl.sources._fetch_utils import sniff_csv
+
 RAW_DIR = Path("data_raw/sepe")
-OUT = Path("data/curated/sepe_paro_muni.parquet")
-OUT.parent.mkdir(parents=True, exist_ok=True)
+OUT_DIR = Path("data/curated/sepe_paro_muni")
+
+MESES = {m: i for i, m in enumerate(["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+                                     "septiembre", "octubre", "noviembre", "diciembre"], 1)}
+
+def _norm(c: str) -> str:
+    c = unicodedata.normalize("NFKD", str(c)).encode("ascii", "ignore").decode()
+    return " ".join(c.lower().replace("_", " ").split())
 
 def pick(cols_map, cands, optional=False):
     for k in cands:
+        k = _norm(k)
         if k in cols_map: return cols_map[k]
     if optional: return None
     raise RuntimeError(f"Faltan columnas {cands}.")
 
-def main():
+def _columnas(header: list) -> dict:
+    """Columnas de interés del CSV (nombre original) según las variantes conocidas de cabecera."""
+    cols = {_norm(c): c for c in header}
+    return {
+        "muni_id": pick(cols, ["c_municipio", "cod_municipio", "codigo municipio", "cod municipio",
+                               "codigo_municipio", "id_municipio"]),
+        "muni":    pick(cols, ["municipio", "nombre_municipio", "nombremunicipio"]),
+        "year":    pick(cols, ["año", "anio", "year"], optional=True),
+        "month":   pick(cols, ["mes"], optional=True),
+        "period":  pick(cols, ["periodo"], optional=True),
+        "codmes":  pick(cols, ["codigo mes"], optional=True),
+        "total":   pick(cols, ["total parados", "parados totales", "parados_total", "total paro registrado",
+                               "total"], optional=True),
+        "hombres": pick(cols, ["hombres"], optional=True),
+        "mujeres": pick(cols, ["mujeres"], optional=True),
+    }
+
+def _a_entero(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(s):
+        return s.to_numpy(dtype="float64", na_value=np.nan)
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64")
+
+def _year_month(df: pd.DataFrame, c: dict):
+    """(año, mes) como float64 (NaN si no se puede) a partir de la columna de fecha disponible."""
+    n = len(df)
+    if c["period"] is not None:
+        ym = df[c["period"]].astype(str).str.extract(r"(\d{4})[-/](\d{1,2})")
+        if ym[0].notna().any():
+            return _a_entero(ym[0]), _a_entero(ym[1])
+    if c["codmes"] is not None:  # 202401
+        v = _a_entero(df[c["codmes"]])
+        return np.floor(v / 100), v % 100
+    if c["year"] is None:
+        return np.full(n, np.nan), np.full(n, np.nan)
+    y = _a_entero(df[c["year"]])
+    if c["month"] is None:
+        return y, np.full(n, 12.0)
+    m = _a_entero(df[c["month"]])
+    if np.isnan(m).all():  # "enero", "Enero 2024"...
+        nombres = df[c["month"]].astype(str).str.lower().str.extract(r"([a-z]+)")[0]
+        m = nombres.map(MESES).to_numpy(dtype="float64")
+    return y, m
+
+def leer_fichero(path) -> pd.DataFrame | None:
+    """Un CSV del SEPE -> municipio_id, municipio, year, month, paro_total (tipos compactos)."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        prefix = f.read(1 << 16)
+    d = sniff_csv(prefix)
+    with open(path, "rb") as f:
+        f.seek(d["offset"])
+        header = pd.read_csv(f, sep=d["sep"], encoding=d["encoding"], nrows=0).columns.tolist()
+    c = _columnas(header)
+    usecols = sorted({v for v in c.values() if v is not None}, key=header.index)
+    # códigos como texto (ceros a la izquierda); el resto lo convierte el motor C al leer
+    texto = {c["muni_id"], c["muni"], c["period"]} - {None}
+
+    with open(path, "rb") as f:
+        f.seek(d["offset"])
+        df = pd.read_csv(f, sep=d["sep"], encoding=d["encoding"], usecols=usecols, engine="c",
+                         dtype={k: str for k in texto}, thousands="." if d["sep"] != "." else None)
+
+    y, m = _year_month(df, c)
+    if c["total"] is not None:
+        total = _a_entero(df[c["total"]])
+    elif c["hombres"] is not None and c["mujeres"] is not None:
+        total = _a_entero(df[c["hombres"]]) + _a_entero(df[c["mujeres"]])
+    else:
+        total = np.full(len(df), np.nan)
+
+    ok = ~np.isnan(y) & ~np.isnan(m) & (m >= 1) & (m <= 12)
+    if not ok.any():
+        print(f"⚠️ {path.name}: sin fechas reconocibles, se ignora")
+        return None
+    return pd.DataFrame({
+        "municipio_id": df[c["muni_id"]].to_numpy()[ok],
+        "municipio": df[c["muni"]].to_numpy()[ok],
+        "year": y[ok].astype("int16"),
+        "month": m[ok].astype("int8"),
+        "paro_total": total[ok],
+    })
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Normaliza el paro registrado del SEPE (dataset por año/mes)")
+    ap.add_argument("--workers", type=int, default=None, help="Procesos (def. nº CPUs)")
+    args = ap.parse_args(argv)
+
     files = sorted(RAW_DIR.glob("paro_*.csv"))
     if not files:
         raise FileNotFoundError(f"No hay CSVs en {RAW_DIR}. Ejecuta primero el fetcher de SEPE.")
 
-    dfs = []
-    for f in files:
-        df = pd.read_csv(f, sep=';', dtype=str, encoding="latin-1", low_memory=False)
-        cols = {c.lower(): c for c in df.columns}
-
-        c_muni_id = pick(cols, ["c_municipio","cod_municipio","codigo municipio","cod municipio","codigo_municipio","id_municipio"])
-        c_muni    = pick(cols, ["municipio","nombre_municipio","nombremunicipio"])
-        c_year    = cols.get("año") or cols.get("anio")
-        c_month   = cols.get("mes")
-        c_period  = cols.get("periodo")
-        c_total   = pick(cols, ["total parados","parados totales","parados_total","total"], optional=True)
-
-        df = df.rename(columns={c_muni_id:"municipio_id", c_muni:"municipio"})
-
-        # Construye fecha mensual
-        if c_period and df[c_period].astype(str).str.contains(r"\d{4}[-/]\d{1,2}", na=False).any():
-            per = df[c_period].astype(str).str.replace("/", "-", regex=False)
-            y = per.str.extract(r"(\d{4})")[0]
-            m = per.str.extract(r"(?:\d{4}[-/])(\d{1,2})")[0]
-            date_m = y + "-" + m.str.zfill(2)
-        else:
-            y = df[c_year].astype(str) if c_year in df.columns else None
-            m = df[c_month].astype(str) if c_month in df.columns else None
-            date_m = (y + "-" + m.str.zfill(2)) if (y is not None and m is not None) else (y + "-12" if y is not None else None)
-
-        df["date_m"] = date_m
-
-        # Paro total
-        if c_total and c_total in df.columns:
-            df["paro_total"] = pd.to_numeric(df[c_total].str.replace(".","", regex=False), errors="coerce")
-        else:
-            h, mu = cols.get("hombres"), cols.get("mujeres")
-            if h in df.columns and mu in df.columns:
-                df["paro_total"] = pd.to_numeric(df[h].str.replace(".","", regex=False), errors="coerce") + \
-                                   pd.to_numeric(df[mu].str.replace(".","", regex=False), errors="coerce")
-            else:
-                df["paro_total"] = pd.NA
-
-        dfs.append(df[["municipio_id","municipio","date_m","paro_total"]])
-
-    allp = (pd.concat(dfs, ignore_index=True)
-              .drop_duplicates()
-              .assign(date_m=lambda d: pd.PeriodIndex(pd.to_datetime(d["date_m"], errors="coerce"), freq="M").astype(str)))
-
-    allp.to_parquet(OUT, index=False)
-    print(f"✅ {OUT}")
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(files)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            dfs = list(ex.map(leer_fichero, files))
+    else:
+        dfs = [leer_fichero(f) for f in files]
+    dfs = [d for d in dfs if d is not None and len(d)]
+    if not dfs:
+        raise RuntimeError(f"Ningún CSV de {RAW_DIR} tiene fechas reconocibles.")
+
+    allp = pd.concat(dfs, ignore_index=True).drop_duplicates(ignore_index=True)
+    # "AAAA-MM" sólo para los meses distintos y se reparte por índice
+    ym = allp["year"].to_numpy("int32") * 100 + allp["month"].to_numpy("int32")
+    uniq, inv = np.unique(ym, return_inverse=True)
+    allp["date_m"] = np.array([f"{v // 100:04d}-{v % 100:02d}" for v in uniq], dtype=object)[inv]
+    allp = allp.sort_values(["year", "month", "municipio_id"], ignore_index=True)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(allp[["municipio_id", "municipio", "date_m", "paro_total", "year", "month"]],
+                                 preserve_index=False)
+    # se escribe al lado y se sustituye: nunca queda un dataset a medias
+    tmp = OUT_DIR.with_name(OUT_DIR.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    pq.write_to_dataset(table, tmp, partition_cols=["year", "month"])
+    shutil.rmtree(OUT_DIR, ignore_errors=True)
+    tmp.rename(OUT_DIR)
+    print(f"✅ {OUT_DIR} ({len(allp):,} filas, {allp['date_m'].nunique()} meses, {len(files)} ficheros)")
+
+def load_paro(months=None, columns=None) -> pd.DataFrame:
+    """
+    Lee el dataset de paro (todo o sólo los meses indicados: "AAAA-MM", Period o
+    Timestamp). Sólo se abren las particiones year=/month= que hacen falta.
+    """
+    if not OUT_DIR.exists():
+        raise FileNotFoundError(f"Falta {OUT_DIR}. Ejecuta norm_sepe_paro.")
+    filters = None
+    if months is not None:
+        per = pd.PeriodIndex([pd.Period(m, freq="M") for m in months])
+        filters = [[("year", "=", int(p.year)), ("month", "=", int(p.month))] for p in per.unique()]
+        if not filters:
+            return pd.DataFrame(columns=columns or ["municipio_id", "municipio", "date_m", "paro_total"])
+    import pyarrow.parquet as pq
+    df = pq.read_table(OUT_DIR, columns=columns, filters=filters).to_pandas()
+    for c in ("year", "month"):
+        if c in df.columns:  # las columnas de partición vuelven como categoría
+            df[c] = df[c].astype("int16" if c == "year" else "int8")
+    return df
 
 if __name__ == "__main__":
     main()
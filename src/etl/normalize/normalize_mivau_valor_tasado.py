@@ -14,164 +14,337 @@ OUTPUT:
   - Un registro por municipio-periodo
   - Periodo formato: YYYY-QX (ej: 2020-Q1)
 
+El libro se abre una sola vez (xlrd, on_demand: cada pestaña se carga al pedirla).
+Cada pestaña normalizada se cachea en CACHE_DIR con una huella de su contenido
+(registros BIFF de la hoja + textos que referencia + periodo de su nombre), así que al añadirse un
+trimestre sólo se normaliza la pestaña nueva. Si el fichero entero no ha cambiado
+ni siquiera se recorre. Las pestañas pendientes se reparten entre procesos; cada
+proceso abre el libro una vez en su inicializador.
+
+Uso:
+  python -m src.etl.normalize.normalize_mivau_valor_tasado [--workers N] [--no-cache]
+
 AUTOR: Script generado automáticamente
 FECHA: 2025-11-25
 """
-import pandas as pd
-import numpy as np
-from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
 import re
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
 
 # Rutas
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 INPUT_FILE = PROJECT_ROOT / "data_raw" / "mivau" / "valor_tasado_municipios_25000.XLS"
 OUTPUT_FILE = PROJECT_ROOT / "data" / "curated" / "mivau_valor_tasado_normalizado.csv"
+CACHE_DIR = PROJECT_ROOT / "data" / "curated" / "_cache" / "mivau_valor_tasado"
+MANIFEST = CACHE_DIR / "_manifest.json"
 
-print("=" * 70)
-print("NORMALIZACIÓN MIVAU - VALOR TASADO DE VIVIENDA")
-print("=" * 70)
+# Súbelo si cambia la lógica de normalize_sheet: invalida la caché de pestañas
+CACHE_VERSION = 1
 
-# Verificar que existe el archivo de entrada
-if not INPUT_FILE.exists():
-    print(f"\n❌ ERROR: Archivo no encontrado: {INPUT_FILE}")
-    exit(1)
+COLUMNS = ['municipio', 'provincia', 'periodo', 'valor_tasado_total_medio', 'numero_tasaciones_total']
 
-print(f"\n📂 Archivo de entrada: {INPUT_FILE}")
-print(f"📂 Archivo de salida: {OUTPUT_FILE}")
+# Registros BIFF: inicio/fin de hoja y celda de texto con índice a la tabla de cadenas (SST)
+_BIFF_BOF, _BIFF_EOF, _BIFF_LABELSST = 0x0809, 0x000A, 0x00FD
+# Registros con desplazamientos dentro del stream (INDEX -> DBCELL, DBCELL -> filas):
+# cambian cuando crece algo anterior en el libro (BOUNDSHEET, SST) aunque la hoja no cambie
+_BIFF_OFFSETS = {0x020B, 0x00D7}
 
-# Leer todas las pestañas
-print("\n1️⃣ Leyendo pestañas del archivo Excel...")
-xl = pd.ExcelFile(INPUT_FILE)
-print(f"   Total pestañas encontradas: {len(xl.sheet_names)}")
 
-# Lista para acumular todos los datos normalizados
-all_data = []
-
-# Procesar cada pestaña
-print("\n2️⃣ Procesando pestañas...")
-for i, sheet_name in enumerate(xl.sheet_names, 1):
-    # Extraer periodo de nombre de pestaña: T1A2005 -> 2005-Q1
+def periodo_de_pestaña(sheet_name: str):
+    """T1A2005 -> 2005-Q1 (None si el nombre no tiene ese formato)."""
     # Nota: algunos nombres tienen espacios al final (ej: "T1A2007 ")
     match = re.match(r'T(\d)A(\d{4})', sheet_name.strip())
     if not match:
-        print(f"   ⚠️  Saltando pestaña con formato desconocido: {sheet_name}")
-        continue
-    
-    trimestre = match.group(1)
-    año = match.group(2)
-    periodo = f"{año}-Q{trimestre}"
-    
-    # Leer pestaña sin headers (los extraeremos manualmente)
+        return None
+    return f"{match.group(2)}-Q{match.group(1)}"
+
+
+def sheet_fingerprint(book, idx: int, periodo: str = "") -> str:
+    """
+    Huella del contenido de la pestaña `idx` sin cargarla: bytes de sus registros
+    BIFF (BOF..EOF), con las celdas de texto resueltas contra la SST (la tabla de
+    cadenas es común al libro y sus índices cambian al reescribirlo) y sin los
+    registros de desplazamientos (_BIFF_OFFSETS), que se mueven al añadir pestañas.
+    Incluye el `periodo` que se le asigna: sale del nombre (registro BOUNDSHEET, fuera
+    de la hoja) y va dentro del parquet cacheado, así que renombrar una pestaña o
+    tener dos con el mismo contenido no reutiliza una entrada con otro periodo.
+    Usa campos internos de xlrd (mem, _sh_abs_posn, _sharedstrings); si faltan o no
+    tienen la forma esperada (otra versión de xlrd, no es .xls), se carga la hoja y
+    se usan sus valores.
+    """
+    base = f"{CACHE_VERSION}|{periodo}".encode()
     try:
-        df = pd.read_excel(INPUT_FILE, sheet_name=sheet_name, header=None)
-    except Exception as e:
-        print(f"   ❌ Error leyendo {sheet_name}: {e}")
-        continue
-    
-    # Buscar la fila con "Provincia" y "Municipio" (normalmente fila 14 o 16)
-    header_row_idx = None
-    for idx, row in df.iterrows():
-        if pd.notna(row[1]) and pd.notna(row[2]):
-            row_str = str(row[1]) + str(row[2])
-            if 'Provincia' in row_str and 'Municipi' in row_str:
-                header_row_idx = idx
-                break
-    
+        return _stream_fingerprint(book, idx, hashlib.sha1(base))
+    except (AttributeError, TypeError, IndexError, KeyError, ValueError, struct.error):
+        h = hashlib.sha1(base + b"|valores")
+        sh = book.sheet_by_index(idx)
+        for r in range(sh.nrows):
+            h.update(repr(sh.row_values(r)).encode())
+        return h.hexdigest()
+
+
+def _stream_fingerprint(book, idx: int, h) -> str:
+    mem, posn, sst = book.mem, book._sh_abs_posn, book._sharedstrings
+    if mem is None or not isinstance(sst, list):
+        raise TypeError("libro sin stream BIFF accesible")
+    pos, end = posn[idx], len(mem)
+    if struct.unpack_from("<H", mem, pos)[0] != _BIFF_BOF:
+        raise ValueError(f"la pestaña {idx} no empieza en un registro BOF")
+    while pos + 4 <= end:
+        rtype, rlen = struct.unpack_from("<HH", mem, pos)
+        if rtype in _BIFF_OFFSETS:
+            pass
+        elif rtype == _BIFF_LABELSST and rlen >= 10:
+            # el índice a la SST se sustituye por el texto: reordenar la SST no invalida la hoja
+            (k,) = struct.unpack_from("<I", mem, pos + 10)
+            h.update(bytes(mem[pos:pos + 10]))
+            h.update(sst[k].encode("utf-8", "surrogatepass") if k < len(sst) else b"?")
+            h.update(bytes(mem[pos + 14:pos + 4 + rlen]))
+        else:
+            h.update(bytes(mem[pos:pos + 4 + rlen]))
+        pos += 4 + rlen
+        if rtype == _BIFF_EOF:
+            break
+    return h.hexdigest()
+
+
+def sheet_to_frame(sh) -> pd.DataFrame:
+    """Hoja xlrd -> DataFrame como pd.read_excel(header=None): vacías a NaN, sin filas en blanco."""
+    import xlrd
+    ncols = sh.ncols
+    rows = []
+    for r in range(sh.nrows):
+        types, values = sh.row_types(r), sh.row_values(r)
+        if all(t in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK) for t in types):
+            continue
+        row = [np.nan] * ncols
+        for c, (t, v) in enumerate(zip(types, values)):
+            if t in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                continue
+            if t == xlrd.XL_CELL_NUMBER and float(v).is_integer():
+                v = int(v)
+            elif t == xlrd.XL_CELL_BOOLEAN:
+                v = bool(v)
+            elif t == xlrd.XL_CELL_ERROR:
+                v = np.nan
+            row[c] = v
+        rows.append(row)
+    return pd.DataFrame(rows, columns=range(ncols)) if rows else pd.DataFrame(columns=range(ncols))
+
+
+def find_header_row(df: pd.DataFrame):
+    """Primera fila con "Provincia" y "Municipi" en las columnas 1-2 (normalmente fila 14 o 16)."""
+    if df.shape[1] < 3:
+        return None
+    both = df[1].notna() & df[2].notna()
+    txt = df[1].astype(str) + df[2].astype(str)
+    hit = (both & txt.str.contains('Provincia', regex=False) & txt.str.contains('Municipi', regex=False)).to_numpy()
+    return int(np.argmax(hit)) if hit.any() else None
+
+
+def normalize_sheet(df: pd.DataFrame, sheet_name: str, periodo: str):
+    """DataFrame crudo de una pestaña -> filas normalizadas (None si no se reconoce el formato)."""
+    header_row_idx = find_header_row(df)
     if header_row_idx is None:
         print(f"   ⚠️  No se encontró header en {sheet_name}, saltando...")
-        continue
-    
+        return None
+
     # Verificar si es formato antiguo (6 columnas) o nuevo (10 columnas)
     num_cols = len(df.columns)
-    
     if num_cols == 6:
-        # Formato antiguo (2005-2009): columnas simplificadas
-        # 1=Provincia, 2=Municipio, 3=Valor Total, 5=Tasaciones Total
+        # Formato antiguo (2005-2009): 1=Provincia, 2=Municipio, 3=Valor Total, 5=Tasaciones Total
         data_start_idx = header_row_idx + 2  # Solo 1 fila de subheader
-        df_data = df.iloc[data_start_idx:].copy()
-        
-        if len(df_data.columns) < 6:
-            print(f"   ⚠️  {sheet_name.strip()} tiene columnas insuficientes, saltando...")
-            continue
-        
-        df_data = df_data[[1, 2, 3, 5]].copy()
-        df_data.columns = ['provincia', 'municipio', 'valor_tasado_total_medio', 'numero_tasaciones_total']
-        
+        cols = [1, 2, 3, 5]
     elif num_cols == 10:
-        # Formato nuevo (2010+): columnas detalladas
-        # 1=Provincia, 2=Municipio, 5=Valor Total, 9=Tasaciones Total
+        # Formato nuevo (2010+): 1=Provincia, 2=Municipio, 5=Valor Total, 9=Tasaciones Total
         data_start_idx = header_row_idx + 3  # 2 filas de subheaders
-        df_data = df.iloc[data_start_idx:].copy()
-        
-        df_data = df_data[[1, 2, 5, 9]].copy()
-        df_data.columns = ['provincia', 'municipio', 'valor_tasado_total_medio', 'numero_tasaciones_total']
+        cols = [1, 2, 5, 9]
     else:
         print(f"   ⚠️  {sheet_name.strip()} tiene formato desconocido ({num_cols} columnas), saltando...")
-        continue
-    
+        return None
+
+    df_data = df.iloc[data_start_idx:, cols].copy()
+    df_data.columns = ['provincia', 'municipio', 'valor_tasado_total_medio', 'numero_tasaciones_total']
+
     # Limpiar: eliminar filas completamente vacías
     df_data = df_data.dropna(how='all')
-    
     # Rellenar provincia hacia abajo (forward fill) - solo aparece en primera fila de cada provincia
     df_data['provincia'] = df_data['provincia'].ffill()
-    
     # Eliminar filas sin municipio
     df_data = df_data.dropna(subset=['municipio'])
-    
-    # Agregar columna de periodo
     df_data['periodo'] = periodo
-    
+
     # Convertir valores numéricos (pueden estar como string o tener "n.r" = no registrado)
-    df_data['valor_tasado_total_medio'] = pd.to_numeric(
-        df_data['valor_tasado_total_medio'], 
-        errors='coerce'
-    )
-    df_data['numero_tasaciones_total'] = pd.to_numeric(
-        df_data['numero_tasaciones_total'], 
-        errors='coerce'
-    )
-    
-    # Reordenar columnas
-    df_data = df_data[['municipio', 'provincia', 'periodo', 
-                       'valor_tasado_total_medio', 'numero_tasaciones_total']]
-    
-    # Agregar a lista
-    all_data.append(df_data)
-    
-    if i % 10 == 0:
-        print(f"   Procesadas {i}/{len(xl.sheet_names)} pestañas...")
-
-print(f"   ✅ {len(all_data)} pestañas procesadas correctamente")
-
-# Concatenar todos los datos
-print("\n3️⃣ Consolidando datos...")
-df_final = pd.concat(all_data, ignore_index=True)
-
-print(f"   Total registros: {len(df_final):,}")
-print(f"   Municipios únicos: {df_final['municipio'].nunique()}")
-print(f"   Provincias únicas: {df_final['provincia'].nunique()}")
-print(f"   Periodos únicos: {df_final['periodo'].nunique()}")
-
-# Estadísticas
-print("\n4️⃣ Estadísticas de los datos:")
-print(f"   Rango temporal: {df_final['periodo'].min()} - {df_final['periodo'].max()}")
-print(f"   Valores nulos en valor_tasado: {df_final['valor_tasado_total_medio'].isna().sum():,} ({df_final['valor_tasado_total_medio'].isna().sum()/len(df_final)*100:.1f}%)")
-print(f"   Valores nulos en numero_tasaciones: {df_final['numero_tasaciones_total'].isna().sum():,} ({df_final['numero_tasaciones_total'].isna().sum()/len(df_final)*100:.1f}%)")
-
-# Mostrar resumen estadístico
-print("\n   Resumen valor tasado (€/m²):")
-print(df_final['valor_tasado_total_medio'].describe().to_string())
-
-# Guardar resultado
-print("\n5️⃣ Guardando archivo normalizado...")
-OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-df_final.to_csv(OUTPUT_FILE, index=False, encoding='utf-8')
-print(f"   ✅ Archivo guardado: {OUTPUT_FILE}")
-
-# Mostrar muestra de datos
-print("\n6️⃣ Muestra de datos normalizados (primeras 10 filas):")
-print(df_final.head(10).to_string(index=False))
-
-print("\n" + "=" * 70)
-print("✅ NORMALIZACIÓN COMPLETADA")
-print("=" * 70)
+    for c in ('valor_tasado_total_medio', 'numero_tasaciones_total'):
+        df_data[c] = pd.to_numeric(df_data[c], errors='coerce')
+    return df_data[COLUMNS]
+
+
+# --- procesos de trabajo: cada uno abre el libro una vez -------------------------------
+_BOOK = None
+
+
+def _init_worker(path: str):
+    global _BOOK
+    import xlrd
+    _BOOK = xlrd.open_workbook(path, on_demand=True)
+
+
+def _process_sheet(idx: int, sheet_name: str, periodo: str):
+    sh = _BOOK.sheet_by_index(idx)
+    try:
+        return normalize_sheet(sheet_to_frame(sh), sheet_name, periodo)
+    finally:
+        _BOOK.unload_sheet(idx)
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_manifest() -> dict:
+    if MANIFEST.exists():
+        return json.loads(MANIFEST.read_text(encoding="utf-8"))
+    return {"sheets": {}}
+
+
+def normalize_workbook(path: Path, workers: int | None = None, use_cache: bool = True) -> pd.DataFrame:
+    """Todas las pestañas trimestrales normalizadas y concatenadas (en el orden del libro)."""
+    global _BOOK
+    import xlrd
+
+    print("\n1️⃣ Leyendo pestañas del archivo Excel...")
+    book = xlrd.open_workbook(str(path), on_demand=True)
+    sheet_names = book.sheet_names()
+    print(f"   Total pestañas encontradas: {len(sheet_names)}")
+
+    manifest = _read_manifest() if use_cache else {"sheets": {}}
+    tareas, resultados, claves = [], {}, {}
+    for idx, sheet_name in enumerate(sheet_names):
+        periodo = periodo_de_pestaña(sheet_name)
+        if periodo is None:
+            print(f"   ⚠️  Saltando pestaña con formato desconocido: {sheet_name}")
+            continue
+        key = sheet_fingerprint(book, idx, periodo)
+        claves[sheet_name] = key
+        cached = CACHE_DIR / f"{key}.parquet"
+        if use_cache and cached.exists():
+            resultados[idx] = pd.read_parquet(cached)
+        else:
+            tareas.append((idx, sheet_name, periodo))
+
+    print(f"\n2️⃣ Procesando pestañas... ({len(resultados)} en caché, {len(tareas)} por normalizar)")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tareas)))
+    if workers > 1:
+        book.release_resources()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(path),)) as ex:
+            futs = {idx: ex.submit(_process_sheet, idx, name, periodo) for idx, name, periodo in tareas}
+            nuevos = {idx: f.result() for idx, f in futs.items()}
+    else:
+        # pocas pestañas: sin procesos, con el libro ya abierto
+        _BOOK = book
+        nuevos = {idx: _process_sheet(idx, name, periodo) for idx, name, periodo in tareas}
+        book.release_resources()
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for idx, name, _ in tareas:
+        df = nuevos[idx]
+        if df is None:
+            claves.pop(name, None)
+            continue
+        if use_cache:
+            df.to_parquet(CACHE_DIR / f"{claves[name]}.parquet", index=False)
+        resultados[idx] = df
+    print(f"   ✅ {len(resultados)} pestañas procesadas correctamente")
+
+    # limpiar entradas de caché que ya no corresponden a ninguna pestaña
+    if use_cache:
+        vivas = set(claves.values())
+        for f in CACHE_DIR.glob("*.parquet"):
+            if f.stem not in vivas:
+                f.unlink(missing_ok=True)
+        manifest["sheets"] = claves
+        MANIFEST.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+    return pd.concat([resultados[i] for i in sorted(resultados)], ignore_index=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Normaliza el XLS de valor tasado de MIVAU")
+    ap.add_argument("--workers", type=int, default=None, help="Procesos para las pestañas pendientes (def. nº CPUs)")
+    ap.add_argument("--no-cache", action="store_true", help="Ignora y no escribe la caché de pestañas")
+    args = ap.parse_args(argv)
+
+    print("=" * 70)
+    print("NORMALIZACIÓN MIVAU - VALOR TASADO DE VIVIENDA")
+    print("=" * 70)
+
+    # Verificar que existe el archivo de entrada
+    if not INPUT_FILE.exists():
+        print(f"\n❌ ERROR: Archivo no encontrado: {INPUT_FILE}")
+        sys.exit(1)
+
+    print(f"\n📂 Archivo de entrada: {INPUT_FILE}")
+    print(f"📂 Archivo de salida: {OUTPUT_FILE}")
+
+    # Atajo: mismo fichero (sha256) y misma versión que la última ejecución
+    file_hash = _file_sha256(INPUT_FILE)
+    manifest = _read_manifest()
+    if (not args.no_cache and OUTPUT_FILE.exists() and manifest.get("file_sha256") == file_hash
+            and manifest.get("version") == CACHE_VERSION):
+        print(f"\n✅ Sin cambios en {INPUT_FILE.name} (sha256 {file_hash[:12]}): {OUTPUT_FILE} está al día")
+        return
+
+    df_final = normalize_workbook(INPUT_FILE, workers=args.workers, use_cache=not args.no_cache)
+
+    print("\n3️⃣ Consolidando datos...")
+    print(f"   Total registros: {len(df_final):,}")
+    print(f"   Municipios únicos: {df_final['municipio'].nunique()}")
+    print(f"   Provincias únicas: {df_final['provincia'].nunique()}")
+    print(f"   Periodos únicos: {df_final['periodo'].nunique()}")
+
+    # Estadísticas
+    print("\n4️⃣ Estadísticas de los datos:")
+    print(f"   Rango temporal: {df_final['periodo'].min()} - {df_final['periodo'].max()}")
+    print(f"   Valores nulos en valor_tasado: {df_final['valor_tasado_total_medio'].isna().sum():,} ({df_final['valor_tasado_total_medio'].isna().sum()/len(df_final)*100:.1f}%)")
+    print(f"   Valores nulos en numero_tasaciones: {df_final['numero_tasaciones_total'].isna().sum():,} ({df_final['numero_tasaciones_total'].isna().sum()/len(df_final)*100:.1f}%)")
+
+    # Mostrar resumen estadístico
+    print("\n   Resumen valor tasado (€/m²):")
+    print(df_final['valor_tasado_total_medio'].describe().to_string())
+
+    # Guardar resultado
+    print("\n5️⃣ Guardando archivo normalizado...")
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    df_final.to_csv(OUTPUT_FILE, index=False, encoding='utf-8')
+    print(f"   ✅ Archivo guardado: {OUTPUT_FILE}")
+
+    if not args.no_cache:
+        manifest = _read_manifest()
+        manifest.update({"version": CACHE_VERSION, "file_sha256": file_hash})
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        MANIFEST.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+    # Mostrar muestra de datos
+    print("\n6️⃣ Muestra de datos normalizados (primeras 10 filas):")
+    print(df_final.head(10).to_string(index=False))
+
+    print("\n" + "=" * 70)
+    print("✅ NORMALIZACIÓN COMPLETADA")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# src/etl/pipeline.py
+"""
+Orquestador del ETL (fetch → normalize → build) con caché por contenido.
+
+Cada etapa declara el módulo que ejecuta, sus entradas y sus salidas. Las
+dependencias se deducen cruzando salidas con entradas. Una etapa se salta si la
+huella de sus entradas (contenido de los ficheros + código del módulo + args) no
+ha cambiado desde la última ejecución correcta y sus salidas siguen existiendo.
+Las etapas independientes se lanzan en paralelo, cada una en su propio proceso.
+
+Uso:
+  python -m src.etl.pipeline                  # normalize + build (refresco local)
+  python -m src.etl.pipeline fetch            # sólo descargas
+  python -m src.etl.pipeline all              # fetch + normalize + build
+  python -m src.etl.pipeline build_master_muni --force
+  python -m src.etl.pipeline --list
+
+Las etapas fetch no tienen entradas locales (leen de la red): se ejecutan siempre
+que se piden, y si descargan exactamente los mismos bytes las etapas siguientes
+se saltan igualmente.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+from src.etl.sources._fetch_utils import HostLimiter, load_fetch_limits
+STATE_FILE = ROOT / "data" / ".pipeline_state.json"
+LOG_DIR = ROOT / "logs" / "pipeline"
+
+try:
+    sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
+except AttributeError:
+    pass
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    phase: str                 # fetch | normalize | build
+    module: str                # se ejecuta como: python -m <module> <args>
+    inputs: tuple = ()         # rutas, directorios o globs relativos a ROOT
+    outputs: tuple = ()
+    args: tuple = ()
+    code: tuple = ()           # otros .py que importa el módulo (cuentan para la huella)
+    always: bool = False       # fetch: no se puede saber si la fuente remota cambió
+    host: str | tuple | None = None  # fetch: dominio(s) que contacta, para el límite por host
+                                     # (única fuente: run_all_fetchers lo lee de aquí)
+
+STAGES = [
+    # --- FETCH ---
+    Stage("fetch_municipios_ign", "fetch", "src.etl.sources.fetch_municipios_ign",
+          # centrodedescargas.cnig.es y, si falla, ftpgeodesia.ign.es
+          outputs=("data_raw/geo",), always=True, host=("cnig.es", "ign.es")),
+    Stage("fetch_valor_tasado_seed", "fetch", "src.etl.sources.fetch_valor_tasado_seed",
+          outputs=("data_raw/mivau/valor_tasado_seed.csv",), always=True, host="icane.es"),
+    Stage("fetch_ine_padron_all", "fetch", "src.etl.sources.fetch_ine_padron_all",
+          outputs=("data_raw/ine/padron_all_raw.csv", "data_raw/ine/padron_all.csv", "data_raw/ine/padron_all.parquet"), always=True, host="ine.es"),
+    Stage("fetch_ine_adrh_all", "fetch", "src.etl.sources.fetch_ine_adrh_all",
+          outputs=("data_raw/ine/adrh_all_raw.csv", "data_raw/ine/adrh_all.csv", "data_raw/ine/adrh_all.parquet"), always=True, host="ine.es"),
+    Stage("fetch_sepe_paro_all", "fetch", "src.etl.sources.fetch_sepe_paro_all",
+          outputs=("data_raw/sepe/paro_municipal_raw.csv",), always=True, host="sepe.gob.es"),
+    Stage("fetch_euribor_bde", "fetch", "src.etl.sources.fetch_euribor_bde",
+          outputs=("data_raw/macro/ti_1_7.csv",), always=True, host="bde.es"),
+    # --- NORMALIZE ---
+    Stage("norm_geo_municipios", "normalize", "src.etl.normalize.norm_geo_municipios",
+          inputs=("data_raw/geo/municipios_ign.geojson",), outputs=("data/curated/geo_municipios.geojson",)),
+    Stage("norm_mivau_valor_tasado", "normalize", "src.etl.normalize.norm_mivau_valor_tasado",
+          inputs=("data_raw/mivau/valor_tasado_seed.csv",), outputs=("data/curated/valor_tasado.parquet",)),
+    Stage("norm_ine_adrh", "normalize", "src.etl.normalize.norm_ine_adrh",
+          inputs=("data_raw/ine/adrh_31142.csv",), outputs=("data/curated/adrh.parquet",)),
+    Stage("norm_ine_padron", "normalize", "src.etl.normalize.norm_ine_padron",
+          inputs=("data_raw/ine/padron_33775.csv",), outputs=("data/curated/padron.parquet",)),
+    Stage("norm_sepe_paro", "normalize", "src.etl.normalize.norm_sepe_paro",
+          inputs=("data_raw/sepe/paro_*.csv",), outputs=("data/curated/sepe_paro_muni",)),
+    Stage("norm_euribor", "normalize", "src.etl.normalize.norm_euribor",
+          inputs=("data_raw/macro/ti_1_7.csv",),
+          outputs=("data/curated/euribor_q.parquet", "data/curated/euribor_m.parquet")),
+    # --- BUILD ---
+    Stage("build_dim_municipio", "build", "src.etl.build.build_dim_municipio",
+          inputs=("data_raw/geo/municipios_ign.geojson",),
+          outputs=("data/curated/dim_municipio.parquet", "data/curated/municipios_geo.geojson"),
+          code=("src/etl/normalize/muni_names.py",)),
+    Stage("build_master_muni", "build", "src.etl.build.build_master_muni",
+          inputs=("data/curated/dim_municipio.parquet", "data_raw/mivau/valor_tasado_seed.csv",
+                  "data/curated/adrh.parquet", "data/curated/padron.parquet", "data/curated/euribor_q.parquet",
+                  "data/curated/euribor_m.parquet", "data/curated/sepe_paro_muni"),
+          outputs=("data/curated/municipios_master/_manifest.json",),
+          args=("--incremental",),
+          code=("src/etl/build/build_dim_municipio.py", "src/etl/normalize/muni_names.py",
+                "src/etl/build/mixed_freq.py", "src/etl/normalize/norm_sepe_paro.py")),
+]
+
+PHASES = {
+    "fetch": ("fetch",),
+    "normalize": ("normalize",),
+    "build": ("build",),
+    "refresh": ("normalize", "build"),
+    "all": ("fetch", "normalize", "build"),
+}
+
+# ---------------------------------------------------------------------------
+# Huellas de contenido
+# ---------------------------------------------------------------------------
+
+class FileHasher:
+    """sha256 de ficheros; reutiliza el hash guardado si tamaño y mtime no cambian."""
+    def __init__(self, cache: dict):
+        self.cache = cache
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        rel = str(path.relative_to(ROOT))
+        hit = self.cache.get(rel)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        self.cache[rel] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+def expand(pattern: str) -> list:
+    """Rutas, directorios (recursivo) o globs -> ficheros existentes, ordenados."""
+    p = ROOT / pattern
+    if any(ch in pattern for ch in "*?["):
+        files = [f for f in ROOT.glob(pattern) if f.is_file()]
+    elif p.is_dir():
+        files = [f for f in p.rglob("*") if f.is_file()]
+    else:
+        files = [p] if p.exists() else []
+    return sorted(files)
+
+def module_file(module: str) -> Path:
+    return ROOT / (module.replace(".", "/") + ".py")
+
+def stage_key(stage: Stage, hasher: FileHasher):
+    """Huella de la etapa, o (None, entradas_que_faltan)."""
+    h = hashlib.sha256()
+    for src in (module_file(stage.module), *(ROOT / c for c in stage.code)):
+        h.update(hasher.file(src).encode())
+    h.update(json.dumps(stage.args).encode())
+    missing = []
+    for pat in stage.inputs:
+        files = expand(pat)
+        if not files:
+            missing.append(pat)
+        for f in files:
+            h.update(str(f.relative_to(ROOT)).encode())
+            h.update(hasher.file(f).encode())
+    return (None, missing) if missing else (h.hexdigest(), [])
+
+# ---------------------------------------------------------------------------
+# DAG
+# ---------------------------------------------------------------------------
+
+def _covers(out: str, inp: str) -> bool:
+    """¿La salida `out` produce (parte de) la entrada `inp`?"""
+    if out == inp:
+        return True
+    if inp.startswith(out.rstrip("/") + "/") or out.startswith(inp.rstrip("/") + "/"):
+        return True
+    from fnmatch import fnmatch
+    return fnmatch(out, inp) or fnmatch(inp, out)
+
+def dependencies(stages: list) -> dict:
+    deps = {s.name: set() for s in stages}
+    for s in stages:
+        for other in stages:
+            if other is s:
+                continue
+            if any(_covers(o, i) for o in other.outputs for i in s.inputs):
+                deps[s.name].add(other.name)
+    return deps
+
+def select(targets: list) -> list:
+    names = {s.name for s in STAGES}
+    phases = set()
+    picked = set()
+    for t in targets:
+        if t in PHASES:
+            phases.update(PHASES[t])
+        elif t in names:
+            picked.add(t)
+        else:
+            raise SystemExit(f"❌ Objetivo desconocido: {t}. Usa --list para ver etapas.")
+    return [s for s in STAGES if s.phase in phases or s.name in picked]
+
+def run_stage(stage: Stage, limiter: HostLimiter) -> tuple:
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log = LOG_DIR / f"{stage.name}.log"
+    with limiter.slot(stage.host), open(log, "w", encoding="utf-8") as f:
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-m", stage.module, *stage.args],
+                              cwd=ROOT, stdout=f, stderr=subprocess.STDOUT)
+    return proc.returncode == 0, time.perf_counter() - t0, log
+
+def run(targets: list, jobs: int = 4, force: bool = False) -> dict:
+    """Ejecuta las etapas seleccionadas respetando dependencias. Devuelve {etapa: estado}."""
+    stages = select(targets)
+    by_name = {s.name: s for s in stages}
+    deps = {k: v & set(by_name) for k, v in dependencies(STAGES).items() if k in by_name}
+
+    limits = load_fetch_limits()
+    limiter = HostLimiter(limits["max_per_host"], limits.get("per_host"))
+
+    state = json.loads(STATE_FILE.read_text(encoding="utf-8")) if STATE_FILE.exists() else {}
+    hasher = FileHasher(state.setdefault("files", {}))
+    done_keys = state.setdefault("stages", {})
+
+    status = {}
+    pending = set(by_name)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                if not deps[name] <= set(status):
+                    continue
+                pending.discard(name)
+                st = by_name[name]
+                if any(status[d] in ("failed", "blocked") for d in deps[name]):
+                    status[name] = "blocked"
+                    print(f"⏭️  {name}: bloqueada (falló una dependencia)")
+                    continue
+                key, missing = stage_key(st, hasher)
+                if missing:
+                    # no bloquea a las siguientes: puede que sus salidas ya existan
+                    status[name] = "missing"
+                    print(f"⚠️  {name}: faltan entradas {missing}")
+                    continue
+                outputs_ok = all(expand(o) for o in st.outputs)
+                if not (force or st.always) and done_keys.get(name) == key and outputs_ok:
+                    status[name] = "cached"
+                    print(f"✔️  {name}: sin cambios (caché)")
+                    continue
+                print(f"▶️  {name}")
+                running[pool.submit(run_stage, st, limiter)] = (name, key)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, key = running.pop(fut)
+                ok, secs, log = fut.result()
+                status[name] = "ok" if ok else "failed"
+                if ok:
+                    done_keys[name] = key
+                    print(f"✅ {name} ({secs:.1f}s)")
+                else:
+                    done_keys.pop(name, None)
+                    print(f"❌ {name} ({secs:.1f}s) — ver {log}")
+
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    STATE_FILE.write_text(json.dumps(state, indent=1), encoding="utf-8")
+    return status
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Orquestador ETL con caché por contenido")
+    ap.add_argument("targets", nargs="*", default=["refresh"],
+                    help="fase (fetch, normalize, build, refresh, all) o nombre de etapa")
+    ap.add_argument("-j", "--jobs", type=int, default=4, help="etapas en paralelo")
+    ap.add_argument("--force", action="store_true", help="ignora la caché y re-ejecuta todo lo seleccionado")
+    ap.add_argument("--list", action="store_true", help="lista etapas y dependencias")
+    ap.add_argument("--offline", action="store_true", help="fetch sólo desde la caché HTTP local, sin red")
+    args = ap.parse_args(argv)
+    if args.offline:
+        os.environ["TFG_OFFLINE"] = "1"  # lo heredan los subprocesos de cada etapa
+
+    if args.list:
+        deps = dependencies(STAGES)
+        for s in STAGES:
+            print(f"[{s.phase:9}] {s.name:26} <- {', '.join(sorted(deps[s.name])) or '-'}")
+        return
+
+    t0 = time.perf_counter()
+    status = run(args.targets, jobs=args.jobs, force=args.force)
+    bad = [k for k, v in status.items() if v in ("failed", "blocked")]
+    counts = {v: sum(1 for x in status.values() if x == v) for v in ("ok", "cached", "missing", "failed", "blocked")}
+    print(f"\n📊 {counts} en {time.perf_counter() - t0:.1f}s")
+    sys.exit(1 if bad else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,205 @@
 from pathlib import Path
-import requests, time, io
+from contextlib import contextmanager, ExitStack
+import requests, time, io, os, threading, json, hashlib, mmap
+
+DEFAULT_HEADERS = {"User-Agent": "tfg-data-fetcher/1.0 (+https://example.invalid)"}
+
+# Caché HTTP persistente (una entrada por URL): <sha>.body + <sha>.json (ETag, Last-Modified...)
+HTTP_CACHE_DIR = Path(os.getenv("TFG_HTTP_CACHE", str(Path(__file__).resolve().parents[3] / "data_raw" / ".http_cache")))
+
+class OfflineCacheMiss(RuntimeError):
+    """Modo offline y la URL no está en la caché."""
+
+def is_offline() -> bool:
+    """TFG_OFFLINE=1 -> sólo se sirve desde la caché, sin tocar la red."""
+    return os.getenv("TFG_OFFLINE", "") not in ("", "0")
+
+def _cache_paths(url: str, cache_dir: Path):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    return cache_dir / f"{key}.body", cache_dir / f"{key}.json"
+
+class NotModified(Exception):
+    """El servidor respondió 304 a una petición condicional."""
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def make_session(pool_size: int = 10) -> requests.Session:
+    """Session con pool de conexiones keep-alive, para compartir entre hilos de un mismo fetcher."""
+    from requests.adapters import HTTPAdapter
+    s = requests.Session()
+    s.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+class TokenBucket:
+    """
+    Límite de peticiones por segundo compartido entre hilos (token bucket).
+
+    Se reponen `rate` tokens por segundo hasta un máximo de `burst`; acquire()
+    bloquea sólo lo necesario hasta que haya un token, en lugar de dormir un
+    tiempo fijo tras cada petición.
+    """
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+def download_to_file(url: str, dest, timeout=60, retries=3, backoff=2, headers=None,
+                     chunk_size=1 << 20, expected_size=None, sha256=None, resume=True,
+                     session=None, rate_limiter=None) -> dict:
+    """
+    Descarga en streaming a `dest` (por trozos, sin cargar el cuerpo en memoria).
+
+    Escribe en `<dest>.part`; si la conexión se corta se reanuda con Range desde el
+    último byte escrito (con If-Range para no mezclar versiones), también entre
+    ejecuciones. Al terminar comprueba tamaño (Content-Length/Content-Range o
+    expected_size) y sha256 si se indica, y renombra a `dest` de forma atómica.
+    Devuelve las cabeceras útiles (etag, last_modified, size, sha256).
+    Si `headers` lleva If-None-Match/If-Modified-Since y el servidor responde 304
+    se lanza NotModified. `session` (make_session) reutiliza conexiones y
+    `rate_limiter` (TokenBucket) se consulta antes de cada petición, reintentos incluidos.
+    """
+    http = session or requests
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    part_meta = dest.with_name(dest.name + ".part.json")
+    base = dict(headers or DEFAULT_HEADERS)
 
-def download_bytes(url: str, timeout=60, retries=3, backoff=2, headers=None) -> bytes:
-    headers = headers or {"User-Agent": "tfg-data-fetcher/1.0 (+https://example.invalid)"}
     for i in range(retries):
         try:
-            r = requests.get(url, timeout=timeout, headers=headers)
+            offset = part.stat().st_size if (resume and part.exists()) else 0
+            h = dict(base)
+            validator = None
+            if offset and part_meta.exists():
+                pm = json.loads(part_meta.read_text(encoding="utf-8"))
+                validator = pm.get("etag") or pm.get("last_modified")
+            if offset and validator:
+                # Range sólo tiene sentido contra la misma versión del recurso
+                h.pop("If-None-Match", None); h.pop("If-Modified-Since", None)
+                h["Range"] = f"bytes={offset}-"
+                h["If-Range"] = validator
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            with http.get(url, timeout=timeout, headers=h, stream=True) as r:
+                if r.status_code == 304:
+                    raise NotModified(url)
+                if r.status_code == 416 and offset:
+                    # el .part no encaja con el recurso remoto: se descarta y se reintenta entero
+                    part.unlink(missing_ok=True)
+                    raise IOError(f"{url}: rango no satisfacible, reinicio la descarga")
+                r.raise_for_status()
+                if r.status_code == 206:
+                    total = int(r.headers.get("Content-Range", "*/0").rsplit("/", 1)[-1] or 0) or None
+                    mode = "ab"
+                else:
+                    offset = 0
+                    total = int(r.headers["Content-Length"]) if r.headers.get("Content-Length") else None
+                    mode = "wb"
+                    part_meta.write_text(json.dumps({
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }), encoding="utf-8")
+                with open(part, mode) as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+            size = part.stat().st_size
+            if expected_size is not None and size != expected_size:
+                raise IOError(f"{url}: tamaño {size} != esperado {expected_size}")
+            if total is not None and size != total:
+                raise IOError(f"{url}: descarga incompleta ({size}/{total} bytes)")
+            digest = _file_sha256(part)
+            if sha256 and digest.lower() != sha256.lower():
+                part.unlink(missing_ok=True)
+                raise IOError(f"{url}: sha256 no coincide")
+            info = json.loads(part_meta.read_text(encoding="utf-8")) if part_meta.exists() else {}
+            os.replace(part, dest)
+            part_meta.unlink(missing_ok=True)
+            return {"etag": info.get("etag"), "last_modified": info.get("last_modified"),
+                    "size": size, "sha256": digest}
+        except NotModified:
+            raise
+        except Exception as e:
+            if i + 1 == retries:
+                raise
+            time.sleep(backoff * (i + 1))
+    raise RuntimeError(f"Failed to download {url} after {retries} attempts")
+
+def download_cached(url: str, timeout=60, retries=3, backoff=2, headers=None, cache_dir=None, offline=None,
+                    expected_size=None, sha256=None, session=None, rate_limiter=None) -> Path:
+    """
+    Descarga `url` a la caché (en streaming, reanudable) y devuelve la ruta del cuerpo.
+
+    Si ya hay copia se revalida con If-None-Match / If-Modified-Since y un 304
+    devuelve la copia sin volver a bajar el fichero. En modo offline no se hace
+    ninguna petición: se sirve la copia o se lanza OfflineCacheMiss.
+    """
+    cache_dir = Path(cache_dir) if cache_dir else HTTP_CACHE_DIR
+    body, meta_path = _cache_paths(url, cache_dir)
+    meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() and body.exists() else None
+
+    if is_offline() if offline is None else offline:
+        if meta is None:
+            raise OfflineCacheMiss(f"Modo offline: {url} no está en la caché ({cache_dir})")
+        return body
+
+    h = dict(headers or DEFAULT_HEADERS)
+    if meta:
+        if meta.get("etag"):
+            h["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            h["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        info = download_to_file(url, body, timeout=timeout, retries=retries, backoff=backoff, headers=h,
+                                expected_size=expected_size, sha256=sha256,
+                                session=session, rate_limiter=rate_limiter)
+    except NotModified:
+        return body
+    meta_path.write_text(json.dumps({"url": url, **info,
+                                     "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, indent=1), encoding="utf-8")
+    return body
+
+def open_mmap(path) -> mmap.mmap:
+    """Mapa de memoria de sólo lectura sobre un fichero descargado (p.ej. para parsers que aceptan buffers)."""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def download_bytes(url: str, timeout=60, retries=3, backoff=2, headers=None, cache=True,
+                   session=None, rate_limiter=None) -> bytes:
+    """Descarga con reintentos. Con cache=True (por defecto) pasa por la caché HTTP en disco."""
+    if cache or is_offline():
+        return download_cached(url, timeout=timeout, retries=retries, backoff=backoff, headers=headers,
+                               session=session, rate_limiter=rate_limiter).read_bytes()
+    headers = headers or DEFAULT_HEADERS
+    http = session or requests
+    for i in range(retries):
+        try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            r = http.get(url, timeout=timeout, headers=headers)
             r.raise_for_status()
             return r.content
         except Exception as e:
@@ -15,21 +209,282 @@ def download_bytes(url: str, timeout=60, retries=3, backoff=2, headers=None) ->
     # If retries is 0 or the loop completes without returning, raise an explicit error.
     raise RuntimeError(f"Failed to download {url} after {retries} attempts")
 
-def read_csv_auto_from_bytes(b: bytes):
-    # Try common encodings and separators
-    text_guesses = [("utf-8", ","), ("utf-8", ";"), ("latin-1", ";"), ("latin-1", "\t"), ("utf-8", "\t")]
-    for enc, sep in text_guesses:
+# Dialecto detectado por fuente (url/fichero) para no volver a olfatearlo en cada ejecución
+CSV_DIALECTS_PATH = HTTP_CACHE_DIR / "_csv_dialects.json"
+_dialects_lock = threading.Lock()
+
+# Si el prefijo era ASCII/utf-8 pero más abajo hay bytes que no lo son, se vuelve a
+# leer todo en latin-1 (decodifica cualquier byte), como hacían los fetchers antes
+FALLBACK_ENCODING = "latin-1"
+
+def _is_decode_error(e: BaseException) -> bool:
+    """UnicodeDecodeError de pandas o el ArrowInvalid de pyarrow por texto que no es utf-8."""
+    return isinstance(e, UnicodeDecodeError) or "invalid utf8" in str(e).lower()
+
+def _decode_prefix(prefix: bytes):
+    """(encoding, texto) del prefijo. Se corta en el último salto de línea para no partir un carácter."""
+    cut = prefix.rfind(b"\n")
+    if cut > 0:
+        prefix = prefix[:cut]
+    if prefix.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig", prefix[3:].decode("utf-8", errors="ignore")
+    try:
+        return "utf-8", prefix.decode("utf-8")
+    except UnicodeDecodeError:
+        # INE / SEPE publican en ISO-8859-1/15; latin-1 decodifica cualquier byte
+        return "latin-1", prefix.decode("latin-1")
+
+# caracteres que no hacen "no vacía" una línea (los mismos en texto y en bytes)
+_BLANK = "\r\t "
+
+def sniff_csv(prefix: bytes, delimiters=(",", ";", "\t", "|"), max_lines=50) -> dict:
+    """
+    Detecta encoding, separador y fila de cabecera a partir de los primeros bytes.
+
+    Para cada separador candidato se cuentan los campos por línea (con csv.reader,
+    respetando comillas); gana el que da más filas con el mismo número (>1) de
+    campos. La cabecera es la primera línea con ese número de campos, lo que salta
+    los títulos/notas que algunas fuentes ponen antes de la tabla.
+    """
+    import csv
+    from collections import Counter
+    encoding, text = _decode_prefix(prefix)
+    # split("\n") y no splitlines(): ésta corta también en \r suelto, \x85 (el "…" de cp1252
+    # leído como latin-1) y otros separadores Unicode, y el desplazamiento en bytes de abajo
+    # sólo cuenta \n; las dos pasadas tienen que ver las mismas líneas (un \r suelto dentro
+    # de un título se deja como espacio: csv.reader lo tomaría por fin de línea)
+    lines = [l.rstrip("\r").replace("\r", " ") for l in text.split("\n")[:max_lines] if l.strip(_BLANK)]
+    best = None
+    for sep in delimiters:
+        widths = [len(r) for r in csv.reader(lines, delimiter=sep)]
+        if not widths:
+            continue
+        width, n = Counter(widths).most_common(1)[0]
+        if width < 2:
+            continue
+        score = (n, width)
+        if best is None or score > best[0]:
+            best = (score, sep, widths.index(width))
+    if best is None:
+        return {"encoding": encoding, "sep": ",", "offset": 0}
+    _, sep, header_idx = best
+    # desplazamiento en bytes de la cabecera (el \n es un único byte en utf-8 y latin-1);
+    # se cuentan también las líneas vacías anteriores
+    offset, seen = 0, 0
+    for raw in prefix.split(b"\n"):
+        if raw.strip(_BLANK.encode("latin-1") + b"\xef\xbb\xbf"):
+            if seen == header_idx:
+                break
+            seen += 1
+        offset += len(raw) + 1
+    if offset and encoding == "utf-8-sig":
+        encoding = "utf-8"  # el BOM queda antes del desplazamiento
+    return {"encoding": encoding, "sep": sep, "offset": offset}
+
+def _load_dialects() -> dict:
+    try:
+        return json.loads(CSV_DIALECTS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _save_dialect(source: str, dialect: dict):
+    with _dialects_lock:
+        d = _load_dialects()
+        if d.get(source) == dialect:
+            return
+        d[source] = dialect
+        CSV_DIALECTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CSV_DIALECTS_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(d, indent=1, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, CSV_DIALECTS_PATH)
+
+def _header_names(prefix: bytes, dialect: dict) -> list:
+    import csv
+    line = prefix[dialect["offset"]:].split(b"\n", 1)[0].decode(dialect["encoding"], errors="ignore")
+    return next(csv.reader([line.rstrip("\r")], delimiter=dialect["sep"]), [])
+
+def _parse_csv(open_src, dialect: dict, names: list):
+    """
+    _parse_csv_once con el dialecto y, si el fichero no es utf-8 más allá del
+    prefijo olfateado, otra vez entero en FALLBACK_ENCODING.
+    """
+    try:
+        return _parse_csv_once(open_src, dialect, names)
+    except Exception as e:
+        if not _is_decode_error(e) or dialect["encoding"] == FALLBACK_ENCODING:
+            raise
+        return _parse_csv_once(open_src, {**dialect, "encoding": FALLBACK_ENCODING}, names)
+
+def _parse_csv_once(open_src, dialect: dict, names: list):
+    """
+    Un único parseo desde la cabecera: pyarrow.csv (columnar, multihilo) y, si no
+    está instalado o el fichero no le cuadra, el motor C de pandas.
+
+    pyarrow se llama directamente con todas las columnas como string: el motor
+    "pyarrow" de pandas infiere tipos y luego convierte, lo que se come los ceros a
+    la izquierda de los códigos INE.
+    """
+    import pandas as pd
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+        if len(set(names)) != len(names):
+            raise ValueError("cabecera con columnas repetidas")
+        with open_src(dialect["offset"]) as f:
+            table = pacsv.read_csv(
+                f,
+                read_options=pacsv.ReadOptions(column_names=names, skip_rows=1, encoding=dialect["encoding"]),
+                parse_options=pacsv.ParseOptions(delimiter=dialect["sep"]),
+                convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                                     strings_can_be_null=True),
+            )
+        df = table.to_pandas()
+        engine = "pyarrow"
+    except Exception:
+        with open_src(dialect["offset"]) as f:
+            df = pd.read_csv(f, sep=dialect["sep"], encoding=dialect["encoding"], dtype=str,
+                             engine="c", on_bad_lines="skip")
+        engine = "c"
+    df.attrs["csv_dialect"] = {**dialect, "engine": engine}
+    return df
+
+def read_csv_auto(src, source: str | None = None, prefix_bytes: int = 1 << 16):
+    """
+    Lee un CSV de formato desconocido desde una ruta o desde bytes, parseándolo una vez.
+
+    El dialecto se detecta con sniff_csv sobre los primeros `prefix_bytes` (o se toma
+    de la caché si se pasa `source`, p.ej. la URL) y queda en df.attrs["csv_dialect"].
+    """
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        buf = memoryview(src)
+        prefix = bytes(buf[:prefix_bytes])
+        open_src = lambda offset: io.BytesIO(buf[offset:])
+    else:
+        with open(src, "rb") as f:
+            prefix = f.read(prefix_bytes)
+        def open_src(offset):
+            f = open(src, "rb")
+            f.seek(offset)
+            return f
+
+    cached = _load_dialects().get(source) if source else None
+    if cached:
         try:
-            s = b.decode(enc)
-            df = __import__("pandas").read_csv(io.StringIO(s), sep=sep, dtype=str)
-            # if dataframe has multiple columns, assume success
+            df = _parse_csv(open_src, cached, _header_names(prefix, cached))
             if df.shape[1] > 1:
                 return df
         except Exception:
-            continue
-    # Last attempt: let pandas infer
+            pass  # la fuente ha cambiado de formato: se vuelve a olfatear
+
+    dialect = sniff_csv(prefix)
+    df = _parse_csv(open_src, dialect, _header_names(prefix, dialect))
+    if source and df.shape[1] > 1:
+        # con el encoding con el que se leyó de verdad (puede ser el de reserva)
+        _save_dialect(source, {k: df.attrs["csv_dialect"][k] for k in dialect})
+    return df
+
+def read_csv_auto_from_bytes(b: bytes, source: str | None = None):
+    return read_csv_auto(b, source=source)
+
+def iter_csv_chunks(path, source: str | None = None, block_size: int = 1 << 20,
+                    prefix_bytes: int = 1 << 16):
+    """
+    Lee un CSV de formato desconocido por bloques (DataFrames con todo como string).
+
+    Misma detección de dialecto que read_csv_auto, pero con pyarrow.csv.open_csv
+    (streaming): la memoria depende de `block_size`, no del fichero (el lector
+    adelanta varios bloques: con 1 MB el pool de Arrow no pasa de ~40 MB). Sin pyarrow,
+    o si la cabecera trae columnas repetidas, usa el motor C de pandas con chunksize.
+    Si aparecen bytes que no son utf-8 tras el prefijo, sigue en FALLBACK_ENCODING.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(prefix_bytes)
+    dialect = _load_dialects().get(source) if source else None
+    names = _header_names(prefix, dialect) if dialect else []
+    if len(names) <= 1:
+        dialect = sniff_csv(prefix)
+        names = _header_names(prefix, dialect)
+        if source and len(names) > 1:
+            _save_dialect(source, dialect)
+
+    done = 0
     try:
-        s = b.decode("utf-8", errors="ignore")
-        return __import__("pandas").read_csv(io.StringIO(s), dtype=str)
-    except Exception:
-        raise
+        for chunk in _iter_chunks(path, dialect, names, block_size):
+            done += len(chunk)
+            yield chunk
+    except Exception as e:
+        if not _is_decode_error(e) or dialect["encoding"] == FALLBACK_ENCODING:
+            raise
+        # bytes no utf-8 tras el prefijo: se sigue en FALLBACK_ENCODING desde la
+        # primera fila que no se ha entregado (las anteriores eran utf-8 válido)
+        dialect = {**dialect, "encoding": FALLBACK_ENCODING}
+        yield from _iter_chunks(path, dialect, names, block_size, skip=done)
+        if source and len(names) > 1:
+            _save_dialect(source, dialect)
+
+def _iter_chunks(path, dialect: dict, names: list, block_size: int, skip: int = 0):
+    """Bloques desde la cabecera saltando las `skip` primeras filas de datos."""
+    import pandas as pd
+    with open(path, "rb") as f:
+        f.seek(dialect["offset"])
+        try:
+            import pyarrow as pa
+            from pyarrow import csv as pacsv
+            if len(set(names)) != len(names):
+                raise ValueError("cabecera con columnas repetidas")
+            reader = pacsv.open_csv(
+                f,
+                read_options=pacsv.ReadOptions(column_names=names, skip_rows=1 + skip,
+                                               encoding=dialect["encoding"], block_size=block_size),
+                parse_options=pacsv.ParseOptions(delimiter=dialect["sep"]),
+                convert_options=pacsv.ConvertOptions(column_types={n: pa.string() for n in names},
+                                                     strings_can_be_null=True),
+            )
+        except (ImportError, ValueError) as e:
+            if _is_decode_error(e):
+                raise
+            f.seek(dialect["offset"])
+            # ~100 bytes por fila en los CSV del INE
+            for chunk in pd.read_csv(f, sep=dialect["sep"], encoding=dialect["encoding"], dtype=str,
+                                     engine="c", on_bad_lines="skip", skiprows=range(1, skip + 1),
+                                     chunksize=max(1, block_size // 100)):
+                yield chunk
+            return
+        for batch in reader:
+            yield batch.to_pandas()
+
+SETTINGS_PATH = os.getenv("SH3_SETTINGS", str(Path(__file__).resolve().parents[3] / "configs" / "settings.yaml"))
+
+def load_fetch_limits(path: str = SETTINGS_PATH) -> dict:
+    """Sección `fetch:` de settings.yaml (max_workers, max_per_host, per_host, rate_per_host)."""
+    limits = {"max_workers": 6, "max_per_host": 1, "per_host": {}, "rate_per_host": {}}
+    p = Path(path)
+    if p.exists():
+        import yaml
+        cfg = yaml.safe_load(p.read_text(encoding="utf-8")) or {}
+        limits.update(cfg.get("fetch") or {})
+    return limits
+
+class HostLimiter:
+    """Limita cuántas descargas concurrentes se lanzan contra cada servidor."""
+    def __init__(self, max_per_host: int = 1, per_host: dict | None = None):
+        self.max_per_host = max_per_host
+        self.per_host = per_host or {}
+        self._sems = {}
+        self._lock = threading.Lock()
+
+    def _sem(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._sems:
+                self._sems[host] = threading.Semaphore(max(1, int(self.per_host.get(host, self.max_per_host))))
+            return self._sems[host]
+
+    @contextmanager
+    def slot(self, host):
+        """host: dominio, tupla de dominios (se reservan todos, en orden fijo para no
+        bloquearse entre sí) o None (sin límite)."""
+        hosts = () if host is None else (host,) if isinstance(host, str) else host
+        with ExitStack() as stack:
+            for h in sorted(set(hosts)):
+                stack.enter_context(self._sem(h))
+            yield
@@ -0,0 +1,232 @@
+# src/etl/sources/_ine_tempus.py
+"""
+Cliente en streaming para DATOS_TABLA de la API Tempus del INE.
+
+La respuesta de DATOS_TABLA es un único array JSON con una entrada por serie
+({"COD", "Nombre", "MetaData": [...], "Data": [{"Fecha", "Anyo", "Valor", ...}]}).
+En lugar de r.json() (árbol completo en memoria + un dict por dato) se lee el
+cuerpo por trozos, se decodifica serie a serie con json.JSONDecoder.raw_decode y
+los datos se acumulan en columnas que se vuelcan a Parquet por lotes
+(pyarrow.parquet.ParquetWriter). La memoria depende del tamaño del lote, no de
+la tabla.
+
+Filtros de la API para refrescos incrementales:
+  nult=N                 últimos N periodos de cada serie
+  date=AAAAMMDD:AAAAMMDD rango de fechas (date=AAAAMMDD: desde esa fecha)
+
+Uso típico:
+  url = tempus_url(31277, nult=2)
+  stream_table_to_parquet(url, out, dims={"Municipios": "municipio", ...})
+"""
+from __future__ import annotations
+import codecs
+import json
+from pathlib import Path
+from urllib.parse import urlencode
+import numpy as np
+import requests
+
+from src.etl.sources._fetch_utils import DEFAULT_HEADERS, OfflineCacheMiss, is_offline
+
+TEMPUS_BASE = "https://servicios.ine.es/wstempus/js/es"
+
+def tempus_url(tabla, tip: str = "AM", nult: int | None = None, date: str | None = None) -> str:
+    """URL de DATOS_TABLA con los filtros nult/date si se indican."""
+    params = {"tip": tip}
+    if nult:
+        params["nult"] = int(nult)
+    if date:
+        params["date"] = date
+    return f"{TEMPUS_BASE}/DATOS_TABLA/{tabla}?{urlencode(params, safe=':')}"
+
+def iter_json_array(chunks, encoding: str = "utf-8"):
+    """
+    Itera los elementos de un array JSON de primer nivel a partir de trozos de bytes.
+
+    Sólo se mantiene en memoria el trozo pendiente de decodificar (un elemento
+    incompleto como mucho), no el array entero.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    buf, pos = "", 0
+    started = False
+    chunks = iter(chunks)
+    eof = False
+    while True:
+        # saltar separadores entre elementos
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if not started and pos < len(buf):
+            if buf[pos] != "[":
+                raise ValueError(f"Se esperaba un array JSON, empieza por {buf[pos:pos + 40]!r}")
+            started, pos = True, pos + 1
+            continue
+        if started and pos < len(buf) and buf[pos] == "]":
+            return
+        if pos < len(buf):
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                obj = None
+            if obj is not None:
+                yield obj
+                pos = end
+                continue
+        if eof:
+            if not started:
+                return  # respuesta vacía
+            raise ValueError("Array JSON sin cerrar")
+        # necesita más datos: descartar lo ya consumido y leer hasta al menos duplicar
+        # lo pendiente, para no re-decodificar el mismo elemento con cada trozo pequeño
+        buf, pos = buf[pos:], 0
+        parts, need = [buf], max(2 * len(buf), 1)
+        size = len(buf)
+        while size < need:
+            try:
+                piece = text_decoder.decode(next(chunks))
+            except StopIteration:
+                piece = text_decoder.decode(b"", final=True)
+                eof = True
+            parts.append(piece)
+            size += len(piece)
+            if eof:
+                break
+        buf = "".join(parts)
+
+class _ColumnBatch:
+    """Columnas de un lote: la metadata se guarda una vez por serie y se repite al volcar."""
+    def __init__(self, dims: dict):
+        self.dims = dims
+        self.reset()
+
+    def reset(self):
+        self.serie, self.counts = [], []
+        self.meta = {col: ([], []) for col in self.dims.values()}
+        self.fecha, self.anyo, self.periodo_id, self.valor, self.secreto = [], [], [], [], []
+
+    def __len__(self):
+        return len(self.valor)
+
+    def add(self, item: dict):
+        data = item.get("Data") or []
+        if not data:
+            return
+        meta = {d.get("T3_Variable", ""): d for d in item.get("MetaData", [])}
+        self.serie.append(item.get("COD", ""))
+        self.counts.append(len(data))
+        for var, col in self.dims.items():
+            d = meta.get(var, {})
+            self.meta[col][0].append(d.get("Nombre", ""))
+            self.meta[col][1].append(d.get("Codigo", ""))
+        self.fecha.extend([d.get("Fecha") for d in data])
+        self.anyo.extend([d.get("Anyo") for d in data])
+        self.periodo_id.extend([d.get("FK_Periodo") for d in data])
+        self.valor.extend([d.get("Valor") for d in data])
+        self.secreto.extend([bool(d.get("Secreto", False)) for d in data])
+
+    def to_table(self, schema):
+        import pyarrow as pa
+        counts = np.asarray(self.counts, dtype=np.int64)
+        cols = {"serie": np.repeat(np.asarray(self.serie, dtype=object), counts)}
+        for col, (nombres, codigos) in self.meta.items():
+            cols[col] = np.repeat(np.asarray(nombres, dtype=object), counts)
+            cols[f"{col}_codigo"] = np.repeat(np.asarray(codigos, dtype=object), counts)
+        try:
+            fecha = pa.array(self.fecha, type=pa.int64())  # epoch en ms (tip=AM)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # algunas tablas devuelven la fecha como texto ISO
+            import pandas as pd
+            dt = pd.to_datetime(pd.Series(self.fecha), errors="coerce", utc=True)
+            ms = dt.astype("int64").to_numpy() // 10**6
+            fecha = pa.array(ms, type=pa.int64(), mask=dt.isna().to_numpy())
+        cols["fecha"] = fecha.cast(pa.timestamp("ms"))
+        cols["periodo"] = fecha
+        cols["anyo"] = pa.array(self.anyo, type=pa.int16())
+        cols["periodo_id"] = pa.array(self.periodo_id, type=pa.int32())
+        cols["valor"] = pa.array(self.valor, type=pa.float64())
+        cols["secreto"] = pa.array(self.secreto, type=pa.bool_())
+        return pa.table({f.name: cols[f.name] for f in schema}, schema=schema)
+
+def tempus_schema(dims: dict):
+    import pyarrow as pa
+    fields = [pa.field("serie", pa.string())]
+    for col in dims.values():
+        fields += [pa.field(col, pa.string()), pa.field(f"{col}_codigo", pa.string())]
+    fields += [pa.field("fecha", pa.timestamp("ms")), pa.field("periodo", pa.int64()),
+               pa.field("anyo", pa.int16()), pa.field("periodo_id", pa.int32()),
+               pa.field("valor", pa.float64()), pa.field("secreto", pa.bool_())]
+    return pa.schema(fields)
+
+def stream_table_to_parquet(url: str, out_parquet, dims: dict, batch_rows: int = 250_000,
+                            session=None, rate_limiter=None, timeout=300, chunk_size=1 << 16) -> dict:
+    """
+    Descarga DATOS_TABLA en streaming y escribe un Parquet en columnas.
+
+    `dims` mapea T3_Variable -> nombre de columna (p.ej. {"Municipios": "municipio"});
+    por cada una se guardan `<col>` (Nombre) y `<col>_codigo` (Codigo).
+    Devuelve {"series", "filas", "lotes"}. Se escribe a `<out>.tmp` y se renombra al final.
+    """
+    import pyarrow.parquet as pq
+    if is_offline():
+        raise OfflineCacheMiss(f"Modo offline: {url} (Tempus en streaming no pasa por la caché HTTP)")
+    out_parquet = Path(out_parquet)
+    out_parquet.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_parquet.with_name(out_parquet.name + ".tmp")
+    schema = tempus_schema(dims)
+    batch = _ColumnBatch(dims)
+    stats = {"series": 0, "filas": 0, "lotes": 0}
+    http = session or requests
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    with http.get(url, timeout=timeout, headers=DEFAULT_HEADERS, stream=True) as r:
+        r.raise_for_status()
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            for item in iter_json_array(r.iter_content(chunk_size=chunk_size)):
+                batch.add(item)
+                stats["series"] += 1
+                if len(batch) >= batch_rows:
+                    writer.write_table(batch.to_table(schema))
+                    stats["filas"] += len(batch); stats["lotes"] += 1
+                    batch.reset()
+            if len(batch) or stats["lotes"] == 0:
+                writer.write_table(batch.to_table(schema))
+                stats["filas"] += len(batch); stats["lotes"] += 1
+    tmp.replace(out_parquet)
+    return stats
+
+def upsert_parquet(nuevo, existente, claves=("serie", "periodo")) -> int:
+    """
+    Fusiona un Parquet de refresco (nult/date) con el histórico: las filas nuevas
+    sustituyen a las del histórico con las mismas claves. Devuelve las filas finales.
+    """
+    import pandas as pd
+    nuevo, existente = Path(nuevo), Path(existente)
+    new = pd.read_parquet(nuevo)
+    if existente.exists():
+        old = pd.read_parquet(existente)
+        keep = ~old.set_index(list(claves)).index.isin(new.set_index(list(claves)).index)
+        new = pd.concat([old[keep], new], ignore_index=True)
+    new.to_parquet(existente, index=False, compression="zstd")
+    return len(new)
+
+def parquet_to_csv(parquet, out_csv, columns: dict, transform=None, batch_size: int = 250_000) -> int:
+    """
+    Exporta un Parquet a CSV por lotes (compatibilidad con los consumidores de los
+    CSV de data_raw/ine). `columns` mapea columna del Parquet -> columna del CSV;
+    `transform(df) -> df` se aplica a cada lote ya renombrado. Devuelve las filas escritas.
+    """
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(parquet)
+    n = 0
+    with open(out_csv, "w", encoding="utf-8", newline="") as f:
+        header = True
+        for rb in pf.iter_batches(batch_size=batch_size, columns=list(dict.fromkeys(columns))):
+            df = rb.to_pandas().rename(columns=columns)
+            if transform is not None:
+                df = transform(df)
+            df.to_csv(f, index=False, header=header)
+            header = False
+            n += len(df)
+    return n
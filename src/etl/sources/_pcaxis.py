@@ -0,0 +1,203 @@
+# src/etl/sources/_pcaxis.py
+"""
+Lector nativo de ficheros PC-Axis (.px) del INE.
+
+Un .px es una cabecera de metadatos (KEYWORD[lang]("sub")=valores;) seguida de
+DATA=, con los valores de la matriz STUB × HEADING en orden C (la última variable
+de HEADING es la que cambia más rápido).
+
+- La cabecera se parsea una sola vez (sentencias separadas por ';' fuera de comillas).
+- DATA se lee por trozos: los símbolos entre comillas (".", "..", "-", ...) pasan
+  a NaN y cada trozo se convierte de golpe a float64 sobre un array preasignado.
+- Las columnas de dimensión no se expanden con product(): el código de cada fila
+  sale de su índice plano (idx // stride % n), sólo para las filas que se conservan,
+  y se devuelven como Categorical.
+
+Uso:
+  meta, valores = read_px("31277.px")
+  df = px_to_frame("31277.px")   # formato largo: una columna por dimensión + valor
+"""
+from __future__ import annotations
+import re
+import numpy as np
+
+# Codificación por defecto de los .px del INE (CHARSET="ANSI")
+DEFAULT_ENCODING = "ISO-8859-15"
+
+_DATA_KW = re.compile(r'\s*DATA\s*=')
+_STATEMENT = re.compile(r'(?:"[^"]*"|[^";])*;')
+_KEY = re.compile(r'\s*([A-Za-z0-9_\-]+)(?:\[([^\]]*)\])?\s*(?:\(((?:\s*"[^"]*"\s*,?)*)\))?\s*=', re.S)
+_TOKEN = re.compile(r'"([^"]*)"|(,)|([^\s,"]+)')
+_QUOTED = re.compile(rb'"[^"]*"')
+
+
+def _parse_value(raw: str):
+    """
+    Valor de una sentencia: lista de cadenas entre comillas separadas por comas
+    (dos cadenas seguidas sin coma se concatenan: así se parten las líneas largas)
+    o un valor sin comillas (DECIMALS=0). Siempre devuelve lista salvo en este último caso.
+    """
+    if '"' not in raw:
+        return raw.strip()
+    items, prev_quoted = [], False
+    for q, comma, bare in _TOKEN.findall(raw):
+        if comma:
+            prev_quoted = False
+        elif bare:
+            items.append(bare)
+            prev_quoted = False
+        elif prev_quoted:
+            items[-1] += q
+        else:
+            items.append(q)
+            prev_quoted = True
+    return items
+
+
+def _find_header(f, read_size: int = 1 << 20):
+    """Lee hasta DATA= y devuelve (sentencias en latin-1, offset en bytes del inicio de los datos)."""
+    buf, pos, stmts = "", 0, []
+    while True:
+        while True:
+            m = _DATA_KW.match(buf, pos)
+            if m:
+                return stmts, m.end()
+            m = _STATEMENT.match(buf, pos)
+            if not m:
+                break
+            stmts.append(buf[pos:m.end() - 1])
+            pos = m.end()
+        chunk = f.read(read_size)
+        if not chunk:
+            raise ValueError("Fichero PC-Axis sin bloque DATA=")
+        # latin-1 es 1 byte = 1 carácter: las posiciones del texto son offsets del fichero
+        buf += chunk.decode("latin-1")
+
+
+def _encoding(keywords: dict, encoding: str | None) -> str:
+    if encoding:
+        return encoding
+    codepage = keywords.get("CODEPAGE")
+    if codepage:
+        return codepage[0] if isinstance(codepage, list) else codepage
+    return DEFAULT_ENCODING
+
+
+def read_px_header(path, encoding: str | None = None) -> dict:
+    """
+    Metadatos del .px: {"keywords", "stub", "heading", "dims", "values", "codes",
+    "shape", "encoding", "data_offset"}. Las claves con idioma ([en]) se ignoran.
+    """
+    with open(path, "rb") as f:
+        stmts, data_offset = _find_header(f)
+
+    raw = []
+    for s in stmts:
+        m = _KEY.match(s)
+        if not m or m.group(2):  # sentencia no reconocida o traducción
+            continue
+        sub = tuple(re.findall(r'"([^"]*)"', m.group(3))) if m.group(3) is not None else None
+        raw.append((m.group(1).upper(), sub, s[m.end():]))
+
+    # primero CODEPAGE/CHARSET (en latin-1 siempre se pueden leer), luego el resto con su codificación
+    keywords = {k: _parse_value(v) for k, sub, v in raw if sub is None and k == "CODEPAGE"}
+    enc = _encoding(keywords, encoding)
+
+    def dec(v: str) -> str:
+        return v.encode("latin-1").decode(enc, errors="replace")
+
+    keywords, values, codes = {}, {}, {}
+    for k, sub, v in raw:
+        val = _parse_value(dec(v))
+        if sub:
+            target = values if k == "VALUES" else codes if k == "CODES" else None
+            if target is not None:
+                target[dec(sub[0])] = [x.strip() for x in val]
+            else:
+                keywords[(k, tuple(dec(x) for x in sub))] = val
+        else:
+            keywords[k] = val
+
+    stub = keywords.get("STUB", [])
+    heading = keywords.get("HEADING", [])
+    dims = list(stub) + list(heading)
+    missing = [d for d in dims if d not in values]
+    if missing:
+        raise ValueError(f"PC-Axis sin VALUES para {missing}")
+    return {
+        "keywords": keywords, "stub": list(stub), "heading": list(heading), "dims": dims,
+        "values": values, "codes": codes, "shape": tuple(len(values[d]) for d in dims),
+        "encoding": enc, "data_offset": data_offset,
+    }
+
+
+def iter_px_data(path, data_offset: int, chunk_size: int = 8 << 20):
+    """Valores de DATA como arrays float64 por trozos (símbolos entre comillas -> NaN)."""
+    with open(path, "rb") as f:
+        f.seek(data_offset)
+        tail = b""
+        while True:
+            chunk = f.read(chunk_size)
+            end = chunk.find(b";") if chunk else -1
+            done = not chunk or end >= 0
+            if end >= 0:
+                chunk = chunk[:end]
+            chunk = tail + chunk
+            if not done:
+                # no partir un número o un símbolo entre dos trozos
+                cut = max(chunk.rfind(b" "), chunk.rfind(b"\n"), chunk.rfind(b"\t"))
+                if cut < 0:
+                    tail = chunk
+                    continue
+                chunk, tail = chunk[:cut], chunk[cut:]
+            if b'"' in chunk:
+                chunk = _QUOTED.sub(b" nan ", chunk)
+            # separadores admitidos: espacio, tabulador, salto de línea y coma
+            tokens = chunk.replace(b",", b" ").split()
+            if tokens:
+                yield np.array(tokens, dtype=np.float64)
+            if done:
+                return
+
+
+def read_px(path, encoding: str | None = None, chunk_size: int = 8 << 20):
+    """(metadatos, valores float64 en orden plano STUB × HEADING)."""
+    meta = read_px_header(path, encoding)
+    n = int(np.prod(meta["shape"], dtype=np.int64))
+    out = np.empty(n, dtype=np.float64)
+    pos = 0
+    for arr in iter_px_data(path, meta["data_offset"], chunk_size):
+        if pos + len(arr) > n:
+            raise ValueError(f"DATA tiene más valores de los esperados ({n:,} = {meta['shape']})")
+        out[pos:pos + len(arr)] = arr
+        pos += len(arr)
+    if pos != n:
+        raise ValueError(f"DATA tiene {pos:,} valores, se esperaban {n:,} = {meta['shape']}")
+    return meta, out
+
+
+def px_to_frame(path, encoding: str | None = None, dropna: bool = True,
+                value_col: str = "valor", chunk_size: int = 8 << 20):
+    """
+    .px en formato largo: una columna Categorical por dimensión (STUB + HEADING, con
+    sus nombres originales) y `value_col` (float64). Con dropna=True no se generan
+    las filas sin dato.
+    """
+    import pandas as pd
+    meta, vals = read_px(path, encoding, chunk_size)
+    idx = np.flatnonzero(~np.isnan(vals)) if dropna else np.arange(len(vals), dtype=np.int64)
+
+    shape = meta["shape"]
+    strides = np.cumprod((1,) + shape[::-1])[:-1][::-1]
+    cols = {}
+    for dim, n, stride in zip(meta["dims"], shape, strides):
+        codes = (idx // stride) % n
+        cats = meta["values"][dim]
+        if len(set(cats)) == len(cats):
+            cols[dim] = pd.Categorical.from_codes(codes.astype(np.int32), categories=cats)
+        else:  # valores repetidos: Categorical no los admite
+            cols[dim] = np.asarray(cats, dtype=object)[codes]
+    cols[value_col] = vals[idx]
+    df = pd.DataFrame(cols)
+    df.attrs["px_meta"] = {k: meta[k] for k in ("stub", "heading", "shape", "encoding")}
+    return df
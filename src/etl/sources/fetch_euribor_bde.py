@@ -1,10 +1,10 @@
 # src/etl/sources/fetch_euribor_bde.py
 from pathlib import Path
-import sys
+import shutil, sys
 
 # Añadir src al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes
+from src.etl.sources._fetch_utils import download_cached
 
 try:
     sys.stdout.reconfigure(encoding='utf-8', errors='ignore')
@@ -18,10 +18,10 @@ URL = "https://www.bde.es/webbe/es/estadisticas/compartido/datos/csv/ti_1_7.csv"
 
 def main():
     print(f"⬇️ Descargando Euríbor (BdE) -> {OUT}")
-    b = download_bytes(URL, timeout=60)
-    if not b or len(b) < 1000:
+    path = download_cached(URL, timeout=60)
+    if path.stat().st_size < 1000:
         raise RuntimeError("Respuesta demasiado pequeña: ¿cambió el recurso del BdE?")
-    OUT.write_bytes(b)
+    shutil.copyfile(path, OUT)
     print(f"✅ Guardado: {OUT}")
 
 if __name__ == "__main__":
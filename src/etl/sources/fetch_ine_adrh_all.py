@@ -1,11 +1,28 @@
 # src/etl/sources/fetch_ine_adrh_all.py
+"""
+ADRH (renta por municipio, tabla 31277).
+
+1) API Tempus en streaming -> data_raw/ine/adrh_all.parquet (ver _ine_tempus)
+2) Si falla o no trae el país completo, CSV completo del INE (csv_bdsc / csv_bd)
+
+En los dos casos se escriben también los CSV de siempre (adrh_all_raw.csv y adrh_all.csv)
+con el mismo contenido y formato: sólo municipios (sin distritos ni secciones), sólo
+INDICADORES, municipio "44001 Ababuj" y periodo = año ("2021"). El Parquet de Tempus
+guarda la tabla tal cual.
+
+Uso:
+  python -m src.etl.sources.fetch_ine_adrh_all               # tabla completa
+  python -m src.etl.sources.fetch_ine_adrh_all --nult 2      # refresco: últimos 2 periodos
+  python -m src.etl.sources.fetch_ine_adrh_all --date 20220101:
+"""
 from __future__ import annotations
 from pathlib import Path
-import requests, pandas as pd, sys, time, unicodedata
+import argparse, pandas as pd, sys, unicodedata
 
 # Añadir src al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes, read_csv_auto_from_bytes
+from src.etl.sources._fetch_utils import download_cached, iter_csv_chunks
+from src.etl.sources._ine_tempus import tempus_url, stream_table_to_parquet, upsert_parquet, parquet_to_csv
 
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
@@ -13,7 +30,8 @@ except AttributeError:
     pass
 
 # Tabla correcta para MUNICIPIOS (ADRH): 31277
-API_JSON = "https://servicios.ine.es/wstempus/js/es/DATOS_TABLA/31277?tip=AM"
+TABLA = 31277
+API_JSON = tempus_url(TABLA)
 CSV_SC   = "https://www.ine.es/jaxiT3/files/t/csv_bdsc/31277.csv"  # ; separado
 CSV_TSV  = "https://www.ine.es/jaxiT3/files/t/csv_bd/31277.csv"    # \t separado
 
@@ -22,137 +40,175 @@ OUT_DIR = ROOT / "data_raw" / "ine"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_RAW = OUT_DIR / "adrh_all_raw.csv"
 OUT     = OUT_DIR / "adrh_all.csv"
+OUT_PARQUET = OUT_DIR / "adrh_all.parquet"
+OUT_CSV_PARQUET = OUT_DIR / "adrh_csv.parquet"  # ruta CSV: sólo municipios e INDICADORES
+
+# T3_Variable de Tempus -> columna
+DIMS = {"Municipios": "municipio", "Distritos": "distrito", "Secciones": "seccion",
+        "Indicadores de renta media y mediana": "indicador"}
+# Por debajo de esto la respuesta JSON se considera parcial y se usa el CSV
+MIN_PROVINCIAS = 50
+# Indicadores que se conservan del CSV completo (el resto se descarta al leer)
+INDICADORES = ("Renta neta media por persona", "Renta neta media por hogar")
 
 def norm_txt(s: str) -> str:
     s = unicodedata.normalize("NFKD", s)
     return "".join(ch for ch in s if not unicodedata.combining(ch)).strip().lower()
 
-def fetch_json(url: str):
-    for _ in range(2):
-        r = requests.get(url, timeout=180)
-        if r.ok:
-            return r.json()
-        time.sleep(1)
-    r.raise_for_status()
-    return []
-
-def json_to_df(rows: list[dict]) -> pd.DataFrame:
-    recs = []
-    for it in rows:
-        # Usar T3_Variable como clave, extraer nombre y código
-        meta = {}
-        for d in it.get("MetaData", []):
-            var_name = d.get("T3_Variable", "")
-            meta[var_name] = {
-                "nombre": d.get("Nombre", ""),
-                "codigo": d.get("Codigo", "")
-            }
-        
-        # Obtener municipio e indicador
-        muni_nombre = meta.get("Municipios", {}).get("nombre", "")
-        muni_codigo = meta.get("Municipios", {}).get("codigo", "")
-        indic_nombre = meta.get("Indicadores de renta media y mediana", {}).get("nombre", "")
-        
-        # Usar código como identificador principal (más robusto)
-        municipio = muni_codigo or muni_nombre
-        
-        for d in it.get("Data", []):
-            recs.append({
-                "municipio": municipio,
-                "indicador": indic_nombre,
-                "periodo": d.get("Fecha"),
-                "valor": d.get("Valor"),
-            })
-    return pd.DataFrame.from_records(recs)
-
-def read_csv_auto(url: str) -> pd.DataFrame:
-    try:
-        return pd.read_csv(url, sep=";", dtype=str, encoding="utf-8")
-    except Exception:
-        return pd.read_csv(url, sep="\t", dtype=str, encoding="utf-8")
-
-def main():
-    print(f"⬇️ ADRH (municipios) - Iterando por provincias...")
-    
-    # Lista de códigos de provincia (01-52)
-    provincias = [f"{i:02d}" for i in range(1, 53)]
-    
-    all_recs = []
-    provincias_ok = 0
-    provincias_fail = 0
-    
-    for prov in provincias:
-        # URL con filtro de provincia usando operación de filtro
-        # No existe un parámetro directo, así que iteramos tabla completa
-        # y filtramos localmente (más lento pero funcional)
-        pass
-    
+def _csv_compat(df: pd.DataFrame, indicadores=INDICADORES) -> pd.DataFrame:
+    """Lote del Parquet de Tempus -> mismas filas y columnas que filtrar_chunk en la ruta CSV."""
+    mask = df["municipio_codigo"].fillna("").str.strip().str.fullmatch(r"\d{5}")
+    for c in ("distrito_codigo", "seccion_codigo"):
+        if c in df.columns:
+            mask &= df[c].isna() | (df[c].str.strip() == "")
+    if indicadores:
+        mask &= df["indicador"].str.strip().str.lower().isin({i.lower() for i in indicadores})
+    df = df.loc[mask & df["valor"].notna() & df["anyo"].notna()]
+    cod, nombre = df["municipio_codigo"].str.strip(), df["municipio"].fillna("").str.strip()
+    return pd.DataFrame({
+        # "44001 Ababuj", como en el CSV del INE (salvo que el nombre ya traiga el código)
+        "municipio": nombre.where(nombre.str.match(r"\d{5}\b"), cod + " " + nombre).str.strip(),
+        "municipio_codigo": cod,
+        "indicador": df["indicador"].str.strip(),
+        "periodo": df["anyo"].astype("int64").astype(str),
+        "valor": df["valor"],
+    })
+
+def fetch_tempus(nult: int | None = None, date: str | None = None) -> bool:
+    """Tempus en streaming -> OUT_PARQUET (+ CSV). False si la respuesta no cubre el país."""
+    url = tempus_url(TABLA, nult=nult, date=date)
+    incremental = bool(nult or date) and OUT_PARQUET.exists()
+    destino = OUT_PARQUET.with_name("adrh_refresh.parquet") if incremental else OUT_PARQUET
+    print(f"   Tempus JSON (streaming): {url}")
+    st = stream_table_to_parquet(url, destino, DIMS)
+    print(f"   ✅ {st['series']:,} series, {st['filas']:,} filas en {st['lotes']} lotes")
+
+    import pyarrow.parquet as pq
+    provs = pq.read_table(destino, columns=["municipio_codigo"]).column(0).to_pandas().str[:2].nunique()
+    if provs < MIN_PROVINCIAS:
+        print(f"   ⚠️  Tempus sólo trae {provs} provincias (<{MIN_PROVINCIAS})")
+        destino.unlink(missing_ok=True)
+        return False
+    if incremental:
+        n = upsert_parquet(destino, OUT_PARQUET)
+        destino.unlink(missing_ok=True)
+        print(f"   ♻️  Fusionado con el histórico: {n:,} filas")
+
+    cols = [c for c in ("municipio", "municipio_codigo", "distrito_codigo", "seccion_codigo",
+                        "indicador", "anyo", "valor") if c in pq.read_schema(OUT_PARQUET).names]
+    n = parquet_to_csv(OUT_PARQUET, OUT_RAW, {c: c for c in cols},
+                       transform=lambda d: _csv_compat(d)[["municipio", "indicador", "periodo", "valor"]])
+    print(f"🧾 RAW ADRH: {OUT_RAW} ({n:,} filas)")
+    n = parquet_to_csv(OUT_PARQUET, OUT, {c: c for c in cols},
+                       transform=lambda d: _csv_compat(d)[["municipio", "periodo", "valor"]])
+    print(f"✅ ADRH: {OUT} ({n:,} filas)")
+    return True
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="ADRH (renta por municipio, INE 31277)")
+    ap.add_argument("--nult", type=int, help="Sólo los últimos N periodos (se fusiona con adrh_all.parquet)")
+    ap.add_argument("--date", help="Filtro de fechas de Tempus, p.ej. 20220101: o 20200101:20231231")
+    ap.add_argument("--csv", action="store_true", help="Ir directamente al CSV completo")
+    args = ap.parse_args(argv)
+
+    print(f"⬇️ ADRH (municipios)")
+    if not args.csv:
+        try:
+            if fetch_tempus(nult=args.nult, date=args.date):
+                return
+        except Exception as e:
+            print(f"   ⚠️  Tempus falló ({e})")
+
     # Como la API no permite filtrar por provincia, usamos CSV completo
     print(f"   Intentando CSV completo (más lento pero completo)...")
-    
-    try:
-        # Intentar con CSV semicolon
-        df = pd.read_csv(CSV_SC, sep=";", dtype=str, encoding="ISO-8859-1", on_bad_lines="skip")
-        print(f"   ✅ CSV descargado: {len(df):,} filas")
-    except Exception as e:
-        print(f"   ⚠️  CSV semicolon falló ({e}), pruebo TSV...")
-        try:
-            df = pd.read_csv(CSV_TSV, sep="\t", dtype=str, encoding="ISO-8859-1", on_bad_lines="skip")
-            print(f"   ✅ CSV descargado: {len(df):,} filas")
-        except Exception as e2:
-            print(f"   ❌ Ambos CSVs fallaron")
-            raise RuntimeError(f"No se pudo descargar ADRH: {e2}")
-    
-    # Mostrar columnas para debug
-    print(f"   Columnas: {list(df.columns[:10])}")
-    
-    # Normalizar nombres de columnas
-    cols_norm = {norm_txt(c): c for c in df.columns}
-    
-    # Buscar columnas clave
-    c_muni = None
-    c_ind = None
-    c_per = None
-    c_val = None
-    
-    for k, v in cols_norm.items():
+    fetch_csv()
+
+def _columnas(cols) -> dict:
+    """Columna original -> nombre estándar (municipio, distrito, seccion, indicador, periodo, valor)."""
+    found = {}
+    for c in cols:
+        k = norm_txt(c)
         if "municipio" in k:
-            c_muni = v
+            found["municipio"] = c
+        elif "distrito" in k:
+            found["distrito"] = c
+        elif "seccion" in k:
+            found["seccion"] = c
         elif "indicador" in k or "renta" in k:
-            c_ind = v
+            found["indicador"] = c
         elif "periodo" in k or "año" in k or "ano" in k:
-            c_per = v
+            found["periodo"] = c
         elif k in ("total", "valor", "value"):
-            c_val = v
-    
-    if not all([c_muni, c_per, c_val]):
-        print(f"   ❌ No encuentro columnas clave.")
-        print(f"      Municipio: {c_muni}, Indicador: {c_ind}, Periodo: {c_per}, Valor: {c_val}")
-        raise RuntimeError(f"Columnas no encontradas en CSV")
-    
-    # Renombrar
-    rename_map = {c_muni: "municipio", c_per: "periodo", c_val: "valor"}
-    if c_ind:
-        rename_map[c_ind] = "indicador"
-    
-    df = df.rename(columns=rename_map)
-    
-    # Si no hay columna indicador, crear una genérica
-    if "indicador" not in df.columns:
-        df["indicador"] = "Renta media"
-    
-    # Limpiar
-    df["valor"] = pd.to_numeric(df["valor"].str.replace(",", "."), errors="coerce")
-    df = df.dropna(subset=["valor", "municipio"])
-    
-    # Guardar RAW
-    df[["municipio", "indicador", "periodo", "valor"]].to_csv(OUT_RAW, index=False)
-    print(f"🧾 RAW ADRH: {OUT_RAW} ({len(df):,} filas, {df['municipio'].nunique()} municipios)")
-    
-    # Versión simplificada
-    out = df[["municipio", "periodo", "valor"]].copy()
-    out.to_csv(OUT, index=False)
-    print(f"✅ ADRH: {OUT} ({len(out):,} filas)")
+            found["valor"] = c
+    return found
+
+def filtrar_chunk(df: pd.DataFrame, cols: dict, indicadores=INDICADORES) -> pd.DataFrame:
+    """Filas de municipio (sin distrito ni sección) de los indicadores pedidos, con valor numérico."""
+    # primero lo barato: en el CSV ~96% de las filas son de distrito/sección
+    mask = pd.Series(True, index=df.index)
+    for c in ("distrito", "seccion"):
+        if c in cols:
+            mask &= df[cols[c]].isna() | (df[cols[c]] == "")
+    df = df.loc[mask]
+    if "indicador" in cols and indicadores:
+        wanted = {i.lower() for i in indicadores}
+        df = df.loc[df[cols["indicador"]].str.strip().str.lower().isin(wanted)]
+
+    out = pd.DataFrame({
+        "municipio": df[cols["municipio"]].str.strip(),
+        "indicador": df[cols["indicador"]].str.strip() if "indicador" in cols else "Renta media",
+        "periodo": df[cols["periodo"]].str.strip(),
+        "valor": pd.to_numeric(df[cols["valor"]].str.replace(",", ".", regex=False), errors="coerce"),
+    })
+    # "44001 Ababuj" -> código INE aparte
+    out.insert(1, "municipio_codigo", out["municipio"].str.extract(r"^(\d{5})\b", expand=False))
+    return out.dropna(subset=["valor", "municipio"])
+
+def fetch_csv(indicadores=INDICADORES):
+    """
+    CSV completo por bloques: se filtra al leer (fuera distritos/secciones e
+    indicadores no usados) y se escribe a OUT_CSV_PARQUET por lotes, así la
+    memoria depende del tamaño de bloque y no de la tabla (~millones de filas).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([("municipio", pa.string()), ("municipio_codigo", pa.string()),
+                        ("indicador", pa.string()), ("periodo", pa.string()), ("valor", pa.float64())])
+    ultimo_error = None
+    for url in (CSV_SC, CSV_TSV):
+        tmp = OUT_CSV_PARQUET.with_name(OUT_CSV_PARQUET.name + ".tmp")
+        leidas = escritas = 0
+        try:
+            path = download_cached(url, timeout=300)
+            with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+                cols = None
+                for chunk in iter_csv_chunks(path, source=url):
+                    if cols is None:
+                        # Mostrar columnas para debug
+                        print(f"   Columnas: {list(chunk.columns[:10])}")
+                        cols = _columnas(chunk.columns)
+                        if not all(k in cols for k in ("municipio", "periodo", "valor")):
+                            raise RuntimeError(f"Columnas no encontradas en CSV: {cols}")
+                    out = filtrar_chunk(chunk, cols, indicadores)
+                    leidas += len(chunk); escritas += len(out)
+                    if len(out):
+                        writer.write_table(pa.Table.from_pandas(out, schema=schema, preserve_index=False))
+            tmp.replace(OUT_CSV_PARQUET)
+            print(f"   ✅ CSV {url}: {leidas:,} filas leídas -> {escritas:,} de municipio ({OUT_CSV_PARQUET.name})")
+            break
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            ultimo_error = e
+            print(f"   ⚠️  CSV {url} falló ({e})")
+    else:
+        print(f"   ❌ Ambos CSVs fallaron")
+        raise RuntimeError(f"No se pudo descargar ADRH: {ultimo_error}")
+
+    # Guardar RAW y versión simplificada (mismas columnas que antes)
+    n = parquet_to_csv(OUT_CSV_PARQUET, OUT_RAW, {c: c for c in ("municipio", "indicador", "periodo", "valor")})
+    print(f"🧾 RAW ADRH: {OUT_RAW} ({n:,} filas)")
+    n = parquet_to_csv(OUT_CSV_PARQUET, OUT, {c: c for c in ("municipio", "periodo", "valor")})
+    print(f"✅ ADRH: {OUT} ({n:,} filas)")
 
 if __name__ == "__main__":
     main()
@@ -5,7 +5,8 @@ Descarga ADRH completo en formato PC-Axis (.px) y convierte a CSV.
 El formato PC-Axis es el único que el INE proporciona con datos completos
 de todos los municipios de España. Las APIs REST y CSVs están pre-filtrados.
 
-Requiere: pip install pyaxis
+El .px se lee con el lector nativo de _pcaxis (cabecera una vez, DATA por trozos
+a arrays NumPy); no hace falta pyaxis.
 """
 from __future__ import annotations
 from pathlib import Path
@@ -13,7 +14,8 @@ import pandas as pd
 import sys
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes
+from src.etl.sources._fetch_utils import download_to_file
+from src.etl.sources._pcaxis import px_to_frame
 
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
@@ -38,9 +40,9 @@ def main():
     # 1. Descargar archivo .px
     print(f"   Descargando {PX_URL}...")
     try:
-        px_bytes = download_bytes(PX_URL, timeout=300, retries=3)
-        OUT_PX.write_bytes(px_bytes)
-        print(f"   ✅ Descargado: {OUT_PX} ({len(px_bytes):,} bytes)")
+        # streaming a disco; si se corta se reanuda desde adrh_all.px.part
+        info = download_to_file(PX_URL, OUT_PX, timeout=300, retries=3)
+        print(f"   ✅ Descargado: {OUT_PX} ({info['size']:,} bytes, sha256 {info['sha256'][:12]})")
     except Exception as e:
         print(f"   ❌ Error descargando: {e}")
         raise
@@ -48,16 +50,9 @@ def main():
     # 2. Convertir .px a DataFrame
     print(f"   Convirtiendo PC-Axis a CSV...")
     try:
-        import pyaxis
-        px = pyaxis.parse(str(OUT_PX), encoding='ISO-8859-15')
-        df = px['DATA']
-        print(f"   ✅ Convertido: {len(df):,} filas")
-    except ImportError:
-        print(f"\n   ❌ ERROR: pyaxis no está instalado")
-        print(f"   ℹ️  Instala con: pip install pyaxis")
-        print(f"   ℹ️  El archivo .px se descargó correctamente en: {OUT_PX}")
-        print(f"   ℹ️  Puedes convertirlo manualmente después de instalar pyaxis")
-        return
+        # formato largo, sin las celdas ".."/"." (valor NaN)
+        df = px_to_frame(OUT_PX)
+        print(f"   ✅ Convertido: {len(df):,} filas ({' × '.join(map(str, df.attrs['px_meta']['shape']))} celdas)")
     except Exception as e:
         print(f"   ❌ Error convirtiendo: {e}")
         raise
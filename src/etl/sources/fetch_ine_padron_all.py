@@ -19,14 +19,18 @@ import os
 import sys
 from pathlib import Path
 import pandas as pd
-import requests
 
 # Añadir src/ al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from src.etl.sources._ine_tempus import tempus_url, stream_table_to_parquet, parquet_to_csv
 
 OUT_DIR = Path(__file__).resolve().parents[3] / "data_raw" / "ine"
 OUT_RAW = OUT_DIR / "padron_all_raw.csv"
 OUT_AGG = OUT_DIR / "padron_all.csv"
+OUT_PARQUET = OUT_DIR / "padron_all.parquet"
+
+# T3_Variable de Tempus -> columna
+DIMS = {"Municipios": "municipio", "Sexo": "sexo", "Totales de edad": "edad"}
 
 
 def main():
@@ -47,8 +51,7 @@ def main():
     print("      c) Municipios → 'Seleccionar todos' (8,132)")
     print("      d) Descargar formato 'PC-Axis' (.px)")
     print("      e) Guardar como: data_raw/ine/padron_manual.px")
-    print("      f) Instalar: pip install pyaxis")
-    print("      g) Parsear con: pyaxis.parse('padron_manual.px')")
+    print("      f) Parsear con: src.etl.sources._pcaxis.px_to_frame('padron_manual.px')")
     
     print("\n   2️⃣ USAR DATOS YA DESCARGADOS")
     print("      Si ya tenemos padron_all.csv de descarga previa,")
@@ -81,49 +84,27 @@ def main():
     # Descargar datos de A Coruña como placeholder
     print("\n📥 Descargando datos parciales (A Coruña) como placeholder...")
     
-    url = "https://servicios.ine.es/wstempus/js/es/DATOS_TABLA/33775?tip=AM"
-    r = requests.get(url, timeout=180)
-    r.raise_for_status()
-    data = r.json()
-    
-    print(f"   Items recibidos: {len(data):,}")
-    
-    # Procesar JSON
-    recs = []
-    for item in data:
-        meta = {d["T3_Variable"]: {
-            "nombre": d.get("Nombre", ""),
-            "codigo": d.get("Codigo", "")
-        } for d in item.get("MetaData", [])}
-        
-        if "Municipios" not in meta:
-            continue
-        
-        municipio_codigo = meta["Municipios"]["codigo"]
-        municipio_nombre = meta["Municipios"]["nombre"]
-        
-        for d in item.get("Data", []):
-            recs.append({
-                "municipio_codigo": municipio_codigo,
-                "municipio": municipio_nombre,
-                "sexo": meta.get("Sexo", {}).get("nombre", ""),
-                "edad": meta.get("Totales de edad", {}).get("nombre", ""),
-                "periodo": d.get("Fecha", ""),
-                "valor": d.get("Valor", ""),
-            })
-    
-    df = pd.DataFrame.from_records(recs)
-    print(f"   Registros procesados: {len(df):,}")
-    
-    # Guardar RAW
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-    df.to_csv(OUT_RAW, index=False, encoding="utf-8")
-    print(f"   📄 RAW guardado: {OUT_RAW} ({len(df):,} filas)")
-    
-    # Agregar por municipio×periodo (población total)
-    df_agg = (df
-              .groupby(["municipio_codigo", "municipio", "periodo"], as_index=False)
-              .agg({"valor": "sum"}))
+    # JSON en streaming -> Parquet por lotes (no se carga la respuesta entera)
+    url = tempus_url(33775)
+    st = stream_table_to_parquet(url, OUT_PARQUET, DIMS)
+    print(f"   Items recibidos: {st['series']:,}")
+    print(f"   Registros procesados: {st['filas']:,} ({st['lotes']} lotes) -> {OUT_PARQUET}")
+    
+    # Guardar RAW (sólo series con municipio)
+    cols = {c: c for c in ("municipio_codigo", "municipio", "sexo", "edad", "periodo", "valor")}
+    n = parquet_to_csv(OUT_PARQUET, OUT_RAW, cols,
+                       transform=lambda d: d[d["municipio_codigo"].fillna("") != ""])
+    print(f"   📄 RAW guardado: {OUT_RAW} ({n:,} filas)")
+    
+    # Agregar por municipio×periodo (población total), en Arrow sobre las columnas justas
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    t = pq.read_table(OUT_PARQUET, columns=["municipio_codigo", "municipio", "periodo", "valor"])
+    t = t.filter(pc.not_equal(t["municipio_codigo"], ""))
+    df_agg = (t.group_by(["municipio_codigo", "municipio", "periodo"]).aggregate([("valor", "sum")])
+              .to_pandas().rename(columns={"valor_sum": "valor"})
+              .sort_values(["municipio_codigo", "municipio", "periodo"], ignore_index=True))
+    df_agg["valor"] = df_agg["valor"].fillna(0)
     
     df_agg.to_csv(OUT_AGG, index=False, encoding="utf-8")
     print(f"   📊 AGREGADO guardado: {OUT_AGG} ({len(df_agg):,} filas)")
@@ -7,19 +7,27 @@ Cada provincia tiene su propia tabla con todos sus municipios.
 
 Estrategia:
 1. Mapear código provincia → tabla INE
-2. Para cada provincia, descargar CSV desde endpoint de descarga
-3. Consolidar todos los CSVs en un único archivo
+2. Descargar los CSV de las provincias en paralelo (hilos con una Session
+   keep-alive compartida y un token bucket con las peticiones/segundo del INE)
+3. Consolidar todos los CSVs en un único archivo (en orden de provincia)
+
+Uso:
+  python -m src.etl.sources.fetch_ine_padron_provincias [--workers 8] [--rate 4]
 """
+import argparse
+import json
 import os
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import numpy as np
 import pandas as pd
-import requests
-import time
-from io import StringIO
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes, read_csv_auto_from_bytes
+from src.etl.sources._fetch_utils import (download_cached, read_csv_auto, make_session,
+                                          TokenBucket, OfflineCacheMiss, load_fetch_limits)
 
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
@@ -31,6 +39,10 @@ OUT_DIR = ROOT / "data_raw" / "ine"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_RAW = OUT_DIR / "padron_all_raw.csv"
 OUT_AGG = OUT_DIR / "padron_all.csv"
+OUT_REPORT = OUT_DIR / "padron_provincias_report.json"
+
+INE_HOST = "ine.es"
+INTENTOS_PROVINCIA = 3
 
 # Mapeo provincia → código de tabla INE
 # Verificados manualmente desde: https://www.ine.es/dynt3/inebase/index.htm?padre=6225&capsel=6225
@@ -94,12 +106,14 @@ PROVINCIAS_TABLAS = {
 }
 
 
-def descargar_provincia_csv(codigo_tabla: str, provincia_nombre: str) -> pd.DataFrame:
+def descargar_provincia_csv(codigo_tabla: str, provincia_nombre: str, session=None, rate_limiter=None,
+                            retries: int = 3) -> pd.DataFrame:
     """
     Descarga el CSV de una provincia desde el endpoint de exportación del INE.
     
     URL patrón: https://www.ine.es/jaxiT3/dlgExport.htm?t={tabla}&L=0&nocab=1
     Formato: CSV separado por punto y coma (;)
+    `retries` son los intentos de la descarga; procesar_provincia pasa 1 porque ya reintenta.
     """
     # URL del diálogo de exportación
     url = f"https://www.ine.es/jaxiT3/dlgExport.htm?t={codigo_tabla}&L=0&nocab=1"
@@ -109,14 +123,35 @@ def descargar_provincia_csv(codigo_tabla: str, provincia_nombre: str) -> pd.Data
     url_csv = f"https://www.ine.es/jaxiT3/files/t/csv_bdsc/{codigo_tabla}.csv"
     
     try:
-        csv_bytes = download_bytes(url_csv, timeout=60, retries=3)
-        df = read_csv_auto_from_bytes(csv_bytes)
+        path = download_cached(url_csv, timeout=60, retries=retries, session=session, rate_limiter=rate_limiter)
+        df = read_csv_auto(path, source=url_csv)
         return df
     except Exception as e:
         print(f"      ❌ Error: {e}")
         raise
 
 
+_RE_CODIGO = re.compile(r'^\d{5}(?:\s|$)')
+_RE_PREFIJO = re.compile(r'^\d{5}\s+')
+
+
+def _a_numerico(valores: np.ndarray):
+    """
+    Como pd.to_numeric(errors='coerce') pero con conversión directa de numpy cuando todo es
+    entero o texto. Los reales (1234.7) nunca pasan por astype(int64), que los truncaría.
+    """
+    if valores.dtype.kind in 'iu':
+        return valores.astype(np.int64)
+    if valores.dtype.kind in 'OUS' and pd.api.types.infer_dtype(valores, skipna=False) in ('integer', 'string'):
+        # "1234" -> int; "1234.7" falla en int() y pasa a float
+        for dtype in (np.int64, np.float64):
+            try:
+                return valores.astype(dtype)
+            except (ValueError, TypeError, OverflowError):
+                continue
+    return pd.to_numeric(valores, errors='coerce')
+
+
 def normalizar_padron_df(df: pd.DataFrame, codigo_prov: str) -> pd.DataFrame:
     """
     Normaliza el DataFrame del Padrón a formato estándar:
@@ -145,122 +180,140 @@ def normalizar_padron_df(df: pd.DataFrame, codigo_prov: str) -> pd.DataFrame:
         elif 'total' in col_lower or 'valor' in col_lower or 'población' in col_lower:
             col_valor = col
     
+    # Varias columnas con nombre de año = formato wide (antes la última se tomaba
+    # como columna periodo y la tabla se quedaba sin valores)
+    cols_anyo = [c for c in df.columns if c.isdigit() or any(str(year) in c for year in range(2000, 2030))]
+    if col_periodo in cols_anyo and len(cols_anyo) > 1:
+        col_periodo = None
+    
     if not col_municipio:
         # Si no hay columna de municipio, intentar detectar por índice
         # Muchas veces la primera columna es el municipio
         col_municipio = df.columns[0]
     
-    # Crear DataFrame normalizado
-    resultado = []
-    
-    # Si el formato es wide (periodos como columnas)
+    # Todo vectorizado: sin iterrows ni un dict por celda. Las operaciones de texto
+    # se hacen una vez por valor distinto (municipios y periodos se repiten mucho)
+    # y se reparten a las filas con los códigos de factorize
+    m_codes, m_uniq = pd.factorize(df[col_municipio], use_na_sentinel=False)
+    nombres = [str(u).strip() for u in m_uniq]
+    # Código de municipio: formato "99999 Nombre" (5 dígitos seguidos de espacio o fin)
+    codigos = np.array([n[:5] if _RE_CODIGO.match(n) else None for n in nombres], dtype=object)
+    # Limpiar nombres de municipio (quitar código si estaba incluido)
+    limpios = np.array([_RE_PREFIJO.sub('', n) for n in nombres], dtype=object)
+
     if col_periodo is None:
-        # Buscar columnas que parezcan años
-        cols_periodo = [c for c in df.columns if c.isdigit() or any(str(year) in str(c) for year in range(2000, 2030))]
-        
-        if cols_periodo:
-            for _, row in df.iterrows():
-                municipio = str(row[col_municipio]).strip()
-                
-                for periodo_col in cols_periodo:
-                    valor = row[periodo_col]
-                    
-                    # Extraer año del nombre de columna
-                    periodo = ''.join(c for c in str(periodo_col) if c.isdigit())
-                    
-                    if pd.notna(valor) and valor != '':
-                        resultado.append({
-                            'municipio': municipio,
-                            'periodo': periodo,
-                            'valor': valor
-                        })
+        # Formato wide (periodos como columnas): buscar columnas que parezcan años
+        cols_periodo = [c for c in df.columns if c != col_municipio and
+                        (c.isdigit() or any(str(year) in str(c) for year in range(2000, 2030)))]
+        # wide -> long fila a fila (mismo orden que recorrer filas y luego periodos):
+        # municipio repetido, periodos en mosaico y valores aplanados en orden C
+        k = len(cols_periodo)
+        filas = np.repeat(m_codes, k)
+        # Extraer año del nombre de columna
+        p_uniq = np.array([''.join(ch for ch in str(c) if ch.isdigit()) for c in cols_periodo], dtype=object)
+        p_codes = np.tile(np.arange(k), len(df))
+        valores = df[cols_periodo].to_numpy(dtype=object).ravel()
     else:
         # Formato long (una columna periodo)
-        for _, row in df.iterrows():
-            municipio = str(row[col_municipio]).strip()
-            periodo = str(row[col_periodo]).strip() if col_periodo else ''
-            valor = row[col_valor] if col_valor else ''
-            
-            if pd.notna(valor) and valor != '':
-                resultado.append({
-                    'municipio': municipio,
-                    'periodo': periodo,
-                    'valor': valor
-                })
-    
-    df_norm = pd.DataFrame(resultado)
-    
-    # Añadir código de municipio (extraído del nombre si está en formato "99999 NombreMunicipio")
-    # O generado a partir del código de provincia
-    if 'municipio_codigo' not in df_norm.columns:
-        def extraer_codigo(nombre):
-            # Intentar extraer código del formato "99999 Nombre"
-            partes = str(nombre).split()
-            if partes and partes[0].isdigit() and len(partes[0]) == 5:
-                return partes[0]
-            return None
-        
-        df_norm['municipio_codigo'] = df_norm['municipio'].apply(extraer_codigo)
-    
-    # Limpiar nombres de municipio (quitar código si estaba incluido)
-    df_norm['municipio'] = df_norm['municipio'].str.replace(r'^\d{5}\s+', '', regex=True)
-    
-    # Convertir valor a numérico
-    df_norm['valor'] = pd.to_numeric(df_norm['valor'], errors='coerce')
+        filas = m_codes
+        p_codes, p_uniq = pd.factorize(df[col_periodo], use_na_sentinel=False)
+        p_uniq = np.array([str(u).strip() for u in p_uniq], dtype=object)
+        valores = df[col_valor].to_numpy(dtype=object) if col_valor else np.full(len(df), None, dtype=object)
+
+    # Celdas vacías fuera antes de convertir (así 'valor' sigue siendo entero si lo es)
+    keep = pd.notna(valores) & (valores != '')
+    filas, p_codes = filas[keep], p_codes[keep]
+    df_norm = pd.DataFrame({
+        'municipio': limpios[filas] if len(limpios) else np.array([], dtype=object),
+        'periodo': p_uniq[p_codes] if len(p_uniq) else np.array([], dtype=object),
+        # Convertir valor a numérico
+        'valor': _a_numerico(valores[keep]),
+        'municipio_codigo': codigos[filas] if len(codigos) else np.array([], dtype=object),
+    })
     df_norm = df_norm.dropna(subset=['valor'])
     
     return df_norm
 
 
-def main():
+def procesar_provincia(codigo_prov: str, info: dict, session, rate_limiter, intentos: int = INTENTOS_PROVINCIA) -> dict:
+    """
+    Descarga + normaliza una provincia. Única capa de reintentos (red y parseo): la descarga
+    se pide con retries=1, así son como mucho `intentos` peticiones por provincia. Nunca lanza.
+    """
+    nombre, tabla = info["nombre"], info["tabla"]
+    t0 = time.perf_counter()
+    error = None
+    for intento in range(1, intentos + 1):
+        try:
+            df = descargar_provincia_csv(tabla, nombre, session=session, rate_limiter=rate_limiter, retries=1)
+            df_norm = normalizar_padron_df(df, codigo_prov)
+            if len(df_norm) == 0:
+                error = "Sin datos tras normalizar"
+                break  # reintentar no cambia el contenido
+            return {"codigo": codigo_prov, "nombre": nombre, "tabla": tabla, "df": df_norm,
+                    "filas_raw": len(df), "intentos": intento, "segundos": round(time.perf_counter() - t0, 2)}
+        except OfflineCacheMiss as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if intento < intentos:
+                time.sleep(2 * intento)
+    return {"codigo": codigo_prov, "nombre": nombre, "tabla": tabla, "df": None, "error": error,
+            "intentos": intento, "segundos": round(time.perf_counter() - t0, 2)}
+
+
+def main(argv=None):
+    limits = load_fetch_limits()
+    ap = argparse.ArgumentParser(description="Padrón municipal por provincias (INE)")
+    ap.add_argument("--workers", type=int, default=8, help="Descargas simultáneas")
+    ap.add_argument("--rate", type=float, default=float(limits.get("rate_per_host", {}).get(INE_HOST, 4)),
+                    help="Peticiones por segundo contra el INE (token bucket)")
+    args = ap.parse_args(argv)
+
     print("⬇️ Padrón Municipal - Descarga por provincias")
     print("=" * 70)
-    print(f"   Total provincias: {len(PROVINCIAS_TABLAS)}")
-    
-    all_dfs = []
-    provincias_ok = 0
-    provincias_error = []
-    provincias_pendientes = []
+    print(f"   Total provincias: {len(PROVINCIAS_TABLAS)}  (workers={args.workers}, {args.rate:g} req/s)")
     
-    for codigo_prov, info in PROVINCIAS_TABLAS.items():
-        nombre = info["nombre"]
-        tabla = info["tabla"]
-        
-        if tabla is None:
-            provincias_pendientes.append((codigo_prov, nombre))
-            continue
-        
-        print(f"\n📥 [{codigo_prov}] {nombre} (tabla {tabla})")
-        
-        try:
-            df = descargar_provincia_csv(tabla, nombre)
-            print(f"   ✅ Descargado: {len(df):,} filas, {len(df.columns)} columnas")
-            
-            # Normalizar
-            df_norm = normalizar_padron_df(df, codigo_prov)
-            print(f"   ✅ Normalizado: {len(df_norm):,} registros")
-            
-            if len(df_norm) > 0:
-                all_dfs.append(df_norm)
-                provincias_ok += 1
+    provincias_pendientes = [(c, i["nombre"]) for c, i in PROVINCIAS_TABLAS.items() if i["tabla"] is None]
+    tareas = {c: i for c, i in PROVINCIAS_TABLAS.items() if i["tabla"] is not None}
+
+    session = make_session(pool_size=args.workers)
+    bucket = TokenBucket(args.rate)
+    resultados = {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futs = [ex.submit(procesar_provincia, c, i, session, bucket) for c, i in tareas.items()]
+        for fut in as_completed(futs):
+            r = fut.result()
+            resultados[r["codigo"]] = r
+            if r["df"] is not None:
+                print(f"   ✅ [{r['codigo']}] {r['nombre']} (tabla {r['tabla']}): {r['filas_raw']:,} filas -> "
+                      f"{len(r['df']):,} registros ({r['segundos']}s, intento {r['intentos']})")
             else:
-                print(f"   ⚠️  Sin datos normalizados")
-                provincias_error.append((codigo_prov, nombre, "Sin datos tras normalizar"))
-            
-            # Rate limit: esperar 1 segundo entre peticiones
-            time.sleep(1)
-            
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            provincias_error.append((codigo_prov, nombre, str(e)))
-            continue
+                print(f"   ❌ [{r['codigo']}] {r['nombre']} (tabla {r['tabla']}): {r['error'][:80]}")
+    session.close()
+
+    # Orden determinista (por código de provincia), igual que la descarga secuencial
+    ok = [resultados[c] for c in sorted(resultados) if resultados[c]["df"] is not None]
+    provincias_error = [(c, resultados[c]["nombre"], resultados[c]["error"])
+                        for c in sorted(resultados) if resultados[c]["df"] is None]
+    all_dfs = [r["df"] for r in ok]
+    provincias_ok = len(ok)
+
+    OUT_REPORT.write_text(json.dumps({
+        "segundos": round(time.perf_counter() - t0, 2),
+        "ok": [{k: v for k, v in r.items() if k != "df"} for r in ok],
+        "error": [{k: v for k, v in resultados[c].items() if k != "df"} for c, _, _ in provincias_error],
+        "sin_tabla": [c for c, _ in provincias_pendientes],
+    }, indent=1, ensure_ascii=False), encoding="utf-8")
     
     # Consolidar todos los DataFrames
     print("\n" + "=" * 70)
-    print(f"📊 CONSOLIDACIÓN")
+    print(f"📊 CONSOLIDACIÓN ({time.perf_counter() - t0:.1f}s)")
     print(f"   Provincias OK: {provincias_ok}/{len(PROVINCIAS_TABLAS)}")
     print(f"   Provincias pendientes: {len(provincias_pendientes)}")
-    
+    print(f"   Informe: {OUT_REPORT}")
     if provincias_error:
         print(f"\n   ⚠️  Provincias con errores ({len(provincias_error)}):")
         for cod, nom, err in provincias_error[:10]:  # Mostrar solo las primeras 10
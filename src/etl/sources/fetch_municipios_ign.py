@@ -3,18 +3,17 @@ import zipfile, sys, re
 
 # Añadir src al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes
+from src.etl.sources._fetch_utils import download_cached
 
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
 except AttributeError:
     pass
 
-def try_extract_zip_bytes(b: bytes, out_dir: Path):
-    # Try to open the bytes as a zipfile
+def try_extract_zip(path: Path, out_dir: Path):
+    # Try to open the downloaded file as a zipfile (se lee del disco, no se carga en memoria)
     try:
-        import io
-        with zipfile.ZipFile(io.BytesIO(b)) as zf:
+        with zipfile.ZipFile(path) as zf:
             zf.extractall(out_dir)
         return True
     except zipfile.BadZipFile:
@@ -45,19 +44,20 @@ def main():
     for url in candidate_urls:
         try:
             print(f"⬇️ Intentando {url}")
-            b = download_bytes(url, timeout=60)
-            # If bytes look like a zip, extract
-            if try_extract_zip_bytes(b, out_dir):
+            path = download_cached(url, timeout=60)
+            # If the file looks like a zip, extract
+            if try_extract_zip(path, out_dir):
                 print(f"✅ Extraído correctamente desde {url}")
                 return
-            # If not a zip, maybe it's an HTML page pointing to a true ZIP
-            text = b.decode("utf-8", errors="ignore")
+            # If not a zip, maybe it's an HTML page pointing to a true ZIP (basta con el principio)
+            with open(path, "rb") as f:
+                text = f.read(1 << 20).decode("utf-8", errors="ignore")
             zip_link = find_zip_in_html(text)
             if zip_link:
                 print(f"ℹ️ Encontrado link a ZIP en HTML: {zip_link}")
                 try:
-                    b2 = download_bytes(zip_link, timeout=60)
-                    if try_extract_zip_bytes(b2, out_dir):
+                    path2 = download_cached(zip_link, timeout=60)
+                    if try_extract_zip(path2, out_dir):
                         print(f"✅ Extraído correctamente desde {zip_link}")
                         return
                 except Exception as e:
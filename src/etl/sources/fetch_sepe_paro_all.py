@@ -1,10 +1,10 @@
 # src/etl/sources/fetch_sepe_paro_all.py
 from pathlib import Path
-import pandas as pd, requests, io, sys
+import pandas as pd, sys
 
 # Añadir src al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes, read_csv_auto_from_bytes
+from src.etl.sources._fetch_utils import download_cached, read_csv_auto
 
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="ignore")
@@ -15,32 +15,18 @@ def download_year(year: int, base="https://sede.sepe.gob.es/es/portaltrabaja/res
     url = f"{base}/Paro_por_municipios_{year}_csv.csv"
     print(f"⬇️ {year} -> {url}")
     try:
-        b = download_bytes(url, timeout=30)
+        path = download_cached(url, timeout=30)
     except Exception as e:
         print(f"⚠️ {year}: descarga fallida: {e}")
         return None
 
-    # Intentar parsear automáticamente
+    # Un único parseo: encoding, separador y fila de cabecera (los CSV del SEPE
+    # traen líneas de título antes de la tabla) se detectan sobre el principio del fichero
     try:
-        df = read_csv_auto_from_bytes(b)
-    except Exception:
-        # Intento manual: decodificar latin-1 y buscar la línea con cabecera
-        try:
-            raw = b.decode("latin-1", errors="ignore").splitlines()
-            # Busca la primera línea que contenga 'MUNICIPIO' y que tenga separador ';' o '\t'
-            header_idx = None
-            for i, l in enumerate(raw[:10]):
-                if ("MUNICIPIO" in l.upper() or "PARO" in l.upper()) and (";" in l or "\t" in l or "," in l):
-                    header_idx = i
-                    break
-            if header_idx is None:
-                # fallback: try pandas with default
-                df = pd.read_csv(io.StringIO("\n".join(raw)), dtype=str, sep=";", engine="python")
-            else:
-                df = pd.read_csv(io.StringIO("\n".join(raw[header_idx + 0 :])), dtype=str, engine="python")
-        except Exception as e:
-            print(f"⚠️ {year}: no pude parsear el CSV: {e}")
-            return None
+        df = read_csv_auto(path, source=url)
+    except Exception as e:
+        print(f"⚠️ {year}: no pude parsear el CSV: {e}")
+        return None
 
     # Detectar y renombrar columnas relevantes
     col_muni = next((c for c in df.columns if "MUNICIPIO" in c.upper() or "CODIGO" in c.upper()), None)
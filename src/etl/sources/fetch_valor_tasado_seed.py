@@ -3,7 +3,7 @@ from pathlib import Path
 
 # Añadir src al path para imports absolutos
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
-from src.etl.sources._fetch_utils import download_bytes, read_csv_auto_from_bytes
+from src.etl.sources._fetch_utils import download_cached, read_csv_auto
 
 try:
     sys.stdout.reconfigure(encoding='utf-8', errors='ignore')
@@ -20,8 +20,7 @@ df = None
 for url in urls:
     try:
         print(f"⬇️ Intentando {url}")
-        b = download_bytes(url, timeout=30)
-        df = read_csv_auto_from_bytes(b)
+        df = read_csv_auto(download_cached(url, timeout=30), source=url)
         print(f"ℹ️ Leído {len(df):,} filas desde {url}")
         break
     except Exception as e:
@@ -1,13 +1,31 @@
 #!/usr/bin/env python
 """
 Ejecuta todos los fetchers de fuentes de datos para el data lake.
-Uso: python src/etl/sources/run_all_fetchers.py
+Uso: python src/etl/sources/run_all_fetchers.py [--parallel] [--max-per-host N]
+
+Con --parallel los fetchers de servidores distintos corren a la vez; como mucho
+`max_per_host` a la vez contra el mismo servidor (sección fetch: de
+configs/settings.yaml, o --max-per-host). El tiempo total queda acotado por la
+fuente más lenta en lugar de por la suma.
+
+Cada fetcher corre en su propio proceso (python <script>), así un sys.exit o un
+estado global de un fetcher no afecta al resto. Para el flujo completo con
+dependencias y caché usa: python -m src.etl.pipeline all
 """
+import argparse
+import os
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.stdout.reconfigure(encoding="utf-8", errors="ignore")  # type: ignore
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from src.etl.sources._fetch_utils import HostLimiter, load_fetch_limits
+from src.etl.pipeline import STAGES
+
 FETCHERS = [
     "fetch_municipios_ign.py",
     "fetch_valor_tasado_seed.py",
@@ -17,37 +35,80 @@ FETCHERS = [
     "fetch_euribor_bde.py",
 ]
 
-def run_fetcher(script_path: Path):
-    """Ejecuta un fetcher y captura errores."""
-    print(f"\n{'='*70}")
-    print(f"▶️  Ejecutando: {script_path.name}")
-    print(f"{'='*70}")
-    try:
-        with open(script_path, "r", encoding="utf-8") as f:
-            code = compile(f.read(), script_path, "exec")
-            exec(code, {"__name__": "__main__", "__file__": str(script_path)})
+# Servidor(es) (dominio) a los que ataca cada fetcher: la concurrencia se limita por
+# dominio. Se toman de las etapas fetch de src/etl/pipeline.py (Stage.host)
+FETCHER_HOSTS = {s.module.rsplit(".", 1)[1] + ".py": s.host for s in STAGES if s.phase == "fetch"}
+
+def _hosts_txt(host) -> str:
+    return "?" if host is None else host if isinstance(host, str) else "+".join(host)
+
+def run_fetcher(script_path: Path, capture: bool = False):
+    """Ejecuta un fetcher en su propio proceso. Con capture=True imprime su salida al terminar."""
+    cmd = [sys.executable, str(script_path)]
+    cwd = script_path.resolve().parents[3]
+    if not capture:
+        print(f"\n{'='*70}")
+        print(f"▶️  Ejecutando: {script_path.name}")
+        print(f"{'='*70}")
+        proc = subprocess.run(cmd, cwd=cwd)
+    else:
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, encoding="utf-8", errors="replace")
+        print(f"\n{'='*70}")
+        print(f"▶️  {script_path.name} [{_hosts_txt(FETCHER_HOSTS.get(script_path.name))}] ({time.perf_counter() - t0:.1f}s)")
+        print(f"{'='*70}")
+        print(proc.stdout, end="")
+    if proc.returncode == 0:
         print(f"✅ {script_path.name} completado.")
         return True
-    except Exception as e:
-        print(f"❌ {script_path.name} falló: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+    print(f"❌ {script_path.name} falló (código {proc.returncode})")
+    return False
+
+def run_parallel(paths: list, max_workers: int, limiter: HostLimiter) -> dict:
+    """Lanza los fetchers a la vez respetando el límite por servidor."""
+    def task(p: Path):
+        with limiter.slot(FETCHER_HOSTS.get(p.name)):
+            return run_fetcher(p, capture=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return dict(zip([p.name for p in paths], pool.map(task, paths)))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Ejecuta todos los fetchers")
+    ap.add_argument("--parallel", action="store_true", help="fetchers de distintos servidores a la vez")
+    ap.add_argument("--max-per-host", type=int, default=None, help="descargas simultáneas por servidor")
+    ap.add_argument("--max-workers", type=int, default=None, help="fetchers simultáneos en total")
+    ap.add_argument("--offline", action="store_true", help="sólo caché HTTP local (data_raw/.http_cache), sin red")
+    args = ap.parse_args(argv)
+    if args.offline:
+        os.environ["TFG_OFFLINE"] = "1"  # lo heredan los procesos de cada fetcher
 
-def main():
     root = Path(__file__).resolve().parent
     results = {}
     
     print("🚀 Iniciando descarga de todas las fuentes de datos...")
     print(f"📂 Directorio de trabajo: {root}")
     
+    paths = []
     for fname in FETCHERS:
         fpath = root / fname
         if not fpath.exists():
             print(f"⚠️ No encontrado: {fname}")
             results[fname] = False
             continue
-        results[fname] = run_fetcher(fpath)
+        paths.append(fpath)
+
+    t0 = time.perf_counter()
+    if args.parallel:
+        limits = load_fetch_limits()
+        if args.max_per_host is not None:
+            limits["max_per_host"] = args.max_per_host
+            limits["per_host"] = {}
+        limiter = HostLimiter(limits["max_per_host"], limits.get("per_host"))
+        results.update(run_parallel(paths, args.max_workers or limits["max_workers"], limiter))
+    else:
+        for fpath in paths:
+            results[fpath.name] = run_fetcher(fpath)
     
     # Resumen
     print(f"\n{'='*70}")
@@ -59,7 +120,7 @@ def main():
         status = "✅" if ok else "❌"
         print(f"{status} {fname}")
     
-    print(f"\n{success}/{total} fetchers completados exitosamente.")
+    print(f"\n{success}/{total} fetchers completados exitosamente en {time.perf_counter() - t0:.1f}s.")
     
     if success < total:
         print("\n⚠️ Algunos fetchers fallaron. Revisa los errores arriba.")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Comprobaciones offline de _fetch_utils (ficheros temporales, sin red).
+
+La caché HTTP (ETag / If-Modified-Since -> 304), la reanudación de un .part con
+Range/If-Range y TFG_OFFLINE se prueban contra un http.server en 127.0.0.1 que
+registra las cabeceras de cada petición.
+
+Uso:
+  python -m src.etl.sources.selftest_fetch_utils
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from src.etl.sources._fetch_utils import (read_csv_auto, iter_csv_chunks, download_cached, download_to_file,
+                                          make_session, OfflineCacheMiss)
+
+CHECKS = []
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+def _csv_latin1(tmp: Path) -> tuple:
+    """CSV latin-1 cuyo primer bloque (64 KiB) es ASCII y con "Ávila" bastante más abajo."""
+    rows = ["codigo;municipio;valor"] + [f"{i:05d};Municipio {i};{i}" for i in range(6000)]
+    rows += ["05019;Ávila;1", "28079;Madrid;2"]
+    raw = ("\n".join(rows) + "\n").encode("latin-1")
+    assert b"\xc1" not in raw[:1 << 16] and b"\xc1" in raw
+    path = tmp / "latin1.csv"
+    path.write_bytes(raw)
+    return raw, path
+
+@check
+def csv_latin1_tras_el_prefijo(tmp: Path):
+    raw, path = _csv_latin1(tmp)
+    for src in (raw, path):
+        df = read_csv_auto(src)
+        assert len(df) == 6002, len(df)
+        assert df["municipio"].iloc[-2] == "Ávila", df["municipio"].iloc[-2]
+        assert df.attrs["csv_dialect"]["encoding"] == "latin-1", df.attrs["csv_dialect"]
+
+@check
+def csv_latin1_tras_el_prefijo_por_bloques(tmp: Path):
+    _, path = _csv_latin1(tmp)
+    df = pd.concat(list(iter_csv_chunks(path, block_size=1 << 16)), ignore_index=True)
+    assert len(df) == 6002, len(df)
+    assert df["codigo"].tolist() == [f"{i:05d}" for i in range(6000)] + ["05019", "28079"]
+    assert df["municipio"].iloc[-2] == "Ávila", df["municipio"].iloc[-2]
+
+@check
+def csv_titulo_cp1252_con_puntos_suspensivos(tmp: Path):
+    # "…" en cp1252 es \x85 y un \r suelto: splitlines() los contaría como saltos de línea
+    raw = ("Renta media\x85 por municipio\rfuente INE\n\n"
+           "codigo;municipio;valor\n05019;Ávila;1\n28079;Madrid;2\n").encode("latin-1")
+    for src in (raw, tmp / "titulo.csv"):
+        if isinstance(src, Path):
+            src.write_bytes(raw)
+        df = read_csv_auto(src)
+        assert list(df.columns) == ["codigo", "municipio", "valor"], list(df.columns)
+        assert df["municipio"].tolist() == ["Ávila", "Madrid"], df["municipio"].tolist()
+
+# --- servidor local para la caché HTTP -------------------------------------------------
+LAST_MODIFIED = "Tue, 01 Oct 2024 10:00:00 GMT"
+
+class _Recurso(BaseHTTPRequestHandler):
+    """GET con ETag/Last-Modified, 304 condicional y rangos (206) con If-Range."""
+    def do_GET(self):
+        srv = self.server
+        srv.log.append({k.lower(): v for k, v in self.headers.items()})
+        body, etag = srv.body, srv.etag
+        if self.headers.get("If-None-Match") == etag:
+            srv.status.append(304)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        rng, if_range = self.headers.get("Range"), self.headers.get("If-Range")
+        if rng and if_range in (etag, LAST_MODIFIED):
+            start = int(rng.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(body):
+                srv.status.append(416)
+                self.send_response(416)
+                self.end_headers()
+                return
+            srv.status.append(206)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            chunk = body[start:]
+        else:
+            srv.status.append(200)
+            self.send_response(200)
+            chunk = body
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(chunk)))
+        self.end_headers()
+        self.wfile.write(chunk)
+
+    def log_message(self, *args):
+        pass
+
+@contextmanager
+def _servidor(body: bytes, etag: str = '"v1"'):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Recurso)
+    srv.body, srv.etag, srv.log, srv.status = body, etag, [], []
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield srv, f"http://127.0.0.1:{srv.server_address[1]}/datos.csv"
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+def _session():
+    s = make_session()
+    s.trust_env = False  # sin proxies del entorno: todo va a 127.0.0.1
+    return s
+
+@check
+def http_200_y_revalidacion_304(tmp: Path):
+    body = os.urandom(300_000)
+    with _servidor(body) as (srv, url):
+        s = _session()
+        path = download_cached(url, cache_dir=tmp, retries=1, session=s, offline=False)
+        assert path.read_bytes() == body and srv.status == [200], srv.status
+        meta = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+        assert meta["etag"] == '"v1"' and meta["last_modified"] == LAST_MODIFIED, meta
+
+        again = download_cached(url, cache_dir=tmp, retries=1, session=s, offline=False)
+        assert srv.status == [200, 304], srv.status
+        assert srv.log[-1].get("if-none-match") == '"v1"', srv.log[-1]
+        assert srv.log[-1].get("if-modified-since") == LAST_MODIFIED, srv.log[-1]
+        assert again == path and again.read_bytes() == body
+
+        # versión nueva en el servidor: el 200 sustituye la copia y su ETag
+        srv.body, srv.etag = body[::-1], '"v2"'
+        path = download_cached(url, cache_dir=tmp, retries=1, session=s, offline=False)
+        assert srv.status[-1] == 200 and path.read_bytes() == body[::-1]
+        assert json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))["etag"] == '"v2"'
+
+@check
+def http_reanuda_part_truncado(tmp: Path):
+    body = os.urandom(500_000)
+    dest = tmp / "datos.csv"
+    part = dest.with_name(dest.name + ".part")
+    part_meta = dest.with_name(dest.name + ".part.json")
+    with _servidor(body) as (srv, url):
+        part.write_bytes(body[:123_456])
+        part_meta.write_text(json.dumps({"etag": '"v1"', "last_modified": LAST_MODIFIED}), encoding="utf-8")
+        info = download_to_file(url, dest, retries=1, session=_session())
+        assert srv.status == [206], srv.status
+        assert srv.log[0].get("range") == "bytes=123456-" and srv.log[0].get("if-range") == '"v1"', srv.log[0]
+        assert dest.read_bytes() == body and info["size"] == len(body)
+        assert not part.exists() and not part_meta.exists()
+
+        # .part de una versión anterior: If-Range no coincide y se baja entero
+        part.write_bytes(b"x" * 1000)
+        part_meta.write_text(json.dumps({"etag": '"v0"'}), encoding="utf-8")
+        download_to_file(url, dest, retries=1, session=_session())
+        assert srv.status[-1] == 200 and dest.read_bytes() == body
+
+@check
+def http_offline_sirve_la_cache(tmp: Path):
+    body = b"a;b\n1;2\n"
+    with _servidor(body) as (srv, url):
+        download_cached(url, cache_dir=tmp, retries=1, session=_session(), offline=False)
+        previo, os.environ["TFG_OFFLINE"] = os.environ.get("TFG_OFFLINE"), "1"
+        try:
+            assert download_cached(url, cache_dir=tmp, session=_session()).read_bytes() == body
+            try:
+                download_cached(url + "?otra", cache_dir=tmp, session=_session())
+                raise AssertionError("se esperaba OfflineCacheMiss")
+            except OfflineCacheMiss:
+                pass
+        finally:
+            if previo is None:
+                os.environ.pop("TFG_OFFLINE")
+            else:
+                os.environ["TFG_OFFLINE"] = previo
+        assert srv.status == [200], srv.status  # en offline no hubo peticiones
+
+def main(argv=None):
+    fallos = 0
+    for fn in CHECKS:
+        with tempfile.TemporaryDirectory() as d:
+            try:
+                fn(Path(d))
+                print(f"✅ {fn.__name__}")
+            except Exception:
+                fallos += 1
+                print(f"❌ {fn.__name__}")
+                traceback.print_exc()
+    print(f"{'✅' if not fallos else '❌'} {len(CHECKS) - fallos}/{len(CHECKS)} comprobaciones")
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
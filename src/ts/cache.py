@@ -0,0 +1,223 @@
+"""
+Caché persistente de previsiones y backtests por serie.
+
+La clave de cada municipio es una huella de su serie (clave del municipio, fechas y
+price_eur_m2 byte a byte) y de la configuración que afecta al resultado (ForecastConfig sin los campos
+de ejecución: n_jobs, chunk_size, task_timeout). Si la serie no ha cambiado desde la
+última ejecución, sus métricas, su previsión y los parámetros ajustados salen de la
+caché; tras una actualización trimestral del MIVAU sólo se reajustan los municipios
+cuyos datos cambiaron (en la práctica, todos los que reciben un trimestre nuevo).
+
+Se guarda en CACHE_DIR:
+  metrics.parquet    fp, MAE, MAPE, error, params (JSON), extra (JSON), used (último uso, epoch s)
+  forecasts.parquet  fp, date (ordinal del trimestre), price_eur_m2 e intervalos (lo80, hi80...)
+
+"extra" guarda lo demás que el motor deja por serie: columnas adicionales de metrics_df
+(p.ej. "model" con engine="auto") y su fila de attrs["scores"], para que una ejecución
+desde la caché devuelva lo mismo que una sin ella. attrs["timing"] es el de los ajustes
+de esa llamada (vacío si todo salió de la caché).
+
+Uso:
+  cache = ForecastCache()
+  metrics, fc = fit_and_forecast(df, cfg, cache=cache)
+  print(cache.summary())   # aciertos / fallos acumulados
+  cache.save()
+"""
+from __future__ import annotations
+import dataclasses
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CACHE_DIR = PROJECT_ROOT / "data" / "curated" / "_cache" / "forecast"
+
+# Súbelo si cambia la lógica de ajuste/backtest: invalida todas las entradas
+CACHE_VERSION = 3
+# Campos de ForecastConfig que no cambian el resultado
+RUNTIME_FIELDS = {"n_jobs", "chunk_size", "task_timeout"}
+# Columnas de metrics_df que se guardan aparte; el resto va en "extra"
+BASE_METRICS = ("muni_key", "municipio_id", "municipio", "MAE", "MAPE", "error")
+
+
+def config_fingerprint(cfg) -> str:
+    """Huella de la parte de la configuración que influye en las previsiones."""
+    campos = {k: v for k, v in dataclasses.asdict(cfg).items() if k not in RUNTIME_FIELDS}
+    raw = json.dumps({"version": CACHE_VERSION, **campos}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def series_fingerprints(series: list, cfg) -> np.ndarray:
+    """Huella por serie (tuplas de forecast._series): config + clave + ordinales de fecha + valores."""
+    base = config_fingerprint(cfg).encode()
+    out = []
+    for k, _, _, dates, values in series:
+        h = hashlib.blake2b(base, digest_size=16)
+        h.update(str(k).encode())
+        h.update(pd.PeriodIndex(dates).asi8.tobytes())
+        h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        out.append(h.hexdigest())
+    return np.array(out, dtype=object)
+
+
+def _jsonable(v):
+    if isinstance(v, np.generic):
+        v = v.item()
+    return None if v is None or (isinstance(v, float) and np.isnan(v)) else v
+
+
+def _extras(metrics_df: pd.DataFrame) -> list:
+    """JSON por serie con las columnas de metrics_df fuera de BASE_METRICS y su fila de attrs["scores"]."""
+    cols = [c for c in metrics_df.columns if c not in BASE_METRICS]
+    scores = metrics_df.attrs.get("scores")
+    out = []
+    for j in range(len(metrics_df)):
+        e = {}
+        if cols:
+            e["metrics"] = {c: _jsonable(metrics_df[c].iat[j]) for c in cols}
+        if scores is not None:
+            e["scores"] = {str(c): _jsonable(v) for c, v in scores.iloc[j].items()}
+        out.append(json.dumps(e) if e else None)
+    return out
+
+
+class ForecastCache:
+    def __init__(self, cache_dir=None, max_entries: int = 200_000):
+        self.dir = Path(cache_dir) if cache_dir else CACHE_DIR
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._metrics = None   # DataFrame indexado por fp
+        self._fc = None
+        self._dirty = False
+
+    # --- almacenamiento -------------------------------------------------------
+    def _load(self):
+        if self._metrics is not None:
+            return
+        m, f = self.dir / "metrics.parquet", self.dir / "forecasts.parquet"
+        if m.exists() and f.exists():
+            self._metrics = pd.read_parquet(m).set_index("fp")
+            self._fc = pd.read_parquet(f)
+            if "extra" not in self._metrics.columns:  # caché anterior a CACHE_VERSION 3
+                self._metrics["extra"] = None
+        else:
+            self._metrics = pd.DataFrame(columns=["MAE", "MAPE", "error", "params", "extra", "used"],
+                                         index=pd.Index([], name="fp"))
+            self._fc = pd.DataFrame({"fp": pd.Series(dtype=object), "date": pd.Series(dtype="int64"),
+                                     "price_eur_m2": pd.Series(dtype="float64")})
+
+    def save(self):
+        """Escribe la caché (si cambió) conservando las max_entries usadas más recientemente."""
+        if not self._dirty:
+            return
+        m = self._metrics
+        if len(m) > self.max_entries:
+            m = m.sort_values("used").iloc[-self.max_entries:]
+            self._metrics = m
+            self._fc = self._fc[self._fc["fp"].isin(m.index)]
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # se escribe al lado y se sustituye: nunca queda una caché a medias
+        for name, df in (("metrics", m.reset_index()), ("forecasts", self._fc)):
+            tmp = self.dir / f"{name}.parquet.tmp"
+            df.to_parquet(tmp, index=False)
+            tmp.replace(self.dir / f"{name}.parquet")
+        self._dirty = False
+
+    def params(self, fp: str) -> dict | None:
+        """Parámetros ajustados guardados para una huella (None si no está o falló el ajuste)."""
+        self._load()
+        if fp not in self._metrics.index:
+            return None
+        raw = self._metrics.at[fp, "params"]
+        return json.loads(raw) if isinstance(raw, str) else None
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"caché de previsiones: {self.hits:,}/{total:,} aciertos ({rate:.0%})"
+
+    # --- uso desde fit_and_forecast ------------------------------------------
+    def fit_and_forecast(self, series: list, key: str, cfg, fit_fn):
+        """Ajusta con fit_fn sólo las series que faltan y compone el resultado en el orden de entrada."""
+        self._load()
+        fps = series_fingerprints(series, cfg)
+        hit = np.isin(fps, self._metrics.index.to_numpy())
+        n_hit = int(hit.sum())
+        self.hits += n_hit
+        self.misses += len(series) - n_hit
+
+        miss_idx = np.flatnonzero(~hit)
+        timing = {}
+        if len(miss_idx):
+            m_new, f_new, p_new = fit_fn([series[i] for i in miss_idx], key, cfg)
+            self._store(fps[miss_idx], [series[i][0] for i in miss_idx], key, m_new, f_new, p_new)
+            timing = m_new.attrs.get("timing", {})
+        now = int(time.time())
+        self._metrics.loc[fps[hit], "used"] = now
+        self._dirty = True
+
+        # todo sale ya de la caché, en el orden de las series
+        m = self._metrics.loc[fps, ["MAE", "MAPE", "error", "extra"]].reset_index(drop=True)
+        ids = {"muni_key": [s[0] for s in series]} if key == "muni_key" else {}
+        metrics_df = pd.DataFrame({**ids, "municipio_id": [s[1] for s in series],
+                                   "municipio": [s[2] for s in series]})
+        metrics_df["MAE"] = m["MAE"].astype("float64")
+        metrics_df["MAPE"] = m["MAPE"].astype("float64")
+        metrics_df["error"] = [e if isinstance(e, str) else None for e in m["error"]]
+        extra = [json.loads(e) if isinstance(e, str) else {} for e in m["extra"]]
+        cols = list(dict.fromkeys(c for e in extra for c in e.get("metrics", {})))
+        for c in cols:
+            metrics_df[c] = np.array([e.get("metrics", {}).get(c) for e in extra], dtype=object)
+        if any("scores" in e for e in extra):
+            scores = pd.DataFrame([e.get("scores", {}) for e in extra], dtype="float64")
+            metrics_df.attrs["scores"] = scores.set_axis([s[1] for s in series])
+        if timing or any("scores" in e for e in extra):
+            metrics_df.attrs["timing"] = timing
+
+        pos = pd.Series(np.arange(len(fps)), index=fps)
+        fc = self._fc[self._fc["fp"].isin(pos.index)]
+        fc = fc.assign(_pos=pos.reindex(fc["fp"]).to_numpy()).sort_values(["_pos", "date"], kind="stable")
+        p = fc["_pos"].to_numpy()
+        forecast_df = pd.DataFrame({
+            **({"muni_key": np.array([s[0] for s in series])[p]} if ids else {}),
+            "municipio_id": np.array([s[1] for s in series], dtype=object)[p],
+            "municipio": np.array([s[2] for s in series], dtype=object)[p],
+            "date": pd.PeriodIndex.from_ordinals(fc["date"].to_numpy(), freq="Q"),
+            "price_eur_m2": fc["price_eur_m2"].to_numpy(),
+            "kind": "forecast",
+        })
+        # sólo los intervalos de esta configuración (la tabla guarda los de todas)
+        from src.ts.forecast import _interval_method
+        levels = cfg.interval_levels if _interval_method(cfg) != "none" else ()
+        for c in [f"{b}{lv}" for lv in levels for b in ("lo", "hi")]:
+            forecast_df[c] = fc[c].to_numpy(dtype="float64") if c in fc.columns else np.nan
+        metrics_df.attrs["cache"] = {"hits": n_hit, "misses": len(series) - n_hit,
+                                     "hit_rate": n_hit / len(series) if series else 0.0}
+        return metrics_df, forecast_df
+
+    def _store(self, fps, keys, key: str, metrics_df, forecast_df, params):
+        now = int(time.time())
+        nuevos = pd.DataFrame({
+            "MAE": metrics_df["MAE"].to_numpy(dtype="float64"),
+            "MAPE": metrics_df["MAPE"].to_numpy(dtype="float64"),
+            "error": metrics_df["error"].astype(object).to_numpy(),
+            "params": [json.dumps(p) if p is not None else None for p in params],
+            "extra": _extras(metrics_df),
+            "used": now,
+        }, index=pd.Index(fps, name="fp"))
+        self._metrics = pd.concat([self._metrics[~self._metrics.index.isin(fps)], nuevos])
+
+        fp_de = pd.Series(fps, index=keys)
+        # valores numéricos por fila: la previsión y sus intervalos
+        valores = [c for c in forecast_df.columns if c == "price_eur_m2" or re.fullmatch(r"(lo|hi)\d+", c)]
+        fc = pd.DataFrame({
+            "fp": fp_de.reindex(forecast_df[key].to_numpy()).to_numpy() if len(forecast_df) else [],
+            "date": pd.PeriodIndex(forecast_df["date"], freq="Q").asi8 if len(forecast_df) else [],
+            **{c: forecast_df[c].to_numpy(dtype="float64") for c in valores},
+        }).astype({"date": "int64"})
+        self._fc = pd.concat([self._fc[~self._fc["fp"].isin(fps)], fc], ignore_index=True)
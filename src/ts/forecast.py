@@ -1,71 +1,498 @@
 from __future__ import annotations
 
+import os
+import queue
+import time
 import warnings
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import Tuple
 import numpy as np
 import pandas as pd
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from src.ts.intervals import hw_forecast_std, normal_bounds, empirical_log_quantiles, empirical_bounds
 
 @dataclass
 class ForecastConfig:
     horizon_quarters: int = 8
     backtest_folds: int = 4
+    # Paralelismo: n_jobs procesos (None o <= 0 = nº CPUs, 1 = en este proceso).
+    # Los municipios se reparten en tareas de chunk_size series; task_timeout
+    # (segundos por tarea, None = sin límite) sólo se aplica con n_jobs > 1. Con menos
+    # series que n_jobs se reparten los folds y el plazo es el de los folds de cada serie.
+    n_jobs: int | None = 1
+    chunk_size: int = 16
+    task_timeout: float | None = None
+    # Motor: "statsmodels" (un ExponentialSmoothing por serie), "panel" (Holt-Winters
+    # vectorizado de src/ts/panel_hw para todas las series a la vez) o "global" (una
+    # regresión ridge sobre todo el panel con lags y factores, src/ts/global_model) o
+    # "auto" (el mejor de `models` por municipio según el backtest, src/ts/models)
+    engine: str = "statsmodels"
+    global_lags: int = 8
+    global_ridge: float = 1.0
+    # Motor auto: modelos candidatos y presupuesto de tiempo (s) para toda la llamada;
+    # al agotarse se saltan los modelos más caros (None = sin límite)
+    models: tuple = ("naive", "snaive", "drift", "theta", "damped", "hw", "ets")
+    time_budget: float | None = None
+    # Intervalos de predicción (src/ts/intervals): columnas lo<nivel>/hi<nivel>.
+    # "analytic" (varianza del Holt-Winters), "empirical" (cuantiles de los residuos de
+    # backtest, panel, global y auto), "auto" (analytic con statsmodels/panel) o "none".
+    interval_levels: tuple = (80, 95)
+    interval_method: str = "auto"
+    # Backtest: "expanding" (train desde el inicio) o "sliding" (últimos backtest_window
+    # trimestres). warm_start: sólo el primer fold hace la búsqueda completa de parámetros.
+    backtest_scheme: str = "expanding"
+    backtest_window: int | None = None
+    warm_start: bool = True
 
-def _fit_ets(y: pd.Series):
+# alpha, beta, gamma, nivel y pendiente iniciales y 4 estacionales
+N_PARAMS_ETS = 9
+
+def _interval_method(cfg: ForecastConfig) -> str:
+    method = cfg.interval_method
+    if method == "auto":
+        return "empirical" if cfg.engine in ("global", "auto") else "analytic"
+    if method not in ("analytic", "empirical", "none"):
+        raise ValueError(f"interval_method desconocido: {method!r} (auto | analytic | empirical | none)")
+    if method == "analytic" and cfg.engine in ("global", "auto"):
+        raise ValueError(f"El motor {cfg.engine} no tiene varianza analítica: usa interval_method='empirical'")
+    if method == "empirical" and cfg.engine == "statsmodels":
+        raise ValueError("Intervalos empíricos sólo con engine='panel', 'global' o 'auto' (residuos de backtest en bloque)")
+    return method
+
+def _add_intervals(forecast_df: pd.DataFrame, bounds: dict) -> pd.DataFrame:
+    """Añade las columnas lo*/hi* (arrays (n_series, h) en el orden de forecast_df)."""
+    for c, v in bounds.items():
+        forecast_df[c] = np.asarray(v, dtype=np.float64).ravel()
+    return forecast_df
+
+def _fit_ets(y: pd.Series, start_params=None):
     # ETS aditivo con estacionalidad anual (4 trimestres)
     model = ExponentialSmoothing(y, trend="add", seasonal="add", seasonal_periods=4)
-    return model.fit(optimized=True, use_brute=True)
+    if start_params is None:
+        return model.fit(optimized=True, use_brute=True)
+    # arranque en caliente: sin la rejilla de use_brute, el optimizador parte de start_params
+    return model.fit(optimized=True, use_brute=False, start_params=start_params)
 
-def backtest_rolling(y: pd.Series, horizon: int, folds: int) -> pd.DataFrame:
-    results = []
+def _start_params(fit) -> np.ndarray:
+    """Parámetros de un ajuste en el orden de start_params: alpha, beta, gamma, l0, b0, s0..s3."""
+    p = fit.params
+    return np.r_[p["smoothing_level"], p["smoothing_trend"], p["smoothing_seasonal"],
+                 p["initial_level"], p["initial_trend"], p["initial_seasons"]]
+
+def _params(fit) -> dict:
+    """Parámetros ajustados de statsmodels en tipos de Python (para guardarlos en JSON)."""
+    out = {}
+    for k in ("smoothing_level", "smoothing_trend", "smoothing_seasonal",
+              "initial_level", "initial_trend", "initial_seasons"):
+        v = fit.params.get(k)
+        if v is not None:
+            out[k] = np.asarray(v, dtype=float).tolist()
+    return out
+
+def _error(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}"
+
+def fold_slices(horizon: int, folds: int, scheme: str = "expanding", window: int | None = None) -> list:
+    """
+    (fold, train, test) como slices desde el final de la serie, del fold más
+    antiguo al más reciente. scheme="expanding": train desde el inicio;
+    "sliding": sólo los `window` trimestres anteriores al corte.
+    (El fold 1 deja el test vacío, y.iloc[-h:0], y no se evalúa.)
+    """
+    if scheme not in ("expanding", "sliding"):
+        raise ValueError(f"Esquema de backtest desconocido: {scheme!r} (expanding | sliding)")
+    if scheme == "sliding" and not window:
+        raise ValueError("El esquema sliding necesita backtest_window (trimestres de entrenamiento)")
+    out = []
     for i in range(folds, 0, -1):
         split = -i * horizon
-        y_train = y.iloc[:split] if split != 0 else y
-        y_test = y.iloc[split: split + horizon] if split != 0 else pd.Series(dtype=float)
-        if len(y_train) < 8 or len(y_test) == 0:
-            continue
+        start = split - window if scheme == "sliding" else None
+        out.append((i, slice(start, split), slice(split, split + horizon)))
+    return out
+
+def _fold_forecast(y_train: pd.Series, horizon: int, start_params=None) -> np.ndarray:
+    return _fit_ets(y_train, start_params).forecast(horizon).to_numpy()
+
+def backtest_rolling(y: pd.Series, horizon: int, folds: int, scheme: str = "expanding",
+                     window: int | None = None, warm_start: bool = True, executor=None,
+                     deadline: float | None = None) -> pd.DataFrame:
+    """
+    Backtest con orígenes móviles. Los folds que fallan no se cuentan en las
+    métricas; su error queda en out.attrs["errors"].
+
+    Con warm_start sólo el primer fold que se ajusta hace la búsqueda completa
+    (use_brute); los demás arrancan de sus parámetros sin rejilla y son
+    independientes entre sí: con un executor (concurrent.futures) se lanzan a la vez.
+    Si sus resultados no llegan antes de `deadline` (time.monotonic()) se cancelan
+    y se lanza TimeoutError: el executor puede tener procesos colgados.
+    """
+    splits = [(i, y.iloc[tr], y.iloc[te]) for i, tr, te in fold_slices(horizon, folds, scheme, window)]
+    splits = [s for s in splits if len(s[1]) >= 8 and len(s[2]) > 0]
+    preds, errors = {}, {}
+
+    start, resto = None, []
+    for n, (i, y_train, _) in enumerate(splits):
         try:
             fit = _fit_ets(y_train)
-            fcst = fit.forecast(horizon)
-            df = pd.DataFrame({"y_true": y_test.values, "y_pred": fcst.values}, index=y_test.index)
-            results.append(df)
-        except Exception:
+        except Exception as e:
+            errors[i] = _error(e)
             continue
+        preds[i] = fit.forecast(horizon).to_numpy()
+        start = _start_params(fit) if warm_start else None
+        resto = splits[n + 1:]
+        break
+
+    if executor is not None:
+        futs = {i: executor.submit(_fold_forecast, y_train, horizon, start) for i, y_train, _ in resto}
+        get = lambda i: futs[i].result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+    else:
+        get = None
+    for i, y_train, _ in resto:
+        try:
+            preds[i] = get(i) if get else _fold_forecast(y_train, horizon, start)
+        except TimeoutError:
+            for f in futs.values():
+                f.cancel()
+            raise
+        except Exception as e:
+            errors[i] = _error(e)
+
+    results = [pd.DataFrame({"y_true": y_test.values, "y_pred": preds[i]}, index=y_test.index)
+               for i, _, y_test in splits if i in preds]
     if not results:
-        return pd.DataFrame(columns=["y_true", "y_pred"])
-    out = pd.concat(results)
-    out["mae"] = (out["y_true"] - out["y_pred"]).abs()
-    out["ape"] = (out["y_true"] - out["y_pred"]).abs() / out["y_true"].replace(0, np.nan)
+        out = pd.DataFrame(columns=["y_true", "y_pred"])
+    else:
+        out = pd.concat(results)
+        out["mae"] = (out["y_true"] - out["y_pred"]).abs()
+        out["ape"] = (out["y_true"] - out["y_pred"]).abs() / out["y_true"].replace(0, np.nan)
+    out.attrs["errors"] = [f"fold {i}: {errors[i]}" for i, _, _ in splits if i in errors]
     return out
 
-def fit_and_forecast(df: pd.DataFrame, cfg: ForecastConfig) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    """Entrena ETS por municipio y devuelve (metrics_df, forecast_df). 
-    df: columnas municipio_id, municipio, date (Period[Q]), price_eur_m2
+def _forecast_series(k, mid, name, dates, values, key: str, cfg: ForecastConfig, executor=None):
+    """
+    Backtest + ajuste final de una serie -> (fila de métricas, previsión o None, parámetros o None).
+    Con executor, TimeoutError si los folds pasan de cfg.task_timeout.
+    """
+    ids = {"muni_key": k} if key == "muni_key" else {}
+    y = pd.Series(values, index=dates)
+    deadline = time.monotonic() + cfg.task_timeout if executor is not None and cfg.task_timeout else None
+    bt = backtest_rolling(y, cfg.horizon_quarters, cfg.backtest_folds, cfg.backtest_scheme,
+                          cfg.backtest_window, cfg.warm_start, executor, deadline)
+    mae = bt["mae"].mean() if not bt.empty else np.nan
+    mape = (bt["ape"].mean() * 100) if not bt.empty else np.nan
+    errors = list(bt.attrs.get("errors", []))
+    fdf = params = None
+    # Fit final
+    try:
+        fit = _fit_ets(y)
+        fcst = fit.forecast(cfg.horizon_quarters)
+        fdf = pd.DataFrame({
+            **ids,
+            "municipio_id": mid,
+            "municipio": name,
+            "date": fcst.index,
+            "price_eur_m2": fcst.values,
+            "kind": "forecast"
+        })
+        params = _params(fit)
+        params["sigma2"] = float(fit.sse) / max(len(y) - N_PARAMS_ETS, 1)
+    except Exception as e:
+        errors.append(f"final: {_error(e)}")
+    metrics = {**ids, "municipio_id": mid, "municipio": name, "MAE": mae, "MAPE": mape,
+               "error": "; ".join(errors) or None}
+    return metrics, fdf, params
+
+def _forecast_chunk(chunk, key: str, cfg: ForecastConfig):
+    """Tarea del pool: una lista de series (k, municipio_id, municipio, fechas, valores)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # ConvergenceWarning de statsmodels, una por serie
+        return [_forecast_series(*s, key, cfg) for s in chunk]
+
+def _failed_chunk(chunk, key: str, msg: str):
+    """Resultados de una tarea que no terminó (timeout o fallo del proceso)."""
+    return [({**({"muni_key": k} if key == "muni_key" else {}), "municipio_id": mid, "municipio": name,
+              "MAE": np.nan, "MAPE": np.nan, "error": msg}, None, None)
+            for k, mid, name, _, _ in chunk]
+
+def _timeout_msg(n: int, cfg: ForecastConfig) -> str:
+    return f"timeout: tarea de {n} series > {cfg.task_timeout:g}s"
+
+def _kill_executor(ex: ProcessPoolExecutor):
+    """Cierra el executor sin esperar: un proceso colgado haría que shutdown(wait=True) no volviera."""
+    procs = list((getattr(ex, "_processes", None) or {}).values())
+    ex.shutdown(wait=False, cancel_futures=True)
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        p.join()
+
+def _run_folds(series: list, key: str, cfg: ForecastConfig, n_jobs: int) -> list:
+    """
+    Pocas series (p.ej. un municipio desde la app): se reparten los folds, no las series.
+    Con cfg.task_timeout, una serie cuyos folds no terminan a tiempo queda como en
+    _run_pool (MAE/MAPE NaN y error "timeout: ..."), y el pool se rehace para las demás.
+    """
+    results = []
+    ex = ProcessPoolExecutor(max_workers=n_jobs)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for s in series:
+                try:
+                    results.append(_forecast_series(*s, key, cfg, executor=ex))
+                except TimeoutError:
+                    results.extend(_failed_chunk([s], key, _timeout_msg(1, cfg)))
+                    _kill_executor(ex)
+                    ex = ProcessPoolExecutor(max_workers=n_jobs)
+    finally:
+        ex.shutdown()
+    return results
+
+def _n_jobs(n_jobs) -> int:
+    if n_jobs is None or n_jobs <= 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+def _run_pool(chunks: list, key: str, cfg: ForecastConfig, workers: int) -> list:
+    """
+    Ejecuta las tareas en un pool de procesos con, como mucho, `workers` tareas en
+    vuelo (así cada una empieza al enviarse y su plazo es real). Si una tarea pasa
+    de cfg.task_timeout se marcan sus series como error, se mata el pool y las
+    demás tareas en vuelo se reenvían a uno nuevo. Resultados en orden de tareas.
+    """
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))[::-1]  # pila: se saca por el final
+    done_q = queue.Queue()
+    inflight = {}  # tarea -> plazo (monotonic) o None
+    pool = mp.get_context().Pool(workers)
+    try:
+        while pending or inflight:
+            while pending and len(inflight) < workers:
+                i = pending.pop()
+                pool.apply_async(_forecast_chunk, (chunks[i], key, cfg),
+                                 callback=lambda r, i=i: done_q.put((i, r, None)),
+                                 error_callback=lambda e, i=i: done_q.put((i, None, e)))
+                inflight[i] = time.monotonic() + cfg.task_timeout if cfg.task_timeout else None
+            plazos = [d for d in inflight.values() if d is not None]
+            wait_s = max(0.0, min(plazos) - time.monotonic()) if plazos else None
+            try:
+                i, res, exc = done_q.get(timeout=wait_s)
+            except queue.Empty:
+                now = time.monotonic()
+                vencidas = [i for i, d in inflight.items() if d is not None and d <= now]
+                for i in vencidas:
+                    results[i] = _failed_chunk(chunks[i], key, _timeout_msg(len(chunks[i]), cfg))
+                    del inflight[i]
+                # los procesos colgados no se pueden recuperar: pool nuevo y reenvío del resto
+                pool.terminate()
+                pool.join()
+                pending.extend(sorted(inflight, reverse=True))
+                inflight.clear()
+                pool = mp.get_context().Pool(workers)
+                continue
+            if i not in inflight:  # respuesta tardía de un pool ya terminado
+                continue
+            del inflight[i]
+            results[i] = res if exc is None else _failed_chunk(chunks[i], key, f"worker: {_error(exc)}")
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+def _panel_folds(series: list, cfg: ForecastConfig):
+    """
+    Todas las filas de entrenamiento del backtest y del ajuste final en una matriz
+    -> (Y, n, rows, ends, Yt, end_t, nbt). rows[:nbt] son los folds (serie de cada
+    fila), rows[nbt:] el ajuste final; Yt (filas, T) alineada al inicio de cada fila.
+
+    Folds como backtest_rolling: train = y[:-i*h] (o los backtest_window anteriores con
+    sliding, >= 8 obs), test = los h siguientes; el fold i = 1 tiene test vacío allí
+    (y.iloc[-h:0]) y tampoco se evalúa aquí.
     """
-    metrics = []
-    forecasts = []
-    for mid, g in df.groupby("municipio_id", sort=False):
+    from src.ts.panel_hw import left_align
+    h = cfg.horizon_quarters
+    Y, n = left_align([s[4] for s in series])
+    fold_slices(h, cfg.backtest_folds, cfg.backtest_scheme, cfg.backtest_window)  # valida el esquema
+    rows, starts, ends = [], [], []
+    for i in range(cfg.backtest_folds, 1, -1):
+        end = n - i * h
+        start = np.maximum(end - cfg.backtest_window, 0) if cfg.backtest_scheme == "sliding" else np.zeros_like(end)
+        ok = end - start >= 8
+        rows.append(np.flatnonzero(ok))
+        starts.append(start[ok])
+        ends.append(end[ok])
+    nbt = sum(len(r) for r in rows)
+    rows.append(np.arange(len(series)))
+    starts.append(np.zeros_like(n))
+    ends.append(n)
+    rows, starts, ends = np.concatenate(rows), np.concatenate(starts), np.concatenate(ends)
+
+    T = Y.shape[1]
+    Ypad = np.concatenate([Y, np.full_like(Y, np.nan)], axis=1)
+    Yt = np.take_along_axis(Ypad[rows], starts[:, None] + np.arange(T), axis=1)
+    return Y, n, rows, ends, Yt, ends - starts, nbt
+
+def _series_mean(v: np.ndarray, bt_rows: np.ndarray, n_series: int) -> np.ndarray:
+    """Media por serie de v (filas de backtest, h) ignorando NaN; NaN si la serie no tiene puntos."""
+    h = v.shape[1]
+    valid = ~np.isnan(v)
+    tot = np.bincount(np.repeat(bt_rows, h), weights=np.where(valid, v, 0).ravel(), minlength=n_series)
+    cnt = np.bincount(np.repeat(bt_rows, h), weights=valid.ravel(), minlength=n_series)
+    with np.errstate(invalid="ignore"):
+        return tot / np.where(cnt > 0, cnt, np.nan)
+
+def _backtest_errors(Y, rows, ends, yhat_bt):
+    """(y_true, |error|, APE) de las filas de backtest, (nbt, h) con NaN fuera de la serie."""
+    h = yhat_bt.shape[1]
+    Ypad = np.concatenate([Y, np.full((Y.shape[0], h), np.nan)], axis=1)
+    y_true = np.take_along_axis(Ypad[rows], ends[:, None] + np.arange(h), axis=1)
+    err = np.abs(y_true - yhat_bt)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = err / np.where(y_true == 0, np.nan, y_true)
+    return y_true, err, ape
+
+def _forecast_frame(series: list, sel: np.ndarray, yhat: np.ndarray, key: str) -> pd.DataFrame:
+    """forecast_df de las series sel con sus previsiones yhat (len(sel), h) tras su último trimestre."""
+    h = yhat.shape[1]
+    last = pd.PeriodIndex([series[i][3][-1] for i in sel], freq="Q").asi8
+    return pd.DataFrame({
+        **({"muni_key": np.repeat([series[i][0] for i in sel], h)} if key == "muni_key" else {}),
+        "municipio_id": np.repeat([series[i][1] for i in sel], h),
+        "municipio": np.repeat([series[i][2] for i in sel], h),
+        "date": pd.PeriodIndex.from_ordinals((last[:, None] + np.arange(1, h + 1)).ravel(), freq="Q"),
+        "price_eur_m2": yhat.ravel(),
+        "kind": "forecast",
+    })
+
+def _panel_engine(series: list, key: str, cfg: ForecastConfig):
+    """
+    Mismo backtest y ajuste final que el camino statsmodels, pero todos los folds
+    de todas las series se ajustan en una sola llamada a fit_panel (con la rejilla
+    en bloque no hace falta arranque en caliente).
+    """
+    from src.ts.panel_hw import fit_panel, forecast_panel
+    h = cfg.horizon_quarters
+    Y, n, rows, ends, Yt, end_t, nbt = _panel_folds(series, cfg)
+    fit = fit_panel(Yt, end_t)
+    yhat = forecast_panel(fit, h)
+
+    # Métricas: media de |error| y de APE sobre todos los puntos de test de la serie
+    bt_rows = rows[:nbt]
+    y_true, err, ape = _backtest_errors(Y, bt_rows, ends[:nbt], yhat[:nbt])
+    _media = lambda v: _series_mean(v, bt_rows, len(series))
+
+    ok = fit.ok[nbt:]
+    fin = slice(nbt, None)
+    # varianza del error a un paso: SSE / (observaciones - parámetros)
+    sigma2 = fit.sse[fin] / np.maximum(np.isfinite(Y).sum(axis=1) - N_PARAMS_ETS, 1)
+    params = [{"alpha": float(a), "beta": float(b), "gamma": float(g), "level": float(l), "trend": float(t),
+               "season": s.tolist(), "sigma2": float(v)} if o else None
+              for a, b, g, l, t, s, v, o in zip(fit.alpha[fin], fit.beta[fin], fit.gamma[fin], fit.level[fin],
+                                                fit.trend[fin], fit.season[fin], sigma2, ok)]
+    ids = {"muni_key": [s[0] for s in series]} if key == "muni_key" else {}
+    metrics_df = pd.DataFrame({
+        **ids,
+        "municipio_id": [s[1] for s in series],
+        "municipio": [s[2] for s in series],
+        "MAE": _media(err),
+        "MAPE": _media(ape) * 100,
+        "error": np.where(ok, None, "final: menos de 2 ciclos (8 trimestres) con datos"),
+    })
+
+    sel = np.flatnonzero(ok)
+    forecast_df = _forecast_frame(series, sel, yhat[nbt:][sel], key)
+    method = _interval_method(cfg)
+    if method == "analytic":
+        std = hw_forecast_std(fit.alpha[fin][sel], fit.beta[fin][sel], fit.gamma[fin][sel], sigma2[sel], h)
+        _add_intervals(forecast_df, normal_bounds(yhat[nbt:][sel], std, cfg.interval_levels))
+    elif method == "empirical":
+        # residuos de todos los folds y municipios, por horizonte
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logres = np.log(y_true) - np.log(yhat[:nbt])
+        q = empirical_log_quantiles(logres, cfg.interval_levels)
+        _add_intervals(forecast_df, empirical_bounds(yhat[nbt:][sel], q))
+    return metrics_df, forecast_df, params
+
+def _series(df: pd.DataFrame, key: str) -> list:
+    """Una tupla (clave, municipio_id, municipio, fechas, valores) por serie, en orden de aparición."""
+    series = []
+    for k, g in df.groupby(key, sort=False):
         g = g.sort_values("date")
-        y = pd.Series(g["price_eur_m2"].values, index=g["date"].values)
-        bt = backtest_rolling(y, cfg.horizon_quarters, cfg.backtest_folds)
-        mae = bt["mae"].mean() if not bt.empty else np.nan
-        mape = (bt["ape"].mean() * 100) if not bt.empty else np.nan
-        metrics.append({"municipio_id": mid, "municipio": g["municipio"].iloc[0], "MAE": mae, "MAPE": mape})
-        # Fit final
-        try:
-            fit = _fit_ets(y)
-            fcst = fit.forecast(cfg.horizon_quarters)
-            fdf = pd.DataFrame({
-                "municipio_id": mid,
-                "municipio": g["municipio"].iloc[0],
-                "date": fcst.index,
-                "price_eur_m2": fcst.values,
-                "kind": "forecast"
-            })
-            forecasts.append(fdf)
-        except Exception:
-            continue
-    metrics_df = pd.DataFrame(metrics)
+        series.append((k, g["municipio_id"].iloc[0], g["municipio"].iloc[0],
+                       g["date"].values, g["price_eur_m2"].to_numpy(dtype="float64")))
+    return series
+
+def _fit_series(series: list, key: str, cfg: ForecastConfig):
+    """Ajusta las series con el motor de cfg -> (metrics_df, forecast_df, parámetros por serie)."""
+    if cfg.engine == "panel":
+        return _panel_engine(series, key, cfg)
+    if cfg.engine == "auto":
+        from src.ts.models import auto_engine
+        return auto_engine(series, key, cfg)
+    if cfg.engine != "statsmodels":
+        raise ValueError(f"Motor de previsión desconocido: {cfg.engine!r} (statsmodels | panel | global | auto)")
+
+    size = max(1, cfg.chunk_size)
+    chunks = [series[i:i + size] for i in range(0, len(series), size)]
+    n_jobs = _n_jobs(cfg.n_jobs)
+    workers = min(n_jobs, len(chunks))
+    if n_jobs > 1 and len(series) < n_jobs:
+        # pocas series (p.ej. un municipio desde la app): se reparten los folds, no las series
+        results = [_run_folds(series, key, cfg, n_jobs)]
+    elif workers > 1:
+        results = _run_pool(chunks, key, cfg, workers)
+    else:
+        results = [_forecast_chunk(c, key, cfg) for c in chunks]
+
+    res = [r for chunk in results for r in chunk]
+    forecasts = [f for _, f, _ in res if f is not None]
+    metrics_df = pd.DataFrame([m for m, _, _ in res])
     forecast_df = pd.concat(forecasts, ignore_index=True) if forecasts else pd.DataFrame(columns=["municipio_id","municipio","date","price_eur_m2","kind"])
-    return metrics_df, forecast_df
+    if _interval_method(cfg) == "analytic" and forecasts:
+        # una sola pasada vectorizada con los parámetros de todas las series ajustadas
+        p = [p for _, f, p in res if f is not None]
+        std = hw_forecast_std([x["smoothing_level"] for x in p], [x["smoothing_trend"] for x in p],
+                              [x["smoothing_seasonal"] for x in p], [x["sigma2"] for x in p], cfg.horizon_quarters)
+        pred = forecast_df["price_eur_m2"].to_numpy(dtype=np.float64).reshape(std.shape)
+        _add_intervals(forecast_df, normal_bounds(pred, std, cfg.interval_levels))
+    return metrics_df, forecast_df, [p for _, _, p in res]
+
+def fit_and_forecast(df: pd.DataFrame, cfg: ForecastConfig, cache=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Entrena ETS por municipio y devuelve (metrics_df, forecast_df).
+    df: columnas municipio_id, municipio, date (Period[Q]), price_eur_m2
+        y muni_key (int32) si viene de la tabla maestra; se agrupa por ella cuando existe.
+
+    Con cfg.n_jobs != 1 los municipios se reparten en un pool de procesos (tareas
+    de cfg.chunk_size series); el resultado es el mismo y en el mismo orden.
+    Los fallos no se descartan: metrics_df["error"] dice qué fold o ajuste falló
+    (o si la tarea superó cfg.task_timeout).
+
+    Con cfg.engine = "panel" se usa el Holt-Winters vectorizado (src/ts/panel_hw):
+    mismas columnas de salida, un único ajuste en bloque para todas las series.
+    Con cfg.engine = "global", un solo modelo para todo el panel (src/ts/global_model)
+    que aprovecha también los factores de la maestra (renta_pc, poblacion, euríbor...).
+    Con cfg.engine = "auto", cada municipio se queda con el mejor modelo de cfg.models
+    en el backtest (src/ts/models), dentro de cfg.time_budget; columna "model".
+
+    Con cache (src.ts.cache.ForecastCache) sólo se ajustan las series cuya huella
+    (fechas + valores + configuración) no está guardada; el resto sale de la caché.
+    Aciertos/fallos de esa llamada en metrics_df.attrs["cache"].
+
+    forecast_df lleva además los intervalos de predicción lo<nivel>/hi<nivel> para
+    cfg.interval_levels (src/ts/intervals), calculados en bloque para todas las series.
+    """
+    key = "muni_key" if "muni_key" in df.columns else "municipio_id"
+    if cfg.engine == "global":
+        if cache is not None:
+            raise ValueError("El motor global no usa la caché por serie: un cambio en un municipio afecta a todos")
+        from src.ts.global_model import fit_and_forecast_global
+        return fit_and_forecast_global(df, key, cfg.horizon_quarters, cfg.backtest_folds,
+                                       cfg.global_lags, cfg.global_ridge,
+                                       levels=cfg.interval_levels if _interval_method(cfg) != "none" else ())
+    series = _series(df, key)
+    if cache is None:
+        return _fit_series(series, key, cfg)[:2]
+    return cache.fit_and_forecast(series, key, cfg, _fit_series)
@@ -0,0 +1,225 @@
+"""
+Modelo global de previsión: una sola regresión ridge (NumPy) sobre el panel apilado
+de todos los municipios, con salida directa a varios horizontes.
+
+En vez de un ETS por municipio, se construye de una pasada el panel municipio ×
+trimestre y, para cada origen t, las variables:
+
+  - lags de precio relativos al nivel actual: log p[t-l] - log p[t] (l = 1..lags;
+    el lag 1 y el 4 son price_lag1/price_yoy de la maestra), con indicador de hueco
+  - nivel log p[t] y dummies del trimestre de t
+  - factores de la maestra que existan en df (FACTORS): renta_pc, poblacion,
+    euribor_12m, paro_mean... en log o en bruto, estandarizados; huecos -> media
+
+El objetivo es log p[t+h] - log p[t] para h = 1..H: una columna de coeficientes por
+horizonte (previsión directa, sin encadenar pasos). La predicción para todos los
+municipios es un único producto matricial desde su último trimestre observado, así
+que los municipios con historia corta también tienen previsión.
+
+Los intervalos de predicción son empíricos: cuantiles por horizonte de los residuos
+en log de los folds de backtest (src/ts/intervals), aplicados a la previsión final.
+
+Uso (desde forecast.py): ForecastConfig(engine="global") con df de la maestra.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from src.ts.intervals import empirical_log_quantiles, empirical_bounds
+
+# columna de la maestra -> transformación ("log": log1p, "raw": tal cual)
+FACTORS = {
+    "renta_pc": "log",
+    "poblacion": "log",
+    "euribor_12m": "raw",
+    "euribor_12m_last": "raw",
+    "paro_mean": "log",
+}
+
+
+@dataclass
+class GlobalModel:
+    coef: np.ndarray    # (p + 1, H), la primera fila es el término independiente
+    mean: np.ndarray    # (p,) estandarización de las variables
+    std: np.ndarray     # (p,)
+    names: list
+    horizon: int
+
+
+def panel_arrays(df: pd.DataFrame, key: str, factors=FACTORS):
+    """
+    df largo -> (claves, municipio_id, municipio, ordinal del primer trimestre,
+    P (n, T) precios, {factor: (n, T)}). T cubre del primer al último trimestre.
+    """
+    codes, keys = pd.factorize(df[key], sort=False)
+    ords = pd.PeriodIndex(df["date"], freq="Q").asi8
+    q0 = int(ords.min())
+    col = ords - q0
+    n, T = len(keys), int(col.max()) + 1
+
+    def _matriz(values):
+        M = np.full((n, T), np.nan)
+        M[codes, col] = pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        return M
+
+    first = pd.Series(np.arange(len(df))).groupby(codes).first().to_numpy()
+    P = _matriz(df["price_eur_m2"])
+    F = {c: _matriz(df[c]) for c in factors if c in df.columns}
+    return (keys.to_numpy(), df["municipio_id"].to_numpy()[first], df["municipio"].to_numpy()[first],
+            q0, P, F)
+
+
+def _shift(A: np.ndarray, l: int) -> np.ndarray:
+    """A[:, t - l] en la columna t (NaN al principio)."""
+    out = np.full_like(A, np.nan)
+    out[:, l:] = A[:, :-l]
+    return out
+
+
+def build_features(P: np.ndarray, F: dict, q0: int, lags: int = 8, factors=FACTORS):
+    """Variables para todos los orígenes a la vez -> (X (n, T, p) con NaN en huecos de factores, nombres)."""
+    n, T = P.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logP = np.log(np.where(P > 0, P, np.nan))
+    cols, names = [], []
+    for l in range(1, lags + 1):
+        d = _shift(logP, l) - logP
+        cols += [np.nan_to_num(d), np.isnan(d).astype(float)]
+        names += [f"dlog_lag{l}", f"falta_lag{l}"]
+    cols.append(logP)
+    names.append("log_precio")
+    trimestre = (q0 + np.arange(T)) % 4  # ordinal de Period[Q]: 0 = Q1
+    for q in (1, 2, 3):
+        cols.append(np.broadcast_to((trimestre == q).astype(float), (n, T)))
+        names.append(f"Q{q + 1}")
+    for c, M in F.items():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cols.append(np.log1p(np.where(M >= 0, M, np.nan)) if factors.get(c) == "log" else M)
+        names.append(c)
+    return np.stack(cols, axis=-1), names
+
+
+def targets(P: np.ndarray, horizon: int) -> np.ndarray:
+    """log p[t+h] - log p[t] -> (n, T, H)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logP = np.log(np.where(P > 0, P, np.nan))
+    n, T = logP.shape
+    Y = np.full((n, T, horizon), np.nan)
+    for h in range(1, horizon + 1):
+        Y[:, :T - h, h - 1] = logP[:, h:] - logP[:, :T - h]
+    return Y
+
+
+def fit_global(X: np.ndarray, Y: np.ndarray, names=(), cutoff: int | None = None,
+               ridge: float = 1.0) -> GlobalModel:
+    """
+    Ridge multi-horizonte. Con cutoff sólo se usan objetivos observados hasta esa
+    columna (para h, orígenes t <= cutoff - h): así se hace el backtest sin fuga.
+    """
+    n, T, p = X.shape
+    H = Y.shape[2]
+    cutoff = T - 1 if cutoff is None else cutoff
+    # filas de entrenamiento: orígenes con algún objetivo observado
+    origen = np.isfinite(Y).any(axis=2)
+    Xr = X[origen]                       # (N, p)
+    Yr = Y[origen]                       # (N, H)
+    t = np.broadcast_to(np.arange(T), (n, T))[origen]
+
+    antes = t < cutoff  # estandarización sólo con lo disponible en el corte
+    mean = np.nanmean(Xr[antes], axis=0)
+    std = np.nanstd(Xr[antes], axis=0)
+    std = np.where(std > 0, std, 1.0)
+    Z = np.nan_to_num((Xr - mean) / std)
+    Z = np.column_stack([np.ones(len(Z)), Z])
+    pen = ridge * np.eye(Z.shape[1])
+    pen[0, 0] = 0.0  # sin penalizar el término independiente
+
+    coef = np.zeros((Z.shape[1], H))
+    for h in range(H):
+        w = np.isfinite(Yr[:, h]) & (t <= cutoff - (h + 1))
+        if w.sum() <= Z.shape[1]:
+            continue
+        Zw = Z[w]
+        coef[:, h] = np.linalg.solve(Zw.T @ Zw + pen, Zw.T @ Yr[w, h])
+    return GlobalModel(coef=coef, mean=mean, std=std, names=list(names), horizon=H)
+
+
+def predict_global(model: GlobalModel, X: np.ndarray) -> np.ndarray:
+    """(m, p) variables en el origen -> (m, H) log p[t+h] - log p[t]."""
+    Z = np.nan_to_num((X - model.mean) / model.std)
+    return np.column_stack([np.ones(len(Z)), Z]) @ model.coef
+
+
+def _last_observed(P: np.ndarray, upto: int | None = None) -> np.ndarray:
+    """Última columna con precio de cada fila (hasta `upto` incluida); -1 si no hay ninguna."""
+    ok = np.isfinite(P) & (P > 0)
+    if upto is not None:
+        ok[:, upto + 1:] = False
+    T = P.shape[1]
+    last = T - 1 - np.argmax(ok[:, ::-1], axis=1)
+    return np.where(ok.any(axis=1), last, -1)
+
+
+def fit_and_forecast_global(df: pd.DataFrame, key: str, horizon: int, folds: int,
+                            lags: int = 8, ridge: float = 1.0, levels=(80, 95)):
+    """
+    Backtest (un ajuste por fold con corte en el calendario) + ajuste final sobre todo
+    el panel -> (metrics_df, forecast_df) con las columnas de fit_and_forecast
+    (e intervalos lo/hi para `levels` a partir de los residuos del backtest).
+    """
+    keys, mids, names, q0, P, F = panel_arrays(df, key)
+    X, feat = build_features(P, F, q0, lags)
+    Y = targets(P, horizon)
+    n, T = P.shape
+    filas = np.arange(n)
+
+    # Folds como en backtest_rolling (el fold 1 no tiene test), con el corte común
+    # en el calendario: origen = último trimestre del panel - i*h.
+    err_sum, ape_sum, cnt = np.zeros(n), np.zeros(n), np.zeros(n)
+    logres = []
+    for i in range(folds, 1, -1):
+        c = T - 1 - i * horizon
+        if c < 1:
+            continue
+        model = fit_global(X, Y, feat, cutoff=c, ridge=ridge)
+        obs = np.isfinite(P[:, c]) & (P[:, c] > 0)
+        pred = P[obs, c, None] * np.exp(predict_global(model, X[obs, c]))
+        real = P[obs, c + 1:c + 1 + horizon]
+        e = np.abs(real - pred[:, :real.shape[1]])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ape = e / np.where(real == 0, np.nan, real)
+            r = np.full(pred.shape, np.nan)
+            r[:, :real.shape[1]] = np.log(real) - np.log(pred[:, :real.shape[1]])
+        logres.append(r)
+        err_sum[obs] += np.nansum(e, axis=1)
+        ape_sum[obs] += np.nansum(ape, axis=1)
+        cnt[obs] += np.isfinite(e).sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        mae = err_sum / np.where(cnt > 0, cnt, np.nan)
+        mape = ape_sum / np.where(cnt > 0, cnt, np.nan) * 100
+
+    # Ajuste final y una sola predicción para todos desde su último trimestre observado
+    model = fit_global(X, Y, feat, ridge=ridge)
+    last = _last_observed(P)
+    ok = last >= 0
+    sel = filas[ok]
+    pred = P[sel, last[ok], None] * np.exp(predict_global(model, X[sel, last[ok]]))
+
+    ids = {"muni_key": keys} if key == "muni_key" else {}
+    metrics_df = pd.DataFrame({
+        **ids, "municipio_id": mids, "municipio": names, "MAE": mae, "MAPE": mape,
+        "error": [None if o else "final: sin precios observados" for o in ok],
+    })
+    forecast_df = pd.DataFrame({
+        **({"muni_key": np.repeat(keys[sel], horizon)} if ids else {}),
+        "municipio_id": np.repeat(mids[sel], horizon),
+        "municipio": np.repeat(names[sel], horizon),
+        "date": pd.PeriodIndex.from_ordinals((q0 + last[ok][:, None] + np.arange(1, horizon + 1)).ravel(), freq="Q"),
+        "price_eur_m2": pred.ravel(),
+        "kind": "forecast",
+    })
+    if levels:
+        q = empirical_log_quantiles(np.concatenate(logres) if logres else np.empty((0, horizon)), levels)
+        for c, v in empirical_bounds(pred, q).items():
+            forecast_df[c] = v.ravel()
+    return metrics_df, forecast_df
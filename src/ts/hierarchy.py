@@ -0,0 +1,264 @@
+"""
+Previsiones jerárquicas coherentes: municipio -> provincia -> CCAA -> España.
+
+La jerarquía sale del código INE de municipio_id (2 primeros dígitos = provincia,
+provincia -> comunidad autónoma con PROVINCIA_CCAA). Todos los niveles se expresan
+como combinaciones lineales de las hojas con una matriz de agregación dispersa S
+(scipy.sparse, n_nodos × n_hojas): el precio €/m² no es aditivo, así que cada fila
+de un agregado lleva los pesos normalizados de sus municipios (población de la
+maestra o pesos iguales) y el agregado es la media ponderada.
+
+Reconciliación de las previsiones base ŷ (una por nodo) -> ỹ = S b coherente:
+  - "bottom_up": ỹ = S ŷ_hojas
+  - "ols":       proyección ỹ = ŷ - W C' (C W C')⁻¹ C ŷ con W = I
+  - "mint":      igual con W = diag(varianza del error base), estimada como MAE²
+                 del backtest (MinT con covarianza diagonal)
+donde C = [I | -S_agregados] son las restricciones de coherencia. C W C' sólo tiene
+tantas filas como agregados (~70), así que todo es álgebra dispersa y una
+factorización pequeña, también con las ~8.000 hojas.
+
+Uso:
+  python -m src.ts.hierarchy [--engine panel] [--method mint]
+"""
+from __future__ import annotations
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+OUT_PATH = PROJECT_ROOT / "data" / "curated" / "forecast_jerarquico.parquet"
+
+LEVELS = ("espana", "ccaa", "provincia", "municipio")
+METHODS = ("bottom_up", "ols", "mint")
+
+# Códigos INE de comunidad autónoma -> (nombre, provincias)
+CCAA = {
+    "01": ("Andalucía", ("04", "11", "14", "18", "21", "23", "29", "41")),
+    "02": ("Aragón", ("22", "44", "50")),
+    "03": ("Asturias, Principado de", ("33",)),
+    "04": ("Balears, Illes", ("07",)),
+    "05": ("Canarias", ("35", "38")),
+    "06": ("Cantabria", ("39",)),
+    "07": ("Castilla y León", ("05", "09", "24", "34", "37", "40", "42", "47", "49")),
+    "08": ("Castilla - La Mancha", ("02", "13", "16", "19", "45")),
+    "09": ("Cataluña", ("08", "17", "25", "43")),
+    "10": ("Comunitat Valenciana", ("03", "12", "46")),
+    "11": ("Extremadura", ("06", "10")),
+    "12": ("Galicia", ("15", "27", "32", "36")),
+    "13": ("Madrid, Comunidad de", ("28",)),
+    "14": ("Murcia, Región de", ("30",)),
+    "15": ("Navarra, Comunidad Foral de", ("31",)),
+    "16": ("País Vasco", ("01", "20", "48")),
+    "17": ("Rioja, La", ("26",)),
+    "18": ("Ceuta", ("51",)),
+    "19": ("Melilla", ("52",)),
+}
+PROVINCIA_CCAA = {p: c for c, (_, provs) in CCAA.items() for p in provs}
+PROVINCIAS = {
+    "01": "Araba/Álava", "02": "Albacete", "03": "Alicante/Alacant", "04": "Almería", "05": "Ávila",
+    "06": "Badajoz", "07": "Balears, Illes", "08": "Barcelona", "09": "Burgos", "10": "Cáceres",
+    "11": "Cádiz", "12": "Castellón/Castelló", "13": "Ciudad Real", "14": "Córdoba", "15": "Coruña, A",
+    "16": "Cuenca", "17": "Girona", "18": "Granada", "19": "Guadalajara", "20": "Gipuzkoa",
+    "21": "Huelva", "22": "Huesca", "23": "Jaén", "24": "León", "25": "Lleida",
+    "26": "Rioja, La", "27": "Lugo", "28": "Madrid", "29": "Málaga", "30": "Murcia",
+    "31": "Navarra", "32": "Ourense", "33": "Asturias", "34": "Palencia", "35": "Palmas, Las",
+    "36": "Pontevedra", "37": "Salamanca", "38": "Santa Cruz de Tenerife", "39": "Cantabria", "40": "Segovia",
+    "41": "Sevilla", "42": "Soria", "43": "Tarragona", "44": "Teruel", "45": "Toledo",
+    "46": "Valencia/València", "47": "Valladolid", "48": "Bizkaia", "49": "Zamora", "50": "Zaragoza",
+    "51": "Ceuta", "52": "Melilla",
+}
+
+
+@dataclass
+class Hierarchy:
+    nodes: pd.DataFrame   # level, node_id, name; agregados primero y hojas al final (orden de S)
+    S: sp.csr_matrix      # (n_nodos, n_hojas) pesos de agregación; las hojas son la identidad
+    n_agg: int
+
+    @property
+    def S_agg(self) -> sp.csr_matrix:
+        return self.S[:self.n_agg]
+
+
+def build_hierarchy(leaves: pd.DataFrame, weights=None) -> Hierarchy:
+    """
+    leaves: una fila por municipio (municipio_id, municipio), en el orden de las hojas.
+    weights: pesos por hoja (p.ej. población) alineados con leaves; None = iguales.
+    """
+    mid = leaves["municipio_id"].astype(str).to_numpy()
+    prov = np.array([m.zfill(5)[:2] for m in mid], dtype=object)
+    if not all(p in PROVINCIA_CCAA for p in prov):
+        raise ValueError(f"Códigos de provincia desconocidos: {sorted(set(prov) - set(PROVINCIA_CCAA))}")
+    ccaa = np.array([PROVINCIA_CCAA[p] for p in prov], dtype=object)
+    n = len(mid)
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # un bloque por nivel: (códigos del grupo de cada hoja, ids y nombres de los nodos)
+    bloques = [("espana", np.zeros(n, dtype=np.int64), ["ES"], ["España"])]
+    for level, grupo, ids, nombre in (("ccaa", ccaa, "CCAA", lambda c: CCAA[c][0]),
+                                      ("provincia", prov, "PROV", lambda p: PROVINCIAS[p])):
+        codes, uniq = pd.factorize(grupo, sort=True)
+        bloques.append((level, codes, [ids + u for u in uniq], [nombre(u) for u in uniq]))
+
+    vals, filas, nodos, base = [], [], [], 0
+    for level, codes, ids, names in bloques:
+        tot = np.bincount(codes, weights=w, minlength=len(ids))
+        vals.append(w / tot[codes])
+        filas.append(codes + base)
+        nodos.append(pd.DataFrame({"level": level, "node_id": ids, "name": names}))
+        base += len(ids)
+    S_agg = sp.csr_matrix((np.concatenate(vals), (np.concatenate(filas), np.tile(np.arange(n), len(bloques)))),
+                          shape=(base, n))
+    S = sp.vstack([S_agg, sp.identity(n, format="csr")]).tocsr()
+    nodos.append(pd.DataFrame({"level": "municipio", "node_id": mid, "name": leaves["municipio"].to_numpy()}))
+    return Hierarchy(nodes=pd.concat(nodos, ignore_index=True), S=S, n_agg=base)
+
+
+def aggregate_history(h: Hierarchy, P: np.ndarray) -> np.ndarray:
+    """Series de los agregados (n_agg, T) desde P (n_hojas, T) con NaN: media ponderada de lo observado."""
+    obs = np.isfinite(P)
+    num = h.S_agg @ np.where(obs, P, 0.0)
+    den = h.S_agg @ obs.astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def reconcile(h: Hierarchy, base: np.ndarray, method: str = "mint", var=None) -> np.ndarray:
+    """
+    Previsiones base (n_nodos, D) en el orden de h.nodes -> previsiones coherentes.
+    var: varianza del error base por nodo (sólo "mint"). Los agregados sin previsión
+    base (NaN) toman la agregación de las hojas antes de reconciliar.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Método de reconciliación desconocido: {method!r} ({' | '.join(METHODS)})")
+    base = np.asarray(base, dtype=np.float64)
+    hojas = base[h.n_agg:]
+    if method == "bottom_up":
+        return h.S @ hojas
+    agg = base[:h.n_agg]
+    base = np.vstack([np.where(np.isnan(agg), h.S_agg @ hojas, agg), hojas])
+
+    if method == "mint":
+        if var is None:
+            raise ValueError("method='mint' necesita var (varianza del error base por nodo)")
+        w = np.asarray(var, dtype=np.float64)
+        w = np.where(np.isfinite(w) & (w > 0), w, np.nanmedian(np.where(w > 0, w, np.nan)))
+        w = np.nan_to_num(w, nan=1.0)
+    else:
+        w = np.ones(base.shape[0])
+    C = sp.hstack([sp.identity(h.n_agg), -h.S_agg]).tocsr()   # C y = 0 <=> coherente
+    CW = C @ sp.diags(w)
+    lu = splu((CW @ C.T).tocsc())
+    return base - CW.T @ lu.solve(C @ base)
+
+
+def _full_leaves(fc: pd.DataFrame, horizon: int):
+    """Hojas cuya previsión cubre la rejilla común (el primer trimestre previsto más frecuente)."""
+    inicio = fc.groupby("municipio_id")["date"].agg(["min", "size"])
+    grid_start = inicio["min"].mode().iloc[0]
+    ok = (inicio["min"] == grid_start) & (inicio["size"] == horizon)
+    ok &= inicio.index.astype(str).str.zfill(5).str[:2].isin(list(PROVINCIA_CCAA))
+    return inicio.index[ok], pd.period_range(grid_start, periods=horizon, freq="Q")
+
+
+def _pivot(df: pd.DataFrame, ids, dates, col: str = "price_eur_m2") -> np.ndarray:
+    return df.pivot_table(index="municipio_id", columns="date", values=col, aggfunc="first") \
+             .reindex(index=ids, columns=dates).to_numpy(dtype=np.float64)
+
+
+def forecast_hierarchy(df: pd.DataFrame, cfg, method: str = "mint", weights=None):
+    """
+    Previsión base de municipios y agregados con fit_and_forecast(df, cfg) y
+    reconciliación -> (metrics_df, forecast_df) con level/node_id/name para todos los
+    nodos. forecast_df: price_eur_m2 reconciliado, price_base, e intervalos base
+    desplazados con el ajuste de la reconciliación.
+    weights: pd.Series municipio_id -> peso (p.ej. población); None = pesos iguales.
+    """
+    from src.ts.forecast import fit_and_forecast
+    H = cfg.horizon_quarters
+    m_leaf, fc_leaf = fit_and_forecast(df, cfg)
+    ids, grid = _full_leaves(fc_leaf, H)
+    fuera = fc_leaf["municipio_id"].nunique() - len(ids)
+    if fuera:
+        print(f"⚠️ {fuera:,} municipios fuera de la jerarquía (previsión incompleta o provincia desconocida)")
+
+    leaves = df.drop_duplicates("municipio_id").set_index("municipio_id").loc[ids, ["municipio"]].reset_index()
+    w = None
+    if weights is not None:
+        w = pd.Series(weights).reindex(ids).to_numpy(dtype=np.float64)
+        w = np.where(np.isfinite(w) & (w > 0), w, np.nanmedian(np.where(w > 0, w, np.nan)))
+        w = np.nan_to_num(w, nan=1.0)
+    h = build_hierarchy(leaves, w)
+
+    # series de los agregados con sólo los municipios de la jerarquía
+    dates = pd.period_range(df["date"].min(), df["date"].max(), freq="Q")
+    sub = df[df["municipio_id"].isin(ids)]
+    A = aggregate_history(h, _pivot(sub, ids, dates))
+    agg_nodes = h.nodes.iloc[:h.n_agg]
+    i, j = np.nonzero(np.isfinite(A))
+    agg_df = pd.DataFrame({"municipio_id": agg_nodes["node_id"].to_numpy()[i],
+                           "municipio": agg_nodes["name"].to_numpy()[i],
+                           "date": dates[j], "price_eur_m2": A[i, j]})
+    m_agg, fc_agg = fit_and_forecast(agg_df, cfg)
+
+    node_ids = h.nodes["node_id"].to_numpy()
+    fc_all = pd.concat([fc_agg, fc_leaf[fc_leaf["municipio_id"].isin(ids)]], ignore_index=True)
+    base = _pivot(fc_all, node_ids, grid)
+    metrics = pd.concat([m_agg.drop(columns="muni_key", errors="ignore"),
+                         m_leaf.drop(columns="muni_key", errors="ignore")], ignore_index=True)
+    var = metrics.set_index("municipio_id")["MAE"].reindex(node_ids).to_numpy(dtype=np.float64) ** 2
+    rec = reconcile(h, base, method, var)
+
+    n, D = rec.shape
+    forecast_df = pd.DataFrame({
+        "level": np.repeat(h.nodes["level"].to_numpy(), D),
+        "node_id": np.repeat(node_ids, D),
+        "name": np.repeat(h.nodes["name"].to_numpy(), D),
+        "date": pd.PeriodIndex(np.tile(grid, n), freq="Q"),
+        "price_eur_m2": rec.ravel(),
+        "price_base": base.ravel(),
+        "kind": "forecast",
+    })
+    ajuste = rec - np.nan_to_num(base, nan=0.0)
+    for c in fc_all.columns:
+        if c[:2] in ("lo", "hi") and c[2:].isdigit():
+            forecast_df[c] = (_pivot(fc_all, node_ids, grid, c) + ajuste).ravel()
+    metrics_df = h.nodes.merge(metrics.rename(columns={"municipio_id": "node_id"})
+                               .drop(columns="municipio"), on="node_id", how="left")
+    return metrics_df, forecast_df
+
+
+def main(argv=None):
+    from src.etl.build.build_master_muni import load_master
+    from src.ts.forecast import ForecastConfig
+    ap = argparse.ArgumentParser(description="Previsiones reconciliadas municipio -> provincia -> CCAA -> España")
+    ap.add_argument("--engine", default="panel", help="Motor de las previsiones base (statsmodels | panel | global)")
+    ap.add_argument("--method", default="mint", choices=METHODS)
+    ap.add_argument("--horizon", type=int, default=8)
+    ap.add_argument("--pesos", default="poblacion", help="Columna de la maestra para ponderar ('' = pesos iguales)")
+    ap.add_argument("--out", default=str(OUT_PATH))
+    args = ap.parse_args(argv)
+
+    master = load_master()
+    weights = None
+    if args.pesos:
+        # último valor conocido de cada municipio
+        weights = master.dropna(subset=[args.pesos]).sort_values("date").groupby("municipio_id")[args.pesos].last()
+    cfg = ForecastConfig(horizon_quarters=args.horizon, engine=args.engine)
+    metrics_df, forecast_df = forecast_hierarchy(master, cfg, method=args.method, weights=weights)
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    forecast_df.assign(date=forecast_df["date"].astype(str)).to_parquet(out, index=False)
+    metrics_df.to_parquet(out.with_name(out.stem + "_metrics.parquet"), index=False)
+    print(f"✅ {out} ({forecast_df['node_id'].nunique():,} nodos, método {args.method})")
+    for level, g in metrics_df.groupby("level", sort=False):
+        print(f"   {level:10} {len(g):6,} nodos | MAE base {g['MAE'].mean():8.1f}")
+
+
+if __name__ == "__main__":
+    main()
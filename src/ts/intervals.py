@@ -0,0 +1,71 @@
+"""
+Intervalos de predicción para todas las series a la vez (sin bucle por serie).
+
+- Analíticos (Holt-Winters aditivo, ETS(A,A,A)): la varianza del error a h pasos es
+
+    var_h = sigma2 * (1 + sum_{j=1}^{h-1} c_j^2),   c_j = alpha * (1 + j * beta) + gamma * 1{j mod m = 0}
+
+  con beta relativo a alpha (b_t = b_{t-1} + alpha * beta * e_t, como smoothing_trend
+  de statsmodels y beta de panel_hw). Se calcula sobre matrices (n_series, h).
+- Empíricos: cuantiles por horizonte de los residuos de backtest en log
+  (log y_real - log y_previsto), agrupando todos los municipios; el intervalo es
+  multiplicativo: previsión * exp(cuantil).
+
+Columnas que se añaden a forecast_df: lo80, hi80, lo95, hi95 (según `levels`).
+"""
+from __future__ import annotations
+import numpy as np
+from scipy.stats import norm
+
+SEASON = 4
+
+
+def interval_columns(levels) -> list:
+    return [c for lv in levels for c in (f"lo{lv}", f"hi{lv}")]
+
+
+def hw_forecast_std(alpha, beta, gamma, sigma2, h: int, m: int = SEASON) -> np.ndarray:
+    """Desviación típica del error de previsión 1..h -> (n, h)."""
+    alpha, beta, gamma, sigma2 = (np.asarray(v, dtype=np.float64)[:, None] for v in (alpha, beta, gamma, sigma2))
+    j = np.arange(1, h)[None, :]
+    c = alpha * (1 + j * beta) + gamma * (j % m == 0)
+    suma = np.concatenate([np.zeros((c.shape[0], 1)), np.cumsum(c * c, axis=1)], axis=1)
+    return np.sqrt(sigma2 * (1 + suma))
+
+
+def normal_bounds(pred: np.ndarray, std: np.ndarray, levels) -> dict:
+    """{columna: array} con pred ± z * std para cada nivel."""
+    out = {}
+    for lv in levels:
+        z = norm.ppf(0.5 + lv / 200)
+        out[f"lo{lv}"] = pred - z * std
+        out[f"hi{lv}"] = pred + z * std
+    return out
+
+
+def empirical_log_quantiles(logres: np.ndarray, levels, min_obs: int = 20) -> dict:
+    """
+    Residuos de backtest en log (N, h) con NaN -> {nivel: (q_lo (h,), q_hi (h,))}.
+    Horizontes con menos de min_obs residuos quedan a NaN.
+    """
+    logres = np.asarray(logres, dtype=np.float64)
+    logres = np.where(np.isfinite(logres), logres, np.nan)
+    n_ok = np.isfinite(logres).sum(axis=0)
+    out = {}
+    for lv in levels:
+        a = (100 - lv) / 200
+        q = np.full((2, logres.shape[-1]), np.nan)
+        ok = n_ok >= min_obs
+        if ok.any():
+            q[:, ok] = np.nanquantile(logres[:, ok], [a, 1 - a], axis=0)
+        out[lv] = (q[0], q[1])
+    return out
+
+
+def empirical_bounds(pred: np.ndarray, quantiles: dict) -> dict:
+    """pred (n, h) * exp(cuantiles por horizonte) -> {columna: array (n, h)}."""
+    out = {}
+    for lv, (lo, hi) in quantiles.items():
+        out[f"lo{lv}"] = pred * np.exp(lo)[None, :]
+        out[f"hi{lv}"] = pred * np.exp(hi)[None, :]
+    return out
@@ -0,0 +1,296 @@
+"""
+Catálogo de modelos de previsión y selección automática por municipio
+(ForecastConfig(engine="auto")).
+
+Cada modelo recibe la matriz de entrenamiento de todas las filas a la vez (folds de
+backtest + ajuste final, alineadas a la izquierda como en panel_hw) y devuelve las
+previsiones (filas, h), con NaN donde no hay datos suficientes:
+
+  naive    último valor observado
+  snaive   mismo trimestre del último año
+  drift    último valor + pendiente media entre la primera y la última observación
+  theta    método Theta (SES + media pendiente de la recta) sobre la serie desestacionalizada
+  damped   Holt con tendencia amortiguada sobre la serie desestacionalizada
+  hw       Holt-Winters aditivo vectorizado (src/ts/panel_hw)
+  ets      ExponentialSmoothing de statsmodels serie a serie (use_brute, el caro)
+
+Todos se evalúan con el mismo backtest y cada municipio se queda con el de menor
+MAE. Los modelos se ejecutan del más barato al más caro: con cfg.time_budget
+(segundos para toda la llamada) los que no caben se saltan y sus series se quedan
+con el mejor de los baratos; ets se reparte por series, empezando por las que peor
+previsión tienen con los modelos baratos, hasta agotar el presupuesto.
+
+metrics_df lleva la columna "model" (el elegido) y en attrs["scores"] el MAE de
+backtest de cada modelo por serie (NaN = no ejecutado o sin datos), que dice dónde
+compensa el coste de ets; attrs["timing"] da los segundos de cada modelo.
+
+Para añadir un modelo: register(Model("nombre", fn, min_obs)) con
+fn(Y (filas, T), end (filas,), h) -> (filas, h).
+"""
+from __future__ import annotations
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Callable
+import numpy as np
+import pandas as pd
+from src.ts.panel_hw import SEASON, initial_state, fit_panel, forecast_panel
+
+SES_ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+DAMPED_GRID = [(a, b, p) for a in (0.1, 0.3, 0.6, 0.9) for b in (0.05, 0.2) for p in (0.8, 0.9, 0.98)]
+
+
+@dataclass(frozen=True)
+class Model:
+    name: str
+    fn: Callable            # fn(Y, end, h) -> (filas, h)
+    min_obs: int = 1        # observaciones mínimas en la fila de entrenamiento
+    per_series: bool = False  # True: fn_series(y 1-D, h, start_params) en vez de fn en bloque
+
+
+MODELS: dict = {}
+
+
+def register(model: Model) -> Model:
+    """Añade (o sustituye) un modelo en el catálogo; el orden de registro es el de coste."""
+    MODELS[model.name] = model
+    return model
+
+
+# --- utilidades sobre (filas, T) --------------------------------------------------
+def _active(Y: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Y con NaN a partir de end de cada fila."""
+    return np.where(np.arange(Y.shape[1]) < end[:, None], Y, np.nan)
+
+
+def _ffill(Y: np.ndarray) -> np.ndarray:
+    """Rellena hacia delante los NaN de cada fila."""
+    idx = np.where(np.isnan(Y), 0, np.arange(Y.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(Y, idx, axis=1)
+
+
+def _last(Y: np.ndarray):
+    """(último valor observado, su posición) por fila; posición -1 si no hay ninguno."""
+    ok = ~np.isnan(Y)
+    pos = Y.shape[1] - 1 - np.argmax(ok[:, ::-1], axis=1)
+    pos = np.where(ok.any(axis=1), pos, -1)
+    return np.take_along_axis(Y, np.maximum(pos, 0)[:, None], axis=1)[:, 0], pos
+
+
+def _deseason(Y: np.ndarray, end: np.ndarray, m: int = SEASON):
+    """Recta + estacionales por mínimos cuadrados sobre toda la fila -> (Z desestacionalizada, l0, b0, s, ok)."""
+    Ya = _active(Y, end)
+    l0, b0, s, ok = initial_state(Ya, m, cycles=-(-Ya.shape[1] // m))
+    Z = Ya - s[:, np.arange(Ya.shape[1]) % m]
+    return Z, l0, b0, s, ok & (end >= 2 * m)
+
+
+def _season_ahead(s: np.ndarray, end: np.ndarray, h: int) -> np.ndarray:
+    return np.take_along_axis(s, (end[:, None] - 1 + np.arange(1, h + 1)) % s.shape[1], axis=1)
+
+
+def _smooth(Z, end, l0, b0, alpha, beta, phi):
+    """
+    Holt amortiguado para todas las filas y candidatos (n, G) a la vez; SES con
+    beta = phi = 0. Los NaN no corrigen el estado. -> (sse, nivel, pendiente).
+    """
+    l = np.repeat(l0[:, None], alpha.shape[1], axis=1)
+    b = np.repeat(b0[:, None], alpha.shape[1], axis=1) * (phi > 0)
+    sse = np.zeros_like(alpha)
+    for t in range(int(end.max()) if len(end) else 0):
+        z = Z[:, t:t + 1]
+        obs = (t < end)[:, None] & ~np.isnan(z)
+        pred = l + phi * b
+        e = np.where(obs, z - pred, 0.0)
+        sse += e * e
+        act = (t < end)[:, None]
+        l = np.where(act, pred + alpha * e, l)
+        b = np.where(act, phi * b + alpha * beta * e, b)
+    return sse, l, b
+
+
+# --- modelos ------------------------------------------------------------------------
+def naive(Y, end, h):
+    last, _ = _last(_active(Y, end))
+    return np.repeat(last[:, None], h, axis=1)
+
+
+def snaive(Y, end, h, m: int = SEASON):
+    F = _ffill(_active(Y, end))
+    idx = end[:, None] - m + (np.arange(h) % m)
+    out = np.take_along_axis(F, np.clip(idx, 0, None), axis=1)
+    out[end < m] = np.nan
+    return out
+
+
+def drift(Y, end, h):
+    Ya = _active(Y, end)
+    last, pos = _last(Ya)
+    first_pos = np.argmax(~np.isnan(Ya), axis=1)
+    first = Ya[np.arange(len(Ya)), first_pos]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (last - first) / (pos - first_pos)
+    slope = np.where(pos > first_pos, slope, np.nan)
+    return last[:, None] + slope[:, None] * np.arange(1, h + 1)
+
+
+def theta(Y, end, h):
+    Z, l0, b0, s, ok = _deseason(Y, end)
+    alpha = np.broadcast_to(np.array(SES_ALPHAS), (len(Z), len(SES_ALPHAS)))
+    zero = np.zeros_like(alpha)
+    sse, l, _ = _smooth(Z, end, l0 + b0, zero[:, 0], alpha, zero, zero)
+    k = np.argmin(sse, axis=1)
+    a = alpha[np.arange(len(k)), k]
+    nivel = l[np.arange(len(k)), k]
+    n_obs = (~np.isnan(Z)).sum(axis=1)
+    steps = np.arange(1, h + 1)[None, :]
+    # Hyndman & Billah (2003): SES + b/2 * (k - 1 + 1/alpha - (1 - alpha)^n / alpha)
+    tend = b0[:, None] / 2 * (steps - 1 + 1 / a[:, None] - (1 - a[:, None]) ** n_obs[:, None] / a[:, None])
+    out = nivel[:, None] + tend + _season_ahead(s, end, h)
+    out[~ok] = np.nan
+    return out
+
+
+def damped(Y, end, h):
+    Z, l0, b0, s, ok = _deseason(Y, end)
+    grid = np.array(DAMPED_GRID).T
+    alpha, beta, phi = (np.broadcast_to(g, (len(Z), grid.shape[1])) for g in grid)
+    sse, l, b = _smooth(Z, end, l0, b0, alpha, beta, phi)
+    k = np.argmin(sse, axis=1)
+    r = np.arange(len(k))
+    p = phi[r, k][:, None]
+    acum = np.cumsum(p ** np.arange(1, h + 1), axis=1)  # phi + ... + phi^k
+    out = l[r, k][:, None] + acum * b[r, k][:, None] + _season_ahead(s, end, h)
+    out[~ok] = np.nan
+    return out
+
+
+def hw(Y, end, h):
+    return forecast_panel(fit_panel(Y, end), h)
+
+
+def ets_series(y: np.ndarray, h: int, start_params=None):
+    """statsmodels para una fila -> (previsión (h,), parámetros para arrancar los demás folds)."""
+    from src.ts.forecast import _fit_ets, _start_params
+    fit = _fit_ets(y[~np.isnan(y)], start_params)
+    return np.asarray(fit.forecast(h), dtype=np.float64), _start_params(fit)
+
+
+register(Model("naive", naive))
+register(Model("snaive", snaive, min_obs=SEASON))
+register(Model("drift", drift, min_obs=2))
+register(Model("theta", theta, min_obs=2 * SEASON))
+register(Model("damped", damped, min_obs=2 * SEASON))
+register(Model("hw", hw, min_obs=2 * SEASON))
+register(Model("ets", ets_series, min_obs=2 * SEASON, per_series=True))
+
+
+def _run_per_series(model: Model, Yt, end_t, rows, order, h: int, deadline, warm_start: bool):
+    """
+    Modelo serie a serie (en el orden `order`) sobre todas sus filas hasta el plazo.
+    El primer fold de cada serie hace el ajuste completo y el resto arranca de él.
+    """
+    yhat = np.full((len(rows), h), np.nan)
+    filas = pd.Series(np.arange(len(rows))).groupby(rows).apply(list)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for i in order:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            start = None
+            for r in filas.get(i, []):
+                if end_t[r] < model.min_obs:
+                    continue
+                try:
+                    yhat[r], p = model.fn(Yt[r, :end_t[r]], h, start)
+                    start = p if warm_start else None
+                except Exception:
+                    pass
+    return yhat
+
+
+def auto_engine(series: list, key: str, cfg):
+    """Backtest de cfg.models en bloque y elección por serie -> (metrics_df, forecast_df, parámetros)."""
+    from src.ts.forecast import (_panel_folds, _backtest_errors, _series_mean, _forecast_frame,
+                                 _interval_method, _add_intervals)
+    from src.ts.intervals import empirical_log_quantiles, empirical_bounds
+    t0 = time.monotonic()
+    deadline = t0 + cfg.time_budget if cfg.time_budget else None
+    h = cfg.horizon_quarters
+    unknown = [m for m in cfg.models if m not in MODELS]
+    if unknown or not cfg.models:
+        raise ValueError(f"Modelos desconocidos: {unknown} (disponibles: {', '.join(MODELS)})")
+
+    Y, n, rows, ends, Yt, end_t, nbt = _panel_folds(series, cfg)
+    bt_rows = rows[:nbt]
+    N = len(series)
+    names = [m for m in MODELS if m in cfg.models]   # orden de coste del catálogo
+    scores = pd.DataFrame(np.nan, index=range(N), columns=names)
+    preds, timing = {}, {}
+    for j, name in enumerate(names):
+        model = MODELS[name]
+        if j and deadline is not None and time.monotonic() >= deadline:
+            continue  # sin tiempo: el más barato siempre se ejecuta
+        t = time.monotonic()
+        if model.per_series:
+            # primero donde los baratos fallan más (MAPE), luego las que no tienen backtest
+            mape = np.column_stack([_series_mean(preds[p][2], bt_rows, N) for p in preds] or [np.zeros(N)])
+            mejor = np.where(np.isnan(mape).all(axis=1), -1.0, np.nanmin(np.nan_to_num(mape, nan=np.inf), axis=1))
+            order = np.argsort(-mejor, kind="stable")
+            yhat = _run_per_series(model, Yt, end_t, rows, order, h, deadline, cfg.warm_start)
+        else:
+            with np.errstate(all="ignore"):
+                yhat = model.fn(Yt, end_t, h)
+            yhat[end_t < model.min_obs] = np.nan
+        _, err, ape = _backtest_errors(Y, bt_rows, ends[:nbt], yhat[:nbt])
+        preds[name] = (yhat, err, ape)
+        scores[name] = _series_mean(err, bt_rows, N)
+        timing[name] = time.monotonic() - t
+
+    # elección: menor MAE de backtest entre los modelos con previsión final
+    final = np.column_stack([np.isfinite(preds[m][0][nbt:]).all(axis=1) if m in preds else np.zeros(N, bool)
+                             for m in names])
+    S = np.where(final, scores.to_numpy(), np.inf)
+    # sin backtest (series cortas): el modelo más completo que tenga previsión
+    sin_bt = np.isnan(scores.to_numpy()).all(axis=1) | ~np.isfinite(S).any(axis=1)
+    k = np.argmin(np.where(np.isnan(S), np.inf, S), axis=1)
+    k = np.where(sin_bt, len(names) - 1 - np.argmax(final[:, ::-1], axis=1), k)
+    ok = final[np.arange(N), k]
+    chosen = np.array(names, dtype=object)[k]
+
+    sel = np.flatnonzero(ok)
+    yhat = np.full((len(rows), h), np.nan)
+    err, ape = (np.full((nbt, h), np.nan) for _ in range(2))
+    for j, name in enumerate(names):
+        if name not in preds:
+            continue
+        mask = ok & (k == j)
+        fila = mask[rows]
+        yhat[fila] = preds[name][0][fila]
+        err[fila[:nbt]] = preds[name][1][fila[:nbt]]
+        ape[fila[:nbt]] = preds[name][2][fila[:nbt]]
+
+    ids = {"muni_key": [s[0] for s in series]} if key == "muni_key" else {}
+    metrics_df = pd.DataFrame({
+        **ids,
+        "municipio_id": [s[1] for s in series],
+        "municipio": [s[2] for s in series],
+        "MAE": _series_mean(err, bt_rows, N),
+        "MAPE": _series_mean(ape, bt_rows, N) * 100,
+        "error": np.where(ok, None, "final: ningún modelo con previsión"),
+        "model": np.where(ok, chosen, None),
+    })
+    metrics_df.attrs["scores"] = scores.set_axis([s[1] for s in series])
+    metrics_df.attrs["timing"] = timing
+    forecast_df = _forecast_frame(series, sel, yhat[nbt:][sel], key)
+
+    method = _interval_method(cfg)
+    if method == "empirical":
+        # residuos del modelo elegido en cada serie, agrupados por horizonte
+        y_true = _backtest_errors(Y, bt_rows, ends[:nbt], yhat[:nbt])[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            q = empirical_log_quantiles(np.log(y_true) - np.log(yhat[:nbt]), cfg.interval_levels)
+        _add_intervals(forecast_df, empirical_bounds(yhat[nbt:][sel], q))
+    params = [{"model": str(c)} if o else None for c, o in zip(chosen, ok)]
+    return metrics_df, forecast_df, params
@@ -0,0 +1,175 @@
+"""
+Holt-Winters aditivo (tendencia + estacionalidad de 4 trimestres) para muchas
+series a la vez con NumPy.
+
+En vez de un ExponentialSmoothing de statsmodels por municipio, la recursión
+(forma de corrección del error, ETS(A,A,A)):
+
+  e_t = y_t - (l_{t-1} + b_{t-1} + s_{t-m})
+  l_t = l_{t-1} + b_{t-1} + alpha * e_t
+  b_t = b_{t-1} + alpha * beta * e_t
+  s_t = s_{t-m} + gamma * e_t
+
+se ejecuta sobre matrices series × candidatos: cada paso t es una operación
+vectorial para todas las series y todas las combinaciones de parámetros.
+
+- Series de distinta longitud: cada fila va alineada a su primera observación y
+  `end` marca hasta dónde se usa; los NaN intermedios no corrigen el estado
+  (e_t = 0) ni cuentan en el SSE.
+- Parámetros: rejilla común (alpha, beta, gamma) evaluada en bloque y después
+  `refine` rondas de búsqueda local por serie con paso decreciente.
+- Estado inicial: recta + estacionalidad por mínimos cuadrados sobre los primeros
+  ciclos (como en statsmodels, hacen falta al menos 2*m observaciones).
+
+Uso:
+  Y, end = left_align(lista_de_arrays)
+  fit = fit_panel(Y, end)
+  yhat = forecast_panel(fit, h=8)     # (n_series, h), NaN donde fit.ok es False
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+
+SEASON = 4
+ALPHAS = (0.05, 0.2, 0.4, 0.6, 0.8, 0.95)
+BETAS = (0.01, 0.1, 0.3, 0.6)   # beta relativo a alpha (beta* de Hyndman)
+GAMMAS = (0.01, 0.1, 0.3, 0.6)
+_EPS = 1e-4
+
+
+@dataclass
+class PanelHW:
+    alpha: np.ndarray   # (n,)
+    beta: np.ndarray    # (n,) beta* (la pendiente se corrige con alpha * beta)
+    gamma: np.ndarray   # (n,)
+    level: np.ndarray   # (n,) estado en la última observación usada
+    trend: np.ndarray   # (n,)
+    season: np.ndarray  # (n, m) estacionales por posición t % m
+    end: np.ndarray     # (n,) nº de columnas usadas por serie
+    sse: np.ndarray     # (n,)
+    ok: np.ndarray      # (n,) bool: serie ajustada (>= 2 ciclos con datos)
+
+
+def left_align(series, length: int | None = None):
+    """Lista de arrays 1-D -> (Y (n, T) con NaN de relleno a la derecha, end (n,) longitudes)."""
+    end = np.array([len(s) for s in series], dtype=np.int64)
+    T = int(length or (end.max() if len(end) else 0))
+    Y = np.full((len(series), T), np.nan)
+    for i, s in enumerate(series):
+        Y[i, :len(s)] = s
+    return Y, end
+
+
+def initial_state(Y: np.ndarray, m: int = SEASON, cycles: int = 5):
+    """
+    (nivel antes de t=0, pendiente, estacionales (n, m), ok): recta + dummies
+    estacionales por mínimos cuadrados sobre los primeros `cycles` ciclos, para
+    todas las series a la vez (ecuaciones normales con la máscara de NaN).
+    """
+    n, T = Y.shape
+    K = min(cycles * m, T)
+    t = np.arange(K)
+    X = np.column_stack([np.ones(K), t, (t[:, None] % m == np.arange(1, m)).astype(float)])  # (K, p)
+    W = ~np.isnan(Y[:, :K])
+    y = np.where(W, Y[:, :K], 0.0)
+    XtWX = np.einsum("kp,nk,kq->npq", X, W.astype(float), X) + 1e-9 * np.eye(X.shape[1])
+    XtWy = np.einsum("kp,nk->np", X, y)
+    coef = np.linalg.solve(XtWX, XtWy[..., None])[..., 0]
+    s0 = np.column_stack([np.zeros(n), coef[:, 2:]])
+    nivel = coef[:, 0] + s0.mean(axis=1)  # nivel en t=0 con estacionales centradas
+    s0 -= s0.mean(axis=1, keepdims=True)
+    b0 = coef[:, 1]
+    ok = W[:, :m].any(axis=1) & W[:, m:2 * m].any(axis=1)
+    return nivel - b0, b0, s0, ok  # l_{-1}: así l_{-1} + b_{-1} es el nivel en t = 0
+
+
+def _filter(Y, end, alpha, beta, gamma, l0, b0, s0, m: int = SEASON):
+    """
+    Recursión para todas las series (filas) y candidatos (última dimensión) a la vez.
+    alpha/beta/gamma: (n, G). Devuelve (sse, l, b, s) con el estado en end-1.
+    """
+    n, G = alpha.shape
+    l = np.repeat(l0[:, None], G, axis=1)
+    b = np.repeat(b0[:, None], G, axis=1)
+    s = np.repeat(s0[:, :, None], G, axis=2)
+    ab = alpha * beta
+    sse = np.zeros((n, G))
+    for t in range(int(end.max()) if n else 0):
+        y = Y[:, t:t + 1]
+        act = (t < end)[:, None]
+        obs = act & ~np.isnan(y)
+        j = t % m
+        e = np.where(obs, y - (l + b + s[:, j]), 0.0)
+        sse += e * e
+        # fuera de rango (t >= end) el estado se congela en end-1
+        l = np.where(act, l + b + alpha * e, l)
+        b = b + ab * e
+        s[:, j] += gamma * e
+    return sse, l, b, s
+
+
+def _sse(Y, end, alpha, beta, gamma, l0, b0, s0, m):
+    sse = _filter(Y, end, alpha, beta, gamma, l0, b0, s0, m)[0]
+    # gamma <= 1 - alpha (región admisible de ETS(A,A,A))
+    return np.where(gamma <= 1 - alpha + 1e-12, sse, np.inf)
+
+
+def fit_panel(Y: np.ndarray, end=None, m: int = SEASON, refine: int = 3,
+              block_rows: int = 4096) -> PanelHW:
+    """
+    Ajusta un Holt-Winters aditivo por fila de Y (n, T), alineada a la izquierda.
+    end: columnas usadas por serie (def. todas). Se procesa por bloques de filas
+    para acotar la memoria (filas × candidatos × m).
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    n = Y.shape[0]
+    end = np.full(n, Y.shape[1], dtype=np.int64) if end is None else np.asarray(end, dtype=np.int64)
+    a0, b0_, g0 = (np.array(v, dtype=np.float64) for v in np.meshgrid(ALPHAS, BETAS, GAMMAS, indexing="ij"))
+    grid = np.stack([a0.ravel(), b0_.ravel(), g0.ravel()])  # (3, G)
+    step0 = np.array([0.1, 0.05, 0.05])
+
+    out = {k: np.empty(n) for k in ("alpha", "beta", "gamma", "level", "trend", "sse")}
+    season = np.zeros((n, m))
+    ok = np.zeros(n, dtype=bool)
+    for lo in range(0, n, block_rows):
+        sl = slice(lo, min(lo + block_rows, n))
+        Yb, eb = Y[sl], end[sl]
+        l0, b0, s0, okb = initial_state(np.where(np.arange(Y.shape[1]) < eb[:, None], Yb, np.nan), m)
+        okb &= eb >= 2 * m
+        nb = len(eb)
+
+        # 1) rejilla común
+        A, B, C = (np.broadcast_to(grid[i], (nb, grid.shape[1])) for i in range(3))
+        sse = _sse(Yb, eb, A, B, C, l0, b0, s0, m)
+        k = np.argmin(sse, axis=1)
+        best = grid[:, k].T.copy()  # (nb, 3)
+        best_sse = sse[np.arange(nb), k]
+
+        # 2) búsqueda local por serie: best ± paso en cada parámetro (27 candidatos)
+        offs = np.stack(np.meshgrid(*[(-1, 0, 1)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+        step = step0.copy()
+        for _ in range(refine):
+            cand = np.clip(best[:, None, :] + offs[None] * step, _EPS, 1 - _EPS)  # (nb, 27, 3)
+            sse = _sse(Yb, eb, cand[..., 0], cand[..., 1], cand[..., 2], l0, b0, s0, m)
+            k = np.argmin(sse, axis=1)
+            mejor = sse[np.arange(nb), k] < best_sse
+            best[mejor] = cand[np.arange(nb), k][mejor]
+            best_sse = np.minimum(best_sse, sse[np.arange(nb), k])
+            step /= 2
+
+        _, l, b, s = _filter(Yb, eb, best[:, :1], best[:, 1:2], best[:, 2:3], l0, b0, s0, m)
+        out["alpha"][sl], out["beta"][sl], out["gamma"][sl] = best.T
+        out["level"][sl], out["trend"][sl], out["sse"][sl] = l[:, 0], b[:, 0], best_sse
+        season[sl] = s[:, :, 0]
+        ok[sl] = okb
+    return PanelHW(season=season, end=end, ok=ok, **out)
+
+
+def forecast_panel(fit: PanelHW, h: int) -> np.ndarray:
+    """Previsión 1..h pasos desde la última observación usada de cada serie (n, h)."""
+    m = fit.season.shape[1]
+    steps = np.arange(1, h + 1)
+    idx = (fit.end[:, None] - 1 + steps[None]) % m
+    yhat = fit.level[:, None] + steps[None] * fit.trend[:, None] + np.take_along_axis(fit.season, idx, axis=1)
+    yhat[~fit.ok] = np.nan
+    return yhat
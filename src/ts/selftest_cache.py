@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Comprobaciones de src/ts/cache.py sobre un panel sintético pequeño (sin red).
+
+Una ejecución servida desde la caché (entera o en parte) tiene que devolver lo mismo
+que una sin caché: columnas de métricas del motor ("model" con engine="auto"),
+attrs["scores"] y sólo los intervalos de cfg.interval_levels.
+
+Uso:
+  python -m src.ts.selftest_cache
+"""
+import sys
+import tempfile
+import traceback
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.ts.forecast import ForecastConfig, fit_and_forecast
+from src.ts.cache import ForecastCache
+
+CHECKS = []
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+def _panel(n: int = 12, T: int = 32, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    t = np.arange(T)
+    Y = 1500 + rng.uniform(-5, 15, (n, 1)) * t + 60 * np.sin(t * np.pi / 2) + rng.normal(0, 20, (n, T))
+    i, j = np.divmod(np.arange(n * T), T)
+    return pd.DataFrame({
+        "municipio_id": np.char.zfill((10000 + i).astype(str), 5),
+        "municipio": np.char.add("Municipio ", i.astype(str)),
+        "date": pd.period_range(end="2024Q4", periods=T, freq="Q")[j],
+        "price_eur_m2": Y[i, j],
+    })
+
+def _iguales(a: tuple, b: tuple):
+    (ma, fa), (mb, fb) = a, b
+    pd.testing.assert_frame_equal(ma, mb)
+    pd.testing.assert_frame_equal(fa, fb)
+    assert set(ma.attrs.get("scores", pd.DataFrame()).columns) == set(mb.attrs.get("scores", pd.DataFrame()).columns)
+    if "scores" in ma.attrs:
+        pd.testing.assert_frame_equal(ma.attrs["scores"], mb.attrs["scores"])
+
+@check
+def cache_auto_igual_que_sin_cache(tmp: Path):
+    df = _panel()
+    cfg = ForecastConfig(engine="auto", models=("naive", "snaive", "drift", "theta"), interval_levels=(80,))
+    ref = fit_and_forecast(df, cfg)
+    assert "model" in ref[0].columns
+
+    cache = ForecastCache(tmp)
+    _iguales(fit_and_forecast(df, cfg, cache=cache), ref)            # todo fallos
+    cache.save()
+    cache = ForecastCache(tmp)
+    m, fc = fit_and_forecast(df, cfg, cache=cache)                   # todo aciertos, desde disco
+    assert m.attrs["cache"]["hits"] == df["municipio_id"].nunique(), m.attrs["cache"]
+    _iguales((m, fc), ref)
+
+    # una serie cambia: sólo ésa se reajusta y el resultado sigue coincidiendo (sin intervalos:
+    # los empíricos salen de los residuos de las series ajustadas en la llamada)
+    cfg = ForecastConfig(engine="auto", models=cfg.models, interval_method="none")
+    fit_and_forecast(df, cfg, cache=cache)
+    df2 = df.copy()
+    df2.loc[df2["municipio_id"] == "10003", "price_eur_m2"] *= 1.1
+    m, fc = fit_and_forecast(df2, cfg, cache=cache)
+    assert m.attrs["cache"]["misses"] == 1, m.attrs["cache"]
+    _iguales((m, fc), fit_and_forecast(df2, cfg))
+
+@check
+def cache_solo_intervalos_de_la_config(tmp: Path):
+    df = _panel()
+    cache = ForecastCache(tmp)
+    fit_and_forecast(df, ForecastConfig(engine="panel", interval_levels=(80, 95)), cache=cache)
+    for cfg in (ForecastConfig(engine="panel", interval_levels=(90,)),
+                ForecastConfig(engine="panel", interval_method="none")):
+        ref = fit_and_forecast(df, cfg)
+        got = fit_and_forecast(df, cfg, cache=cache)
+        assert list(got[1].columns) == list(ref[1].columns), (list(got[1].columns), list(ref[1].columns))
+        _iguales(got, ref)
+
+def main(argv=None):
+    fallos = 0
+    for fn in CHECKS:
+        with tempfile.TemporaryDirectory() as d, warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                fn(Path(d))
+                print(f"✅ {fn.__name__}")
+            except Exception:
+                fallos += 1
+                print(f"❌ {fn.__name__}")
+                traceback.print_exc()
+    print(f"{'✅' if not fallos else '❌'} {len(CHECKS) - fallos}/{len(CHECKS)} comprobaciones")
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())